@@ -6,9 +6,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 application = get_wsgi_application()
 
+if settings.COLD_START_MODE:
+    # Compile templates during the function's init phase, not on the first request
+    from main.coldstart import warm_templates
+    warm_templates()
+
 # Vercel expects a callable named `app`
 app = application
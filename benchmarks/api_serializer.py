@@ -0,0 +1,121 @@
+"""
+Rows/second of the listings API's serializer: DRF's ``ListingSerializer`` over
+model instances versus ``ListingRowSerializer`` over ``.values()`` rows.
+
+    python benchmarks/api_serializer.py --rows 20000 --repeat 5
+    python benchmarks/api_serializer.py --fields id,title,price_inr,photo_main
+
+Each path is timed end to end as the API runs it: fetch the rows, build the
+dicts, encode the JSON. The DRF path fetches with ``select_related('realtor')``
+and encodes with ``json.dumps``, which is what ``main/api.py`` did before; the
+row path uses orjson. It also times the building step alone, without the
+query and the encoding. The best of ``--repeat`` runs is reported. The data
+lives in a throwaway SQLite database that is created, migrated and seeded for
+the run. ``--json`` writes the results for diffing between commits.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed(n, seed):
+    from django.utils import timezone
+    from main.models import Listing, Realtor
+
+    rng = random.Random(seed)
+    realtors = Realtor.objects.bulk_create(Realtor(name=f'Realtor {i}', phone='1', email=f'r{i}@example.com')
+                                           for i in range(20))
+    now = timezone.now()
+    Listing.objects.bulk_create([
+        Listing(title=f'Flat #{i}', address=f'{i} MG Road', city='Pune', state='Maharashtra',
+                description='Well lit, close to the metro, covered parking.',
+                price=rng.randrange(500_000, 60_000_000, 10_000), bedrooms=rng.randint(1, 5),
+                bathrooms=rng.choice([1, 1.5, 2, 2.5]), sqft=rng.randint(400, 5000),
+                listing_type=rng.choice(['sale', 'rent']), is_published=True, list_date=now,
+                photo_main=f'listings/2026/10/{i}.jpg' if i % 2 else '',
+                latitude=18.5 + rng.random(), longitude=73.8 + rng.random(),
+                realtor=rng.choice(realtors) if i % 3 else None)
+        for i in range(n)
+    ], batch_size=1000)
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fields', help='a ?fields= value for the row serializer (default: all)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='serializer-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.sqlite3'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import RequestFactory
+    from main.api import ListingRowSerializer, ListingSerializer, _json
+    from main.models import Listing
+
+    call_command('migrate', verbosity=0)
+    seed(args.rows, args.seed)
+    request = RequestFactory().get('/api/listings/')
+    qs = Listing.objects.order_by('-list_date', '-id')
+    fields = ListingRowSerializer.parse_fields(args.fields)
+    row_serializer = ListingRowSerializer(request, fields)
+
+    def drf_rows():
+        serializer = ListingSerializer(context={'request': request})
+        return [serializer.to_representation(listing) for listing in qs.select_related('realtor')]
+
+    def fast_rows():
+        return [row_serializer.to_representation(row) for row in qs.values(*row_serializer.columns)]
+
+    instances = list(qs.select_related('realtor'))
+    rows = list(qs.values(*row_serializer.columns))
+    drf_serializer = ListingSerializer(context={'request': request})
+    paths = {
+        'drf': {
+            'end_to_end': lambda: json.dumps(drf_rows(), ensure_ascii=False, separators=(',', ':')).encode(),
+            'build_only': lambda: [drf_serializer.to_representation(listing) for listing in instances],
+        },
+        'values': {
+            'end_to_end': lambda: _json(fast_rows()),
+            'build_only': lambda: [row_serializer.to_representation(row) for row in rows],
+        },
+    }
+    results = {}
+    print(f'{args.rows:,} listings, best of {args.repeat}, fields: {args.fields or "all"}\n')
+    print(f'{"path":<7} {"stage":<11} {"seconds":>8} {"rows/s":>11}')
+    for path, stages in paths.items():
+        for stage, fn in stages.items():
+            seconds = best(fn, args.repeat)
+            results.setdefault(path, {})[stage] = {'seconds': seconds, 'rows_per_s': args.rows / seconds}
+            print(f'{path:<7} {stage:<11} {seconds:8.3f} {args.rows / seconds:>11,.0f}')
+    speedup = results['drf']['end_to_end']['seconds'] / results['values']['end_to_end']['seconds']
+    print(f'\nend to end: {speedup:.1f}x the rows/s of the DRF serializer')
+    if args.json:
+        Path(args.json).write_text(json.dumps({'rows': args.rows, 'fields': args.fields,
+                                               'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Load test of the JSON API under WSGI and ASGI, at a fixed number of worker processes.
+
+    python benchmarks/asgi_load.py --workers 1 --concurrency 1 8 32 64 --latency-ms 50
+
+Each mode gets its own server:
+
+* ``wsgi`` runs gunicorn sync workers. A worker serves one request at a time.
+* ``asgi`` runs uvicorn workers. The async views (``main/api.py``) hand every
+  query to the ORM's thread and keep serving other requests meanwhile.
+
+Then N client threads request ``--path`` back to back for ``--duration``
+seconds, reading each streamed body to the end. The run reports throughput
+and latency percentiles.
+
+``--latency-ms`` adds a sleep before every SQL statement, which stands in for
+a slow or remote database. That is where the two modes differ; on a local
+SQLite database both are CPU-bound. Needs ``pip install gunicorn uvicorn``
+and a migrated, populated database. The current environment (DATABASE_URL /
+DEBUG, ...) is passed through to the servers. ``--json`` writes the results
+for diffing between commits.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# ── Server side ────────────────────────────────────────────────────────────────
+# The servers import ``benchmarks.asgi_load:wsgi_app`` / ``asgi_app``; Django is
+# only set up (with the latency hook) when one of them is looked up.
+
+def _install_latency(latency):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def __getattr__(name):
+    if name not in ('wsgi_app', 'asgi_app'):
+        raise AttributeError(name)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    latency = float(os.environ.get('BENCH_DB_LATENCY_MS', 0)) / 1000
+    if latency:
+        _install_latency(latency)
+    if name == 'wsgi_app':
+        from config.wsgi import application
+    else:
+        from config.asgi import application
+    globals()[name] = application   # servers may look the app up more than once
+    return application
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_command(mode, port, workers):
+    if mode == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'benchmarks.asgi_load:wsgi_app', '--workers', str(workers),
+                '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'benchmarks.asgi_load:asgi_app', '--workers', str(workers),
+            '--port', str(port), '--log-level', 'warning', '--no-access-log']
+
+
+def _wait_until_up(url, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f'server exited with {proc.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                resp.read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    sys.exit(f'server did not answer {url} within {timeout}s')
+
+
+# ── Client side ────────────────────────────────────────────────────────────────
+
+def _load(url, concurrency, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=60) as resp:
+                    resp.read()
+            except (urllib.error.URLError, ConnectionError) as exc:
+                with lock:
+                    errors.append(str(exc))
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+    return {'concurrency': concurrency, 'requests': len(latencies), 'errors': len(errors),
+            'rps': len(latencies) / elapsed, 'p50_ms': pct(0.5), 'p95_ms': pct(0.95),
+            'mean_ms': statistics.fmean(latencies) if latencies else None}
+
+
+def run(args):
+    env = {**os.environ, 'BENCH_DB_LATENCY_MS': str(args.latency_ms)}
+    results = {}
+    for mode in args.modes:
+        port = _free_port()
+        url = f'http://127.0.0.1:{port}{args.path}'
+        proc = subprocess.Popen(_server_command(mode, port, args.workers), cwd=ROOT, env=env)
+        try:
+            _wait_until_up(url, proc)
+            results[mode] = [_load(url, c, args.duration) for c in args.concurrency]
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    print(f'GET {args.path}, {args.workers} worker(s), +{args.latency_ms:g} ms per query, '
+          f'{args.duration:g}s per step\n')
+    print(f'{"mode":<5} {"conc":>5} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"errors":>7}')
+    for mode, steps in results.items():
+        for step in steps:
+            print(f'{mode:<5} {step["concurrency"]:5d} {step["rps"]:8.1f} {step["p50_ms"] or 0:8.1f} '
+                  f'{step["p95_ms"] or 0:8.1f} {step["errors"]:7d}')
+    return {'path': args.path, 'workers': args.workers, 'latency_ms': args.latency_ms,
+            'duration': args.duration, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--path', default='/api/listings/')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    result = run(args)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
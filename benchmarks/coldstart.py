@@ -0,0 +1,117 @@
+"""
+Cold-start profiling and benchmarking for the serverless entry point (api/index.py).
+
+    python benchmarks/coldstart.py profile            # import-time breakdown per package/module
+    python benchmarks/coldstart.py bench --runs 10    # time-to-first-response in fresh processes
+
+Every measurement runs in a brand-new interpreter, exactly like a cold lambda:
+``profile`` uses ``python -X importtime`` and ``bench`` imports ``api.index``
+and pushes one request through the WSGI app. The current environment
+(DATABASE_URL / DEBUG / COLD_START_MODE, ...) is passed through; the bench
+route needs a migrated database. ``--json`` writes the results for diffing
+between commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FIRST_REQUEST = r'''
+import io, json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import api.index
+t1 = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+environ = {{'PATH_INFO': {path!r}, 'QUERY_STRING': {query!r}, 'wsgi.input': io.BytesIO()}}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(api.index.app(environ, lambda s, h, exc=None: status.append(s)))
+t2 = time.perf_counter()
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'first_response_ms': (t2 - t1) * 1000,
+                   'total_ms': (t2 - t0) * 1000, 'status': status[0], 'bytes': len(body)}}))
+'''
+
+
+def _group(module):
+    parts = module.split('.')
+    if parts[0] == 'django' and len(parts) > 2 and parts[1] == 'contrib':
+        return '.'.join(parts[:3])
+    if parts[0] in ('django', 'main', 'config') and len(parts) > 1:
+        return '.'.join(parts[:2])
+    return parts[0]
+
+
+def profile(args):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {args.module}'],
+                          cwd=ROOT, capture_output=True, text=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    if proc.returncode or not modules:
+        sys.exit(proc.stderr or f'import of {args.module} failed')
+    groups = Counter()
+    for name, self_us, _ in modules:
+        groups[_group(name)] += self_us
+    total = sum(groups.values())
+    print(f'Importing {args.module}: {total / 1000:.1f} ms across {len(modules)} modules\n')
+    print(f'{"self ms":>8}  {"share":>6}  package')
+    for group, us in groups.most_common(args.top):
+        print(f'{us / 1000:8.1f}  {us / total:6.1%}  {group}')
+    print(f'\n{"self ms":>8}  {"cum ms":>8}  slowest modules')
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[1])[:args.top]:
+        print(f'{self_us / 1000:8.1f}  {cumulative_us / 1000:8.1f}  {name}')
+    return {'module': args.module, 'total_ms': total / 1000,
+            'packages': {g: us / 1000 for g, us in groups.most_common()}}
+
+
+def bench(args):
+    path, _, query = args.path.partition('?')
+    code = FIRST_REQUEST.format(root=str(ROOT), path=path, query=query)
+    runs = []
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                              env=os.environ.copy())
+        if proc.returncode:
+            sys.exit(proc.stderr)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(f'{args.runs} cold starts of api/index.py, GET {args.path} -> {runs[0]["status"]}\n')
+    print(f'{"":<18} {"min":>8} {"median":>8} {"max":>8}')
+    summary = {}
+    for key in ('import_ms', 'first_response_ms', 'total_ms'):
+        values = [r[key] for r in runs]
+        summary[key] = {'min': min(values), 'median': statistics.median(values), 'max': max(values)}
+        print(f'{key:<18} {min(values):8.1f} {statistics.median(values):8.1f} {max(values):8.1f}')
+    return {'path': args.path, 'runs': args.runs, 'summary': summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('profile', help='import-time breakdown per package and module')
+    p.add_argument('--module', default='api.index')
+    p.add_argument('--top', type=int, default=20)
+    p.add_argument('--json', help='also write the results to this file')
+    p.set_defaults(func=profile)
+    b = sub.add_parser('bench', help='time-to-first-response over fresh interpreters')
+    b.add_argument('--runs', type=int, default=10)
+    b.add_argument('--path', default='/api/listings/')
+    b.add_argument('--json', help='also write the results to this file')
+    b.set_defaults(func=bench)
+    args = parser.parse_args()
+    result = args.func(args)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
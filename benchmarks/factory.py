@@ -0,0 +1,239 @@
+"""
+Synthetic Indian real-estate data for benchmarks: realtors, posters, listings
+and inquiries at realistic volumes, written with bulk inserts.
+
+    python benchmarks/factory.py --preset 100k --database-url sqlite:////tmp/bench.sqlite3
+    python benchmarks/factory.py --listings 250000 --database-url postgres://localhost/bench
+
+Listings are spread over every state the search facets offer
+(``main/facets.py``) and a few real cities in each, with coordinates near the
+city centre. Each listing gets a property type, a bedroom count that fits it,
+and a price drawn from the city tier: monthly rent for rentals, the total for
+sales. About 90% are published. ``list_date`` is spread over the last two
+years. One user in 20 posts listings, and inquiries come from anonymous
+visitors and signed-in users (at most one per user and listing, as the
+constraint requires).
+
+Bulk inserts skip the save() signals, so ``populate()`` rebuilds the search
+index, the market statistics and the similar listings itself, then runs
+``ANALYZE``. The output is deterministic for a given ``--seed``.
+``benchmarks/routes.py`` seeds its throwaway database through ``populate()``.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PRESETS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# state -> [(city, latitude, longitude, price tier)]; tier 1 is the most expensive
+CITIES = {
+    'Maharashtra': [('Mumbai', 19.076, 72.878, 1), ('Pune', 18.520, 73.857, 2), ('Nagpur', 21.146, 79.088, 3),
+                    ('Nashik', 19.998, 73.790, 3)],
+    'Karnataka': [('Bengaluru', 12.972, 77.595, 1), ('Mysuru', 12.296, 76.639, 3), ('Mangaluru', 12.914, 74.856, 3)],
+    'Delhi': [('New Delhi', 28.614, 77.209, 1), ('Dwarka', 28.592, 77.046, 2), ('Rohini', 28.736, 77.113, 2)],
+    'Tamil Nadu': [('Chennai', 13.083, 80.271, 1), ('Coimbatore', 11.017, 76.956, 2), ('Madurai', 9.925, 78.120, 3)],
+    'Gujarat': [('Ahmedabad', 23.023, 72.571, 2), ('Surat', 21.170, 72.831, 2), ('Vadodara', 22.307, 73.181, 3)],
+    'Telangana': [('Hyderabad', 17.385, 78.487, 1), ('Warangal', 17.969, 79.594, 3)],
+    'Kerala': [('Kochi', 9.931, 76.267, 2), ('Thiruvananthapuram', 8.524, 76.937, 2), ('Kozhikode', 11.259, 75.780, 3)],
+    'Rajasthan': [('Jaipur', 26.912, 75.787, 2), ('Udaipur', 24.585, 73.712, 3), ('Jodhpur', 26.239, 73.024, 3)],
+    'West Bengal': [('Kolkata', 22.573, 88.364, 1), ('Siliguri', 26.727, 88.395, 3), ('Durgapur', 23.520, 87.312, 3)],
+    'Uttar Pradesh': [('Noida', 28.535, 77.391, 2), ('Lucknow', 26.847, 80.946, 2), ('Kanpur', 26.449, 80.331, 3)],
+    'Punjab': [('Ludhiana', 30.901, 75.857, 3), ('Amritsar', 31.634, 74.872, 3), ('Mohali', 30.704, 76.717, 2)],
+    'Haryana': [('Gurugram', 28.459, 77.026, 1), ('Faridabad', 28.408, 77.317, 2), ('Panipat', 29.391, 76.963, 3)],
+}
+# Weight of each state in the listing mix (the metros dominate)
+STATE_WEIGHTS = {'Maharashtra': 18, 'Karnataka': 14, 'Delhi': 10, 'Tamil Nadu': 9, 'Telangana': 9, 'Gujarat': 7,
+                 'Haryana': 7, 'Uttar Pradesh': 7, 'West Bengal': 6, 'Kerala': 5, 'Rajasthan': 4, 'Punjab': 4}
+
+# property type -> (share, bedrooms range or None, sqft range)
+PROPERTY_TYPES = {
+    'apartment': (50, (1, 4), (450, 2200)),
+    'house': (18, (2, 5), (900, 3500)),
+    'villa': (7, (3, 6), (2200, 7000)),
+    'land': (12, None, (1000, 20000)),
+    'commercial': (13, None, (300, 6000)),
+}
+# Sale price per sqft in rupees by city tier; monthly rent is roughly 0.3% of it
+PRICE_PER_SQFT = {1: (9_000, 35_000), 2: (4_500, 12_000), 3: (2_500, 7_000)}
+RENT_YIELD = 0.003
+
+STREETS = ['MG Road', 'Station Road', 'Nehru Nagar', 'Gandhi Marg', 'Park Street', 'Lake View Road',
+           'Civil Lines', 'Ring Road', 'Temple Street', 'Market Road', 'Hill View Layout', 'Sector 21']
+FIRST_NAMES = ['Aarav', 'Ananya', 'Vivaan', 'Diya', 'Arjun', 'Ishaan', 'Kavya', 'Meera', 'Rohan', 'Saanvi',
+               'Vikram', 'Priya', 'Rahul', 'Neha', 'Karthik', 'Lakshmi', 'Farhan', 'Simran', 'Anil', 'Pooja']
+LAST_NAMES = ['Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Gupta', 'Singh', 'Das', 'Khan', 'Menon',
+              'Kulkarni', 'Bose', 'Chopra', 'Rao', 'Joshi', 'Banerjee', 'Pillai', 'Mehta', 'Verma', 'Gill']
+MESSAGES = ['Is this still available?', 'Can I schedule a visit this weekend?', 'Is the price negotiable?',
+            'Please share more photos.', 'Is parking included?', 'What is the maintenance charge?', '']
+DESCRIPTIONS = ['Well lit and airy, close to the metro.', 'Gated community with a pool and gym.',
+                'Quiet lane, walking distance to schools and markets.', 'Corner plot with clear title.',
+                'Newly renovated, modular kitchen, covered parking.', 'Great views, east facing, vastu compliant.']
+
+
+def counts(listings):
+    """Rows per model for a given number of listings."""
+    return {'realtors': max(20, listings // 500), 'users': max(10, listings // 20),
+            'listings': listings, 'contacts': listings // 2}
+
+
+@contextmanager
+def _explicit_list_dates():
+    # list_date is auto_now_add, which would overwrite the spread-out dates on insert
+    from main.models import Listing
+
+    field = Listing._meta.get_field('list_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def make_listing(rng, i, now, realtor_ids, poster_ids):
+    from main import geo
+    from main.models import Listing
+
+    state = rng.choices(list(STATE_WEIGHTS), weights=list(STATE_WEIGHTS.values()))[0]
+    city, lat, lng, tier = rng.choice(CITIES[state])
+    ptype = rng.choices(list(PROPERTY_TYPES), weights=[v[0] for v in PROPERTY_TYPES.values()])[0]
+    _, beds, area = PROPERTY_TYPES[ptype]
+    listing_type = 'sale' if ptype == 'land' or rng.random() < 0.6 else 'rent'
+    sqft = rng.randint(*area)
+    price = sqft * rng.randint(*PRICE_PER_SQFT[tier])
+    if listing_type == 'rent':
+        price = max(5_000, round(price * RENT_YIELD, -3))
+    else:
+        price = round(price, -4)
+    bedrooms = rng.randint(*beds) if beds else None
+    latitude, longitude = round(lat + rng.gauss(0, 0.06), 6), round(lng + rng.gauss(0, 0.06), 6)
+    return Listing(
+        title=f'{bedrooms} BHK {ptype.title()} in {city}' if bedrooms else f'{ptype.title()} in {city}',
+        address=f'{rng.randint(1, 400)}, {rng.choice(STREETS)}', city=city, state=state,
+        description=rng.choice(DESCRIPTIONS), price=price, listing_type=listing_type, property_type=ptype,
+        bedrooms=bedrooms, bathrooms=min(9.5, bedrooms + rng.choice([-1, 0, 0, 0.5])) if bedrooms else None,
+        sqft=sqft, latitude=latitude, longitude=longitude, geohash=geo.encode(latitude, longitude),
+        is_published=rng.random() < 0.9, list_date=now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60)),
+        realtor_id=rng.choice(realtor_ids) if rng.random() < 0.7 else None,
+        posted_by_id=rng.choice(poster_ids) if rng.random() < 0.5 else None,
+    )
+
+
+def populate(listings, seed=42, batch_size=5000, progress=None):
+    """Insert ``counts(listings)`` rows into the default database; returns the counts."""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from main import caching, facets, market_stats, search, similar
+    from main.models import Contact, Listing, Realtor
+
+    # Every filter option should have rows behind it
+    assert set(CITIES) == set(STATE_WEIGHTS) == set(facets.STATES)
+    assert set(PROPERTY_TYPES) == {value for value, _ in Listing.PROPERTY_TYPE_CHOICES}
+    rng = random.Random(seed)
+    sizes = counts(listings)
+    now = timezone.now()
+    report = progress or (lambda label, done, total: None)
+
+    with transaction.atomic():
+        realtor_ids = [r.pk for r in Realtor.objects.bulk_create(
+            Realtor(name=_name(rng), phone=f'+91 9{rng.randint(100000000, 999999999)}',
+                    email=f'realtor{i}@example.com', is_mvp=rng.random() < 0.1,
+                    description='Helping families find homes for over a decade.')
+            for i in range(sizes['realtors']))]
+        password = make_password(None)   # unusable, and no hashing per user
+        first = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        User.objects.bulk_create(
+            (User(username=f'bench-user-{first + i}', email=f'user{first + i}@example.com', password=password,
+                  first_name=rng.choice(FIRST_NAMES), date_joined=now) for i in range(sizes['users'])),
+            batch_size=batch_size)
+        user_ids = list(User.objects.filter(username__startswith='bench-user-').values_list('pk', flat=True))
+        poster_ids = user_ids[::20] or user_ids
+    report('realtors + users', sizes['realtors'] + sizes['users'], sizes['realtors'] + sizes['users'])
+
+    listing_ids = []
+    with _explicit_list_dates():
+        for start in range(0, listings, batch_size):
+            batch = [make_listing(rng, i, now, realtor_ids, poster_ids)
+                     for i in range(start, min(start + batch_size, listings))]
+            with transaction.atomic():
+                listing_ids.extend(obj.pk for obj in Listing.objects.bulk_create(batch))
+            report('listings', len(listing_ids), listings)
+
+    seen = set()
+    done = 0
+    while done < sizes['contacts']:
+        batch = []
+        for _ in range(min(batch_size, sizes['contacts'] - done)):
+            listing_id = rng.choice(listing_ids)
+            user_id = rng.choice(user_ids) if rng.random() < 0.4 else None
+            if user_id is not None and (listing_id, user_id) in seen:
+                user_id = None   # one inquiry per signed-in user and listing
+            seen.add((listing_id, user_id))
+            name = _name(rng)
+            batch.append(Contact(listing_id=listing_id, user_id=user_id, name=name,
+                                 email=f'{name.split()[0].lower()}{rng.randint(1, 999)}@example.com',
+                                 phone=f'9{rng.randint(100000000, 999999999)}', message=rng.choice(MESSAGES),
+                                 contact_date=now - timedelta(minutes=rng.randint(0, 180 * 24 * 60)),
+                                 notified_at=now))
+        with transaction.atomic():
+            Contact.objects.bulk_create(batch, ignore_conflicts=True)   # reruns on the same database
+        done += len(batch)
+        report('contacts', done, sizes['contacts'])
+
+    search.rebuild_index()
+    market_stats.rebuild()
+    similar.rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    caching.invalidate('home')
+    caching.invalidate('facets')
+    report('search index, market stats, similar listings, ANALYZE', 1, 1)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--preset', choices=PRESETS, default='10k')
+    size.add_argument('--listings', type=int)
+    parser.add_argument('--database-url', help='Default: the DATABASE_URL of the environment.')
+    parser.add_argument('--migrate', action='store_true', help='Run migrations first.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    if args.migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+    started = time.perf_counter()
+
+    def progress(label, done, total):
+        print(f'\r{label}: {done:,}/{total:,}  {time.perf_counter() - started:6.1f}s', end='\n' if done == total else '',
+              file=sys.stderr, flush=True)
+
+    sizes = populate(args.listings or PRESETS[args.preset], seed=args.seed, batch_size=args.batch_size,
+                     progress=progress)
+    print(', '.join(f'{n:,} {name}' for name, n in sizes.items()) + f' in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Throughput of ``manage.py import_listings`` on a synthetic partner feed.
+
+    python benchmarks/import_listings.py --rows 100000 --format csv
+    python benchmarks/import_listings.py --database-url postgres://localhost/bench --format json
+
+Writes a feed of ``--rows`` listings, then imports it twice. The first pass
+inserts every row; the second changes every price, so each row hits the
+ON CONFLICT update path. Each pass reports rows/second. By default it uses a
+throwaway SQLite database that is created and migrated for the run. Pass
+``--database-url`` for anything else; rows are keyed ``bench-<n>``, so reruns
+update them instead of adding more. ``--json`` writes the results for diffing
+between commits.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CITIES = [('Mumbai', 'Maharashtra', 19.07, 72.87), ('Pune', 'Maharashtra', 18.52, 73.85),
+          ('Bengaluru', 'Karnataka', 12.97, 77.59), ('Chennai', 'Tamil Nadu', 13.08, 80.27),
+          ('Hyderabad', 'Telangana', 17.38, 78.48), ('New Delhi', 'Delhi', 28.61, 77.20)]
+COLUMNS = ['external_id', 'title', 'address', 'city', 'state', 'price', 'listing_type', 'property_type',
+           'bedrooms', 'bathrooms', 'sqft', 'latitude', 'longitude', 'description']
+
+
+def feed_rows(n, seed, price_bump=0):
+    rng = random.Random(seed)
+    ptypes = ['apartment', 'house', 'villa', 'land', 'commercial']
+    for i in range(n):
+        city, state, lat, lng = rng.choice(CITIES)
+        ptype = rng.choice(ptypes)
+        yield {
+            'external_id': f'bench-{i}', 'title': f'{ptype.title()} in {city} #{i}',
+            'address': f'{i} MG Road', 'city': city, 'state': state,
+            'price': rng.randrange(500_000, 60_000_000, 10_000) + price_bump,
+            'listing_type': rng.choice(['sale', 'rent']), 'property_type': ptype,
+            'bedrooms': '' if ptype == 'land' else rng.randint(1, 5),
+            'bathrooms': '' if ptype == 'land' else rng.choice([1, 1.5, 2, 2.5, 3]),
+            'sqft': rng.randint(400, 5000),
+            'latitude': round(lat + rng.uniform(-0.2, 0.2), 6), 'longitude': round(lng + rng.uniform(-0.2, 0.2), 6),
+            'description': 'Well lit, close to the metro, covered parking.',
+        }
+
+
+def write_feed(path, fmt, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            writer = csv.DictWriter(fh, COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        elif fmt == 'ndjson':
+            for row in rows:
+                fh.write(json.dumps(row) + '\n')
+        else:
+            fh.write('[\n')
+            for i, row in enumerate(rows):
+                fh.write((',\n' if i else '') + json.dumps(row))
+            fh.write('\n]\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--format', choices=['csv', 'ndjson', 'json'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--database-url', help='Default: a throwaway SQLite database.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='import-bench-')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{workdir}/bench.sqlite3'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from main import imports
+
+    if not args.database_url:
+        call_command('migrate', verbosity=0)
+    results = {}
+    for label, bump in (('insert', 0), ('update', 1_000)):
+        feed = Path(workdir) / f'feed-{label}.{args.format}'
+        write_feed(feed, args.format, feed_rows(args.rows, args.seed, bump))
+        with open(feed, newline='', encoding='utf-8') as fh:
+            start = time.perf_counter()
+            report = imports.import_file(fh, args.format, batch_size=args.batch_size)
+            seconds = time.perf_counter() - start
+        results[label] = {'rows': report.rows, 'created': report.created, 'updated': report.updated,
+                          'errors': len(report.errors), 'seconds': seconds, 'rows_per_s': report.rows / seconds}
+        print(f'{label:<7} {report.rows:>9,} rows  {seconds:7.1f}s  {report.rows / seconds:>9,.0f} rows/s  '
+              f'({report.created:,} new, {report.updated:,} updated, {len(report.errors):,} errors)')
+    if args.json:
+        Path(args.json).write_text(json.dumps({'format': args.format, 'batch_size': args.batch_size,
+                                               'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""
+Throughput and p50/p99 latency of every GET route (HTML pages and the JSON API)
+over a realistic data set.
+
+    python benchmarks/routes.py --preset 10k --json before.json
+    python benchmarks/routes.py --preset 100k --server wsgi --workers 2 --concurrency 8
+    python benchmarks/routes.py --database-url postgres://localhost/bench --routes api-listings search
+    python benchmarks/routes.py --preset 10k --compare before.json
+
+By default the data lives in a throwaway SQLite database. It is migrated and
+filled by ``benchmarks/factory.py`` at ``--preset`` size. ``--database-url``
+uses an existing database instead; it is only filled if you pass
+``--preset``.
+
+Each route gets a mix of URLs, which are requested in turn:
+
+* ``listings``, ``search`` and ``api-listings`` get typical filter combinations:
+  type, state, property type, price bucket, bedrooms, keywords, a radius
+  around a city centre, a later page or cursor, and ``?fields=``;
+* detail routes get a random sample of published listings;
+* ``dashboard`` and ``post-listing`` are requested as the poster with the
+  most listings.
+
+POST-only routes (``contact``, ``logout``) are not benchmarked.
+
+Requests go through the Django test client in this process (``--server
+client``, the default) or over HTTP to gunicorn (``wsgi``) or uvicorn
+(``asgi``) workers started as in ``benchmarks/asgi_load.py``. In the HTTP
+modes, ``--concurrency`` clients share the requests.
+
+Each route first gets ``--warmup`` unmeasured requests, so the numbers are
+for warm caches. A route's throughput is its measured requests divided by
+their wall time. When the ``Server-Timing`` header is present
+(``main/instrumentation.py``), its query counts are reported as well.
+``--json`` writes the results, tagged with the current commit.
+``--compare`` prints the change against an earlier file.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# City centres for the radius searches (see benchmarks/factory.py)
+CENTRES = [('Mumbai', 19.076, 72.878), ('Bengaluru', 12.972, 77.595), ('New Delhi', 28.614, 77.209)]
+
+
+def route_mix(sample_ids, next_cursor):
+    """``{route name: [path, ...]}`` for every GET route."""
+    listing_filters = ['', 'type=rent', 'type=sale', 'state=Karnataka&property_type=apartment',
+                       'state=Maharashtra&type=rent&bedrooms=2', 'price=10000000&city=Pune',
+                       'property_type=villa&price=50000000', 'q=metro', 'q=pool&state=Kerala']
+    radius = [f'lat={lat}&lng={lng}&radius={km}' for (_, lat, lng), km in zip(CENTRES, [2, 5, 10])]
+    return {
+        'index': ['/'],
+        'about': ['/about/'],
+        'listings': ['/listings/', '/listings/?type=rent', '/listings/?type=sale&page=2', '/listings/?page=50'],
+        'listing': [f'/listings/{pk}/' for pk in sample_ids],
+        'search': ['/search/', '/search/?keywords=villa', '/search/?state=Karnataka&property_type=apartment',
+                   '/search/?state=Maharashtra&listing_type=rent&bedrooms=2', '/search/?price=10000000&city=Pune',
+                   '/search/?keywords=pool&state=Kerala&page=2']
+                  + [f'/search/?{query}' for query in radius],
+        'api-listings': [f'/api/listings/?{query}' for query in listing_filters + radius]
+                        + ['/api/listings/?fields=id,title,price_inr,city&page_size=100']
+                        + ([next_cursor] if next_cursor else []),
+        'api-listing-detail': [f'/api/listings/{pk}/' for pk in sample_ids],
+        'api-listings-export': ['/api/listings/export/?city=Kochi&property_type=villa',
+                                '/api/listings/export/?city=Udaipur&type=rent&format=csv'],
+        'api-market-stats': ['/api/stats/', '/api/stats/?dimension=city', '/api/stats/?dimension=state&type=rent'],
+        'login': ['/login/'],
+        'register': ['/register/'],
+        'post-listing': ['/post-listing/'],
+        'dashboard': ['/dashboard/'],
+    }
+
+
+SIGNED_IN = {'dashboard', 'post-listing'}
+
+
+def _queries(server_timing):
+    # 'db;dur=1.2;desc="4 queries", ...'
+    for part in server_timing.split(','):
+        if part.strip().startswith('db;') and 'desc="' in part:
+            return int(part.split('desc="')[1].split()[0])
+    return None
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarise(latencies, queries, errors, elapsed):
+    latencies = sorted(latencies)
+    queries = [q for q in queries if q is not None]
+    return {
+        'requests': len(latencies), 'errors': errors, 'rps': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': _percentile(latencies, 0.5) if latencies else None,
+        'p99_ms': _percentile(latencies, 0.99) if latencies else None,
+        'mean_ms': statistics.fmean(latencies) if latencies else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+# ── Clients ────────────────────────────────────────────────────────────────────
+
+class TestClientRunner:
+    """Requests through ``django.test.Client``: the full WSGI handler and middleware, no sockets."""
+
+    def __init__(self, poster):
+        from django.test import Client
+
+        self.anonymous = Client()
+        self.signed_in = Client()
+        self.signed_in.force_login(poster)
+
+    def get(self, route, path):
+        client = self.signed_in if route in SIGNED_IN else self.anonymous
+        resp = client.get(path)
+        resp.getvalue()   # streamed API pages are only produced as they are read
+        return resp.status_code, resp.headers.get('Server-Timing', '')
+
+    def run(self, route, paths, n):
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(n):
+            start = time.perf_counter()
+            status, timing = self.get(route, paths[i % len(paths)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(_queries(timing))
+            errors += status >= 400
+        return summarise(latencies, queries, errors, time.perf_counter() - started)
+
+
+class HTTPRunner:
+    """Requests over HTTP to a local server, from ``concurrency`` threads."""
+
+    def __init__(self, base_url, session_cookie, concurrency):
+        self.base_url = base_url
+        self.cookie = session_cookie
+        self.concurrency = concurrency
+
+    def get(self, route, path):
+        request = urllib.request.Request(self.base_url + path)
+        if route in SIGNED_IN:
+            request.add_header('Cookie', self.cookie)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as resp:
+                resp.read()
+                return resp.status, resp.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.headers.get('Server-Timing', '')
+
+    def run(self, route, paths, n):
+        latencies, queries, errors = [], [], []
+        lock = threading.Lock()
+        counter = iter(range(n))
+
+        def client():
+            for i in counter:   # shared, so the threads split the n requests
+                start = time.perf_counter()
+                try:
+                    status, timing = self.get(route, paths[i % len(paths)])
+                except (urllib.error.URLError, ConnectionError):
+                    status, timing = 599, ''
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    queries.append(_queries(timing))
+                    errors.append(status >= 400)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarise(latencies, queries, sum(errors), time.perf_counter() - started)
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────────
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _first_cursor():
+    # The second page of a listing, so cursor decoding is part of the mix
+    from django.test import Client
+
+    resp = Client().get('/api/listings/?type=sale')
+    link = json.loads(resp.getvalue()).get('next') if resp.status_code == 200 else None
+    if not link:
+        return None
+    parts = urllib.parse.urlsplit(link)
+    return f'{parts.path}?{parts.query}'
+
+
+def measure(runner, routes, args):
+    results = {}
+    print(f'{"route":<22} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"mean ms":>8} {"queries":>7} {"errors":>6}')
+    for route, paths in routes.items():
+        for i in range(args.warmup):
+            runner.get(route, paths[i % len(paths)])
+        result = results[route] = runner.run(route, paths, args.requests)
+        print(f'{route:<22} {result["rps"]:8.1f} {result["p50_ms"]:8.1f} {result["p99_ms"]:8.1f} '
+              f'{result["mean_ms"]:8.1f} {result["queries_max"] if result["queries_max"] is not None else "-":>7} '
+              f'{result["errors"]:6d}')
+    return results
+
+
+def compare(results, path):
+    before = json.loads(Path(path).read_text())
+    print(f'\nagainst {path} (commit {before.get("commit")}):')
+    print(f'{"route":<22} {"req/s":>9} {"p50":>9} {"p99":>9}')
+    for route, now in results.items():
+        then = before['routes'].get(route)
+        if not then:
+            continue
+
+        def change(key):
+            return f'{(now[key] / then[key] - 1) * 100:+8.1f}%' if then.get(key) else '        -'
+
+        print(f'{route:<22} {change("rps")} {change("p50_ms")} {change("p99_ms")}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', help='seed this many rows first: 10k, 100k or 1m (default 10k on a fresh database)')
+    parser.add_argument('--database-url', help='an existing database instead of a throwaway SQLite file')
+    parser.add_argument('--server', choices=['client', 'wsgi', 'asgi'], default='client')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads in the wsgi/asgi modes')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--routes', nargs='+', help='only these routes (URL names)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--compare', help='print the change against the results in this file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix='routes-bench-')
+        os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.sqlite3'
+        args.preset = args.preset or '10k'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.contrib.auth.models import User
+    from benchmarks import asgi_load, factory
+    from main.models import Listing
+
+    # Async streamed responses read by the sync test client
+    warnings.filterwarnings('ignore', message='StreamingHttpResponse must consume')
+    if args.preset:
+        if args.preset not in factory.PRESETS:
+            parser.error(f'--preset must be one of {", ".join(factory.PRESETS)}')
+        if not args.database_url:
+            call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        factory.populate(factory.PRESETS[args.preset], seed=args.seed)
+        print(f'seeded {args.preset} listings in {time.perf_counter() - started:.1f}s')
+
+    rng = random.Random(args.seed)
+    published = Listing.objects.filter(is_published=True)
+    last = published.order_by('-id').values_list('id', flat=True).first() or 0
+    sample_ids = sorted({rng.randint(1, last) for _ in range(50)})
+    sample_ids = list(published.filter(id__in=sample_ids).values_list('id', flat=True)) or [last]
+    poster = (User.objects.annotate(n=Count('listings')).order_by('-n', 'id').first()
+              or User.objects.create_user('bench-poster'))
+
+    routes = route_mix(sample_ids, _first_cursor())
+    if args.routes:
+        unknown = set(args.routes) - set(routes)
+        if unknown:
+            parser.error(f'unknown routes: {", ".join(sorted(unknown))}; choose from {", ".join(routes)}')
+        routes = {name: paths for name, paths in routes.items() if name in args.routes}
+
+    counts = {'listings': Listing.objects.count(), 'published': published.count()}
+    print(f'{counts["listings"]:,} listings, {args.requests} requests per route after {args.warmup} warmup, '
+          f'{args.server}' + (f' x{args.workers} worker(s), concurrency {args.concurrency}'
+                              if args.server != 'client' else '') + '\n')
+    if args.server == 'client':
+        results = measure(TestClientRunner(poster), routes, args)
+    else:
+        from django.conf import settings
+        from django.test import Client
+
+        signed_in = Client()
+        signed_in.force_login(poster)   # a database session the server can read
+        cookie = f'{settings.SESSION_COOKIE_NAME}={signed_in.cookies[settings.SESSION_COOKIE_NAME].value}'
+        port = asgi_load._free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        proc = subprocess.Popen(asgi_load._server_command(args.server, port, args.workers), cwd=ROOT,
+                                env={**os.environ, 'BENCH_DB_LATENCY_MS': '0'})
+        try:
+            asgi_load._wait_until_up(base_url + '/about/', proc)
+            results = measure(HTTPRunner(base_url, cookie, args.concurrency), routes, args)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            'commit': _commit(), 'preset': args.preset, 'rows': counts, 'server': args.server,
+            'workers': args.workers, 'concurrency': args.concurrency, 'requests': args.requests,
+            'warmup': args.warmup, 'routes': results,
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
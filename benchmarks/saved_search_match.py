@@ -0,0 +1,149 @@
+"""
+Cost of matching a newly published listing against every saved search: the
+predicate index (``main/saved_searches.py``) versus re-running each saved query.
+
+    python benchmarks/saved_search_match.py --searches 100000 --listings 200
+    python benchmarks/saved_search_match.py --preset 100k --searches 100000
+
+A throwaway SQLite database is filled by ``benchmarks/factory.py`` (``--preset``
+listings) plus ``--searches`` saved searches drawn from the same filter mix
+as ``benchmarks/routes.py``: a state most of the time, often a type and a
+price bucket, sometimes a city, bedrooms, keywords or a radius. Then
+``--listings`` listings are matched one at a time, as publishing does, and the
+per-listing latency is reported with the candidates the index returned. The
+baseline runs ``--baseline-sample`` saved queries restricted to one listing
+and extrapolates to all of them. ``--json`` writes the results for diffing
+between commits.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def random_params(rng, factory):
+    from main import facets
+    from main.models import Listing
+
+    params = {}
+    state = rng.choices(list(factory.STATE_WEIGHTS), weights=list(factory.STATE_WEIGHTS.values()))[0]
+    if rng.random() < 0.85:
+        params['state'] = state
+    if rng.random() < 0.7:
+        params['listing_type'] = rng.choice(['sale', 'rent'])
+    if rng.random() < 0.5:
+        params['property_type'] = rng.choice([value for value, _ in Listing.PROPERTY_TYPE_CHOICES])
+    if rng.random() < 0.5:
+        params['price'] = str(rng.choice(facets.PRICE_BUCKETS)[0])
+    if rng.random() < 0.3:
+        params['city'] = rng.choice(factory.CITIES[state])[0]
+    if rng.random() < 0.3:
+        params['bedrooms'] = str(rng.randint(1, 4))
+    if rng.random() < 0.15:
+        params['keywords'] = rng.choice(['metro', 'pool', 'corner plot', 'east facing', 'gated'])
+    if rng.random() < 0.1:
+        _, lat, lng, _ = rng.choice(factory.CITIES[state])
+        params.update(lat=str(lat), lng=str(lng), radius=str(rng.choice([2, 5, 10])))
+    return params
+
+
+def seed_searches(n, seed, factory):
+    from django.contrib.auth.models import User
+    from main.models import SavedSearch
+
+    rng = random.Random(seed)
+    users = list(User.objects.values_list('pk', flat=True))
+    searches, seen = [], set()
+    while len(searches) < n:
+        search = SavedSearch(user_id=rng.choice(users), params=random_params(rng, factory))
+        search.set_index_fields()
+        if (search.user_id, search.query) not in seen:
+            seen.add((search.user_id, search.query))
+            searches.append(search)
+    SavedSearch.objects.bulk_create(searches, batch_size=5000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', default='10k', help='listings to seed: 10k, 100k or 1m')
+    parser.add_argument('--searches', type=int, default=100_000)
+    parser.add_argument('--listings', type=int, default=200, help='listings to match, one at a time')
+    parser.add_argument('--baseline-sample', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='saved-search-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.sqlite3'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from benchmarks import factory
+    from main import facets, geo, saved_searches, search
+    from main.models import Listing, SavedSearch, SavedSearchMatch
+
+    call_command('migrate', verbosity=0)
+    factory.populate(factory.PRESETS[args.preset], seed=args.seed)
+    started = time.perf_counter()
+    seed_searches(args.searches, args.seed, factory)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f'{args.searches:,} saved searches in {time.perf_counter() - started:.1f}s')
+
+    rng = random.Random(args.seed)
+    pks = rng.sample(list(Listing.objects.filter(is_published=True).values_list('pk', flat=True)), args.listings)
+    latencies, candidates, matched = [], [], []
+    for pk in pks:
+        listing = Listing.objects.values('state', 'listing_type', 'property_type', 'price').get(pk=pk)
+        candidates.append(saved_searches.candidates(**listing).count())
+        start = time.perf_counter()
+        matched.append(saved_searches.match([pk]))
+        latencies.append((time.perf_counter() - start) * 1000)
+    SavedSearchMatch.objects.all().delete()
+    latencies.sort()
+
+    # Baseline: each saved query, as search() builds it, restricted to the new listing
+    sample = list(SavedSearch.objects.order_by('?')[:args.baseline_sample])
+    pk = pks[0]
+    start = time.perf_counter()
+    for saved in sample:
+        p = saved.params
+        qs = Listing.objects.filter(pk=pk, is_published=True)
+        if p.get('city'):
+            qs = qs.filter(city__icontains=p['city'])
+        if p.get('bedrooms'):
+            qs = qs.filter(bedrooms__gte=p['bedrooms'])
+        qs, _ = geo.filter_queryset(qs, p)
+        qs = facets.apply(qs, facets.selection(state=p.get('state'), property_type=p.get('property_type'),
+                                               listing_type=p.get('listing_type'), price=p.get('price')))
+        search.search_listings(qs, p.get('keywords'), ranked=False).exists()
+    per_query_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+    result = {
+        'listings': factory.PRESETS[args.preset], 'searches': args.searches, 'matched_listings': args.listings,
+        'index': {'p50_ms': latencies[len(latencies) // 2], 'p99_ms': latencies[int(0.99 * (len(latencies) - 1))],
+                  'mean_ms': statistics.fmean(latencies), 'candidates_mean': statistics.fmean(candidates),
+                  'matches_mean': statistics.fmean(matched)},
+        'rerun_each_query': {'per_query_ms': per_query_ms, 'per_listing_ms': per_query_ms * args.searches},
+    }
+    index = result['index']
+    print(f'\npredicate index   p50 {index["p50_ms"]:8.1f} ms   p99 {index["p99_ms"]:8.1f} ms   '
+          f'{index["candidates_mean"]:,.0f} candidates, {index["matches_mean"]:,.0f} matches per listing')
+    print(f'rerun each query  {result["rerun_each_query"]["per_listing_ms"]:,.0f} ms per listing '
+          f'({per_query_ms:.2f} ms x {args.searches:,})')
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
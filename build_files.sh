@@ -1,3 +1,11 @@
 #!/bin/bash
 python manage.py migrate --noinput
+# Market statistics summary table; the Listing signals keep it current after
+# this, but bulk loads bypass them
+python manage.py rebuild_market_stats
+# Hashed filenames, .gz/.br siblings and WebP/AVIF conversions of images
+# (main.storage.OptimizedStaticFilesStorage)
 python manage.py collectstatic --noinput
+# Compile every template so a syntax error fails the deploy (the serverless
+# function compiles them again during its init phase, see main/coldstart.py)
+python manage.py warm_templates
@@ -15,9 +15,15 @@ CSRF_TRUSTED_ORIGINS = [
     'http://localhost',
 ]
 
+# ── Serverless ────────────────────────────────────────────────────────────────
+# Cold-start mode (on by default on Vercel): the admin is autodiscovered on the
+# first /admin/ request and api/index.py compiles templates at import time.
+# See main/coldstart.py and benchmarks/coldstart.py.
+COLD_START_MODE = os.environ.get('COLD_START_MODE', str(bool(os.environ.get('VERCEL')))) == 'True'
+
 # ── Apps ──────────────────────────────────────────────────────────────────────
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig' if COLD_START_MODE else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -26,11 +32,18 @@ INSTALLED_APPS = [
     'rest_framework',
     'main',
 ]
+if COLD_START_MODE:
+    # The API only renders JSON, so DRF works without its app (templates and
+    # static files for the browsable API), whose template tags would otherwise
+    # import DRF on the first HTML render.
+    INSTALLED_APPS.remove('rest_framework')
 
 # ── Middleware ─────────────────────────────────────────────────────────────────
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.instrumentation.RequestInstrumentationMiddleware',
+    'main.replicas.ReplicaRoutingMiddleware',   # before the session, whose saves count as writes
     'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +56,8 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [{
-    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    # DjangoTemplates, timing renders for the instrumentation middleware
+    'BACKEND': 'main.instrumentation.InstrumentedDjangoTemplates',
     'DIRS': [BASE_DIR / 'templates'],
     'APP_DIRS': True,
     'OPTIONS': {'context_processors': [
@@ -78,10 +92,42 @@ else:
         "Go to Vercel → Project → Settings → Environment Variables and add DATABASE_URL."
     )
 
-# ── Caching (in-memory per worker) ────────────────────────────────────────────
+# Read replicas, comma-separated URLs: GET requests read from one of them
+# (main/replicas.py). After a write, that browser reads from the primary for
+# REPLICA_STICKY_SECONDS, which should cover the replication lag.
+REPLICA_DATABASES = []
+for _i, _url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {
+        **dj_database_url.parse(_url.strip(), conn_max_age=600, conn_health_checks=True),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{_i}')
+DATABASE_ROUTERS = ['main.replicas.ReplicaRouter'] if REPLICA_DATABASES else []
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# ── Caching ───────────────────────────────────────────────────────────────────
+# CACHE_URL picks a cache shared by every worker (generation-key invalidation
+# in main/caching.py only reaches all workers through a shared cache):
+#   redis://host:6379/0        — production (needs the `redis` package)
+#   memcached://host:11211     — production (needs the `pymemcache` package)
+#   sqlite:////var/tmp/c.db    — single host, shared file with LRU eviction
+#                                (sqlite:///rel/path is relative to the cwd)
+#   unset                      — in-memory per worker (LocMemCache)
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    _cache = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}
+elif CACHE_URL.startswith('memcached://'):
+    _cache = {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+              'LOCATION': CACHE_URL.removeprefix('memcached://')}
+elif CACHE_URL.startswith('sqlite://'):
+    _cache = {'BACKEND': 'main.cache_backends.SQLiteCache',
+              'LOCATION': CACHE_URL[len('sqlite:///'):] or BASE_DIR / 'cache.sqlite3',
+              'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 20000))}}
+else:
+    _cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        **_cache,
         'TIMEOUT': 300,  # 5 minutes
     }
 }
@@ -96,10 +142,47 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+# Hashed names + gzip/Brotli + WebP/AVIF conversions, built by collectstatic
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'main.storage.OptimizedStaticFilesStorage'},
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Threads that build WebP photo derivatives off the request path (0 = inline)
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 2))
+
+# ── Background refreshes ──────────────────────────────────────────────────────
+# Who recomputes what writes mark stale (main/background.py): 'thread'
+# (in-process background thread), 'inline' (at commit, on the request; tests)
+# or 'off' (a scheduler runs `manage.py refresh_stale`, or requests
+# /tasks/refresh-stale/). Serverless hosts freeze threads after the response,
+# so Vercel is 'off' and vercel.json's cron calls the endpoint; Vercel sends
+# CRON_SECRET as a bearer token, and the endpoint refuses requests without it.
+REFRESH_WORKER = os.environ.get('REFRESH_WORKER', 'off' if os.environ.get('VERCEL') else 'thread')
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+
+# ── Email ─────────────────────────────────────────────────────────────────────
+# Inquiry notifications to realtors (main/inquiries.py). Printed to the console
+# unless an SMTP server is configured.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'
+                               if os.environ.get('EMAIL_HOST') else 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'no-reply@localhost')
+# Who turns queued inquiries into contacts and emails: 'thread' (in-process
+# background thread), 'inline' (at commit) or 'off' (run `manage.py
+# process_inquiries --loop`, or from a scheduler). Serverless hosts freeze
+# threads after the response, so Vercel sends inline; with 'off' there, a
+# scheduler has to run process_inquiries.
+INQUIRY_WORKER = os.environ.get('INQUIRY_WORKER', 'inline' if os.environ.get('VERCEL') else 'thread')
+# Absolute links in emails (saved-search alerts)
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000').rstrip('/')
 
 # ── Auth ──────────────────────────────────────────────────────────────────────
 LOGIN_URL = '/login/'
@@ -115,3 +198,28 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [],
 }
+
+# ── Instrumentation ───────────────────────────────────────────────────────────
+# Per-request query/template/cache costs (main/instrumentation.py): a
+# Server-Timing header, per-route p50/p95 in the logs and /stats/requests/
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', 'True') == 'True'
+INSTRUMENTATION_WINDOW = 500       # recent requests kept per route
+INSTRUMENTATION_LOG_EVERY = 1000   # log a route's summary every N of its requests
+# Most SQL queries a request to each route may run, session and user lookups
+# included, and on SQLite a fresh worker's one-off FTS5 probe for keyword
+# searches. Exceeding one logs a warning; QueryBudgetTests fails on it.
+QUERY_BUDGETS = {
+    'index': 5,
+    'listings': 4,
+    'listing': 5,
+    'search': 5,
+    'dashboard': 5,
+    'saved-searches': 3,
+    'api-listings': 4,
+    'api-listing-detail': 2,
+    'api-market-stats': 1,
+}
+
+# ── Listings API ──────────────────────────────────────────────────────────────
+LISTINGS_API_PAGE_SIZE = int(os.environ.get('LISTINGS_API_PAGE_SIZE', 20))
+LISTINGS_API_MAX_PAGE_SIZE = int(os.environ.get('LISTINGS_API_MAX_PAGE_SIZE', 100))
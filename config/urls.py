@@ -2,8 +2,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from main.coldstart import LazyAdminResolver
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # In cold-start mode the admin is autodiscovered on first use instead of at setup
+    LazyAdminResolver('admin/') if settings.COLD_START_MODE else path('admin/', admin.site.urls),
     path('', include('main.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,42 @@
 from django.contrib import admin
-from .models import Realtor, Listing, Contact
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, market_stats, saved_searches, search, similar
+from .models import Realtor, Listing, Contact, SavedSearch
+from .pagination import EstimatedCountPaginator
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """
+    Sidebar filter over the distinct values of ``parameter_name``. The values
+    are cached for ``timeout`` seconds instead of running a ``SELECT DISTINCT``
+    over the whole table on every changelist load; a new value shows up once
+    the entry expires.
+    """
+    timeout = 15 * 60
+
+    def lookups(self, request, model_admin):
+        field = self.parameter_name
+        qs = model_admin.model._default_manager.order_by(field).values_list(field, flat=True).distinct()
+        values = caching.get_or_build('admin-filters', f'{model_admin.model._meta.label_lower}.{field}',
+                                      lambda: list(qs), timeout=self.timeout)
+        return [(value, value) for value in values]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class StateFilter(CachedChoicesFilter):
+    title = 'state'
+    parameter_name = 'state'
+
+
+class CityFilter(CachedChoicesFilter):
+    title = 'city'
+    parameter_name = 'city'
 
 
 @admin.register(Realtor)
@@ -13,13 +50,66 @@ class RealtorAdmin(admin.ModelAdmin):
 class ListingAdmin(admin.ModelAdmin):
     list_display = ('title', 'listing_type', 'city', 'state', 'price', 'bedrooms',
                     'is_published', 'posted_by', 'realtor', 'list_date')
-    list_filter = ('is_published', 'listing_type', 'state', 'city')
+    list_select_related = ('posted_by', 'realtor')
+    list_filter = ('is_published', 'listing_type', StateFilter, CityFilter)
     list_editable = ('is_published',)
-    search_fields = ('title', 'city', 'description')
-    readonly_fields = ('posted_by', 'list_date')
+    # Only turns the search box on: get_search_results() does the matching
+    search_fields = ('title',)
+    search_help_text = 'Words in the title, description, address or city, or an exact external ID.'
+    readonly_fields = ('posted_by', 'list_date', 'updated_at')
+    raw_id_fields = ('realtor',)
+    actions = ('publish', 'unpublish')
+    # No COUNT(*) of the whole table: estimated when unfiltered, and no
+    # "N total" next to filtered results
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index (main/search.py) instead of icontains scans
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return search.search_listings(queryset, term, ranked=False) | queryset.filter(external_id=term), False
+
+    @transaction.atomic
+    def _set_published(self, queryset, value):
+        # One UPDATE; it bypasses the signals, so do their work here. The rows
+        # are locked first, so the totals, the queued pks and the UPDATE all
+        # cover the same listings whatever is edited meanwhile.
+        pks = list(Listing.objects.select_for_update().filter(pk__in=queryset.values('pk'))
+                   .exclude(is_published=value).values_list('pk', flat=True))
+        changing = Listing.objects.filter(pk__in=pks)
+        totals = market_stats.totals(changing)
+        updated = changing.update(is_published=value, updated_at=timezone.now())
+        if updated:
+            market_stats.apply_totals(totals, 1 if value else -1)
+            similar.mark_dirty(pks)
+            if value:
+                saved_searches.listings_published(pks)
+            caching.invalidate_on_commit('home', 'facets')
+        return updated
+
+    @admin.action(description='Publish selected listings', permissions=['change'])
+    def publish(self, request, queryset):
+        updated = self._set_published(queryset, True)
+        self.message_user(request, f'Published {updated} listing(s).')
+
+    @admin.action(description='Unpublish selected listings', permissions=['change'])
+    def unpublish(self, request, queryset):
+        updated = self._set_published(queryset, False)
+        self.message_user(request, f'Unpublished {updated} listing(s).')
 
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
-    list_display = ('name', 'listing', 'email', 'phone', 'contact_date')
+    list_display = ('name', 'listing', 'email', 'phone', 'contact_date', 'notified_at')
+    list_select_related = ('listing',)
     search_fields = ('name', 'email')
+
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'user', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__username', 'user__email')
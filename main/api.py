@@ -0,0 +1,356 @@
+"""
+The JSON listing endpoints, as async views.
+
+Under ASGI (``config/asgi.py``) every query goes through Django's async ORM
+(``aaggregate``, ``aget``, ``aiterator``). A request that is waiting on the
+database therefore holds no worker, and one process serves many slow requests
+at once. List pages are streamed: rows are encoded and sent as they arrive,
+and the cursor links and facet counts follow them. Under WSGI (``api/index.py``)
+the same views run through ``async_to_sync`` and stream from a plain iterator,
+because Django would otherwise buffer an async iterator and warn.
+``benchmarks/asgi_load.py`` compares the two modes.
+
+Rows are read with ``.values()`` and encoded by ``ListingRowSerializer``
+(plain dicts, orjson), which matches ``ListingSerializer``'s output without
+building model instances or DRF fields per row; ``?fields=`` narrows both the
+output and the columns fetched. ``benchmarks/api_serializer.py`` compares the
+two serializers.
+
+Kept out of ``main/views.py`` so that serving HTML pages never imports Django
+REST framework (used here for ``ListingSerializer``): ``main/urls.py`` points
+at these views through ``coldstart.lazy_view``, and this module (and DRF with
+it) is imported on the first API request instead of on every cold start.
+"""
+import hashlib
+from decimal import Decimal
+from functools import wraps
+from operator import itemgetter
+
+import orjson
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
+from rest_framework import serializers
+
+from .models import Listing
+from .pagination import decode_cursor, encode_cursor
+from . import caching, facets
+from .views import filter_listings, listing_filters, make_listing_etag
+
+
+# ─── Serializers ────────────────────────────────────────────────────────────────
+
+# The reference for ListingRowSerializer, which the views use; tests hold the
+# two to the same output.
+class ListingSerializer(serializers.ModelSerializer):
+    price_inr = serializers.ReadOnlyField()
+    realtor_name = serializers.CharField(source='realtor.name', default='', read_only=True)
+    listing_type_display = serializers.CharField(source='get_listing_type_display', read_only=True)
+    # km from the search point, only on radius searches
+    distance = serializers.FloatField(default=None, read_only=True)
+
+    class Meta:
+        model = Listing
+        fields = ['id', 'title', 'address', 'city', 'state', 'price', 'price_inr',
+                  'bedrooms', 'bathrooms', 'sqft', 'photo_main', 'listing_type',
+                  'listing_type_display', 'is_published', 'list_date', 'realtor_name',
+                  'latitude', 'longitude', 'distance']
+
+
+def _json(data):
+    return orjson.dumps(data)
+
+
+def _json_response(data, status=200):
+    return HttpResponse(_json(data), status=status, content_type='application/json')
+
+
+class ListingRowSerializer:
+    """
+    ``ListingSerializer``'s output built from ``.values()`` rows.
+
+    ``columns`` are what the queryset has to select for ``fields`` (all of
+    them by default; ``parse_fields`` reads ``?fields=``). The per-field
+    getters are built once, so a row costs one dict comprehension.
+    """
+
+    FIELDS = ListingSerializer.Meta.fields
+    # Fields computed from another column; the rest read their own
+    SOURCES = {'price_inr': 'price', 'listing_type_display': 'listing_type', 'realtor_name': 'realtor__name'}
+
+    def __init__(self, request, fields=None, annotations=()):
+        wanted = set(fields or self.FIELDS)
+        self.getters = [(name, self._getter(request, name, annotations)) for name in self.FIELDS if name in wanted]
+        self.columns = list(dict.fromkeys(
+            self.SOURCES.get(name, name) for name in self.FIELDS
+            if name in wanted and (name != 'distance' or name in annotations)))
+
+    @classmethod
+    def parse_fields(cls, value):
+        """The names in a ``?fields=a,b`` value (``None`` for all); ``ValueError`` on unknown ones."""
+        names = [name.strip() for name in (value or '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in cls.FIELDS]
+        if unknown:
+            raise ValueError(', '.join(unknown))
+        return names or None
+
+    @staticmethod
+    def _getter(request, name, annotations):
+        if name == 'price_inr':
+            return lambda row: '₹{:,}'.format(row['price'])
+        if name == 'listing_type_display':
+            labels = {value: str(label) for value, label in Listing.LISTING_TYPE_CHOICES}
+            return lambda row: labels.get(row['listing_type'], row['listing_type'])
+        if name == 'realtor_name':
+            return lambda row: row['realtor__name'] or ''
+        if name == 'distance' and name not in annotations:
+            return lambda row: None
+        if name == 'photo_main':
+            storage = Listing._meta.get_field(name).storage
+            origin = request.build_absolute_uri('/')[:-1]
+
+            def photo_url(row):
+                if not row[name]:
+                    return None
+                url = storage.url(row[name])
+                # build_absolute_uri()'s own shortcut for a path, minus its per-call overhead
+                return origin + url if url.startswith('/') and not url.startswith('//') else url
+            return photo_url
+        if name == 'list_date':
+            tz = timezone.get_current_timezone()
+
+            def iso(row):
+                # DateTimeField's ISO 8601 output: in the current time zone, "Z" for UTC
+                value = row[name].astimezone(tz).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return iso
+        if name == 'bathrooms':
+            # DecimalField renders as a string with its decimal places
+            exp = Decimal(1).scaleb(-Listing._meta.get_field(name).decimal_places)
+            return lambda row: None if row[name] is None else f'{row[name].quantize(exp):f}'
+        return itemgetter(name)
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.getters}
+
+
+# ─── Pagination ─────────────────────────────────────────────────────────────────
+
+class ListingCursorPage:
+    """
+    One keyset-paginated page with next/previous cursors: newest first over
+    ``(list_date, id)``, or nearest first over ``(distance, id)`` when the
+    queryset carries a ``distance`` annotation (radius search).
+
+    ``queryset`` fetches ``page_size + 1`` rows (``.values()`` dicts); whoever
+    iterates it feeds each row to ``add()``, which returns its encoded chunk as
+    soon as it can be sent, then ``close()`` returns the rest of the response
+    body.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, request, queryset, fields=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        # (sort key, ascending) of the forward direction
+        self.key, ascending = ('distance', True) if 'distance' in queryset.query.annotations else ('list_date', False)
+        self.token = request.GET.get(self.cursor_query_param)
+        self.reverse = False
+        if self.token:
+            value, pk, self.reverse = decode_cursor(self.token)   # ValueError on a bad cursor
+            if isinstance(value, float) != (self.key == 'distance'):
+                raise ValueError(self.token)
+            op = 'gt' if ascending != self.reverse else 'lt'
+            queryset = queryset.filter(Q(**{f'{self.key}__{op}': value})
+                                       | Q(**{self.key: value, f'id__{op}': pk}))
+        sign = '' if ascending != self.reverse else '-'
+        self.serializer = ListingRowSerializer(request, fields, annotations=queryset.query.annotations)
+        columns = dict.fromkeys([*self.serializer.columns, 'id', self.key])   # the cursor needs the key
+        self.queryset = queryset.order_by(sign + self.key, sign + 'id').values(*columns)[:self.page_size + 1]
+        self.fetched = 0
+        self.rows = []   # kept rows: just the first and last going forward, all of them in reverse
+
+    def get_page_size(self, request):
+        default = settings.LISTINGS_API_PAGE_SIZE
+        try:
+            size = int(request.GET.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, settings.LISTINGS_API_MAX_PAGE_SIZE))
+
+    def _encode(self, row, first):
+        return (b'' if first else b',') + _json(self.serializer.to_representation(row))
+
+    def add(self, row):
+        """The chunk to send for ``row``, or ``None`` if it has to wait (or isn't on the page)."""
+        self.fetched += 1
+        if self.fetched > self.page_size:
+            return None   # the lookahead row: there is another page
+        if self.reverse:
+            self.rows.append(row)   # fetched backwards, sent once reversed
+            return None
+        first = not self.rows
+        self.rows[1:] = [row]
+        return self._encode(row, first)
+
+    def close(self, extra):
+        """The end of the body: buffered rows, the cursor links and ``extra``."""
+        has_more = self.fetched > self.page_size
+        chunk = b''
+        if self.reverse:
+            self.rows.reverse()
+            chunk = b''.join(self._encode(row, i == 0) for i, row in enumerate(self.rows))
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(self.token)
+        links = {
+            'next': self._link(self.rows[-1], reverse=False) if has_next and self.rows else None,
+            'previous': self._previous_link() if has_previous else None,
+        }
+        return chunk + b'],' + _json({**links, **extra})[1:]
+
+    def _url(self, cursor=None):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_query_param, None)
+        if cursor:
+            params[self.cursor_query_param] = cursor
+        query = params.urlencode()
+        return self.request.build_absolute_uri(f'{self.request.path}?{query}' if query else self.request.path)
+
+    def _link(self, row, reverse):
+        return self._url(encode_cursor(row[self.key], row['id'], reverse))
+
+    def _previous_link(self):
+        if not self.rows:
+            # Walked past the end: going back means starting over from the top
+            return self._url()
+        return self._link(self.rows[0], reverse=True)
+
+
+def _stream(page, facet_counts):
+    yield b'{"results":['
+    for row in page.queryset.iterator():
+        if chunk := page.add(row):
+            yield chunk
+    yield page.close({'facets': facet_counts()})
+
+
+async def _astream(page, facet_counts):
+    yield b'{"results":['
+    async for row in page.queryset.aiterator():
+        if chunk := page.add(row):
+            yield chunk
+    yield page.close({'facets': await sync_to_async(facet_counts)()})
+
+
+# ─── Conditional GET ─────────────────────────────────────────────────────────────
+
+def acondition(etag_func=None, last_modified_func=None):
+    """``django.views.decorators.http.condition`` for async views with async validators."""
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            last_modified = None
+            if last_modified_func and (dt := await last_modified_func(request, *args, **kwargs)):
+                last_modified = int(dt.timestamp())
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+
+    return decorator
+
+
+def _collection_etag(params, revalidating):
+    """
+    The filter set's ``MAX(updated_at)``/``COUNT`` and the facets generation:
+    the body also streams facet counts, taken over the set without the facet
+    filters. Only a revalidation runs the aggregate every time; other requests
+    reuse the ETag built last under the current generation.
+    """
+    generation = caching.generation('facets')
+    query = params.urlencode()
+    cache_key = f'listings-etag:{generation}:' + hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    if not revalidating and (etag := cache.get(cache_key)):
+        return etag
+    # Building the filters can query (search.backend() probes SQLite for FTS5)
+    agg = filter_listings(params).aggregate(last=Max('updated_at'), n=Count('id'))
+    key = f'{query}|{generation}|{agg["last"]}|{agg["n"]}'
+    etag = '"{}"'.format(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+    cache.set(cache_key, etag)
+    return etag
+
+
+async def _listings_collection_etag(request):
+    revalidating = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    return await sync_to_async(_collection_etag)(request.GET, revalidating)
+
+
+async def _listing_updated_at(request, pk):
+    if not hasattr(request, '_listing_updated_at'):
+        request._listing_updated_at = await (Listing.objects.filter(pk=pk, is_published=True)
+                                             .values_list('updated_at', flat=True).afirst())
+    return request._listing_updated_at
+
+
+async def _listing_etag(request, pk):
+    etag = make_listing_etag(pk, await _listing_updated_at(request, pk))
+    if etag and request.GET.get('fields'):
+        # each sparse fieldset is a representation of its own
+        fields = hashlib.md5(request.GET['fields'].encode(), usedforsecurity=False).hexdigest()[:12]
+        etag = f'{etag[:-1]}-{fields}"'
+    return etag
+
+
+# ─── REST API Views ──────────────────────────────────────────────────────────────
+
+@require_GET
+@acondition(etag_func=_listings_collection_etag)
+async def api_listings(request):
+    try:
+        fields = ListingRowSerializer.parse_fields(request.GET.get('fields'))
+    except ValueError as exc:
+        return _json_response({'detail': f'Unknown fields: {exc}'}, status=400)
+    qs, selected = await sync_to_async(listing_filters)(request.GET)
+    try:
+        page = ListingCursorPage(request, facets.apply(qs, selected), fields)
+    except ValueError:
+        return _json_response({'detail': 'Invalid cursor'}, status=404)
+
+    def facet_counts():
+        return facets.cached_counts('api', qs, selected, request.GET)
+
+    body = _astream(page, facet_counts) if isinstance(request, ASGIRequest) else _stream(page, facet_counts)
+    return StreamingHttpResponse(body, content_type='application/json')
+
+
+@require_GET
+@acondition(etag_func=_listing_etag, last_modified_func=_listing_updated_at)
+async def api_listing_detail(request, pk):
+    try:
+        serializer = ListingRowSerializer(request, ListingRowSerializer.parse_fields(request.GET.get('fields')))
+    except ValueError as exc:
+        return _json_response({'detail': f'Unknown fields: {exc}'}, status=400)
+    row = await Listing.objects.filter(pk=pk, is_published=True).values(*serializer.columns).afirst()
+    if row is None:
+        return _json_response({'detail': 'No Listing matches the given query.'}, status=404)
+    return _json_response(serializer.to_representation(row))
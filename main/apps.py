@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals  # noqa: F401
+        if settings.INSTRUMENTATION:
+            from . import instrumentation
+            instrumentation.install()
@@ -0,0 +1,84 @@
+"""
+Deferred refreshes of derived tables, off the request path.
+
+A write keeps what it can exact in its own transaction (e.g. a market-stat
+group's count and sum) and marks the rest stale in the database (the group's
+``dirty`` flag). Then it calls ``schedule(job)``. Once the transaction commits,
+``REFRESH_WORKER`` picks who runs ``job``:
+
+* ``thread`` — a daemon thread. It lingers ``LINGER`` seconds, so a burst of
+  writes is refreshed in one pass.
+* ``inline`` — at commit, on the writing thread (tests).
+* ``off`` — nothing runs in the web process. ``manage.py refresh_stale``
+  (``--loop`` to keep running), or the ``/tasks/refresh-stale/`` endpoint
+  that Vercel's cron calls, runs every job in ``JOBS``.
+
+Jobs find their work through the marks in the database. So marks left
+behind by a restart, or by another process, are picked up by whichever pass
+runs next.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Every deferred refresh, for ``manage.py refresh_stale``
+JOBS = ['main.market_stats.refresh_dirty', 'main.similar.refresh_dirty']
+LINGER = 0.5
+
+_pending = set()
+_pending_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+
+
+def schedule(job):
+    """Run ``job()`` once the current transaction commits, as ``REFRESH_WORKER`` says."""
+    transaction.on_commit(lambda: _submit(job))
+
+
+def _submit(job):
+    mode = settings.REFRESH_WORKER
+    if mode == 'inline':
+        job()
+    elif mode == 'thread':
+        with _pending_lock:
+            _pending.add(job)
+            _ensure_worker()
+        _wakeup.set()
+
+
+def run_all():
+    """Run every job in ``JOBS``; returns ``{job: result}``."""
+    return {path: import_string(path)() for path in JOBS}
+
+
+# ── Background worker ──────────────────────────────────────────────────────────
+
+def _run_worker():
+    while True:
+        _wakeup.wait()
+        time.sleep(LINGER)   # let a burst of writes share one pass
+        _wakeup.clear()
+        with _pending_lock:
+            jobs = list(_pending)
+            _pending.clear()
+        close_old_connections()
+        for job in jobs:
+            try:
+                job()
+            except Exception:
+                logger.exception('Background refresh %s failed', getattr(job, '__qualname__', job))
+        close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run_worker, name='refresh-worker', daemon=True)
+        _worker.start()
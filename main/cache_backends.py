@@ -0,0 +1,175 @@
+"""
+A Django cache backend stored in a local SQLite file.
+
+Every worker process on the host opens the same file, so unlike LocMemCache
+the cache is shared: a value built by one gunicorn worker is a hit in the
+others, and a generation bump from ``main.caching.invalidate()`` is seen by
+all of them immediately — that shared counter is the invalidation broadcast.
+Entries are evicted least-recently-used once ``MAX_ENTRIES`` is exceeded.
+
+    CACHES = {'default': {
+        'BACKEND': 'main.cache_backends.SQLiteCache',
+        'LOCATION': '/var/tmp/propvista-cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 4},
+    }}
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Reads refresh an entry's LRU timestamp at most this often, so hot keys don't
+# turn every hit into a write.
+TOUCH_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed);
+"""
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._local = threading.local()
+        self._writes = 0
+
+    # ── Connection handling ─────────────────────────────────────────────────────
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():   # reconnect after fork
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)   # absolute timestamp, or None for "never"
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    # ── Cache API ───────────────────────────────────────────────────────────────
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._conn()
+        row = conn.execute('SELECT value, expires, accessed FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            conn.execute('DELETE FROM cache_entry WHERE key = ? AND expires <= ?', (key, now))
+            return default
+        if now - accessed > TOUCH_INTERVAL:
+            conn.execute('UPDATE cache_entry SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        keymap = {self.make_and_validate_key(k, version=version): k for k in keys}
+        if not keymap:
+            return {}
+        now = time.time()
+        rows = self._conn().execute(
+            f'SELECT key, value FROM cache_entry WHERE key IN ({",".join("?" * len(keymap))}) '
+            f'AND (expires IS NULL OR expires > ?)', (*keymap, now)).fetchall()
+        hits = [key for key, _ in rows]
+        if hits:
+            self._conn().execute(
+                f'UPDATE cache_entry SET accessed = ? WHERE key IN ({",".join("?" * len(hits))}) '
+                f'AND accessed < ?', (now, *hits, now - TOUCH_INTERVAL))
+        return {keymap[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires, now = self._expiry(timeout), time.time()
+        rows = [(self.make_and_validate_key(k, version=version), self._dumps(v), expires, now)
+                for k, v in data.items()]
+        conn = self._conn()
+        with conn:   # one transaction for the whole batch
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR REPLACE INTO cache_entry VALUES (?, ?, ?, ?)', rows)
+        self._writes += len(rows)
+        if self._max_entries and self._writes >= max(1, self._max_entries // 100):
+            self._writes = 0
+            self._cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cur = self._conn().execute(
+            'INSERT INTO cache_entry VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache_entry.expires IS NOT NULL AND cache_entry.expires <= ?',
+            (key, self._dumps(value), self._expiry(timeout), now, now))
+        return cur.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute('UPDATE cache_entry SET expires = ? WHERE key = ?',
+                                   (self._expiry(timeout), key))
+        return cur.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        # BEGIN IMMEDIATE takes the file's write lock, so read-modify-write is
+        # atomic across every process sharing the cache.
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT value, expires FROM cache_entry WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError(f"Key '{key}' not found.")
+            value = pickle.loads(row[0]) + delta
+            conn.execute('UPDATE cache_entry SET value = ?, accessed = ? WHERE key = ?',
+                         (self._dumps(value), time.time(), key))
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._conn().execute('DELETE FROM cache_entry WHERE key = ?', (key,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._conn().execute(
+            'SELECT 1 FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests.
+        pass
+
+    # ── Eviction ────────────────────────────────────────────────────────────────
+
+    def _cull(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if count > self._max_entries:
+            # Drop the least recently used 1/CULL_FREQUENCY of the entries
+            excess = count - self._max_entries + self._max_entries // max(self._cull_frequency, 1)
+            conn.execute('DELETE FROM cache_entry WHERE key IN '
+                         '(SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)', (excess,))
@@ -0,0 +1,96 @@
+"""
+Generation-keyed query-result caching.
+
+Entries live under ``<namespace>:<generation>:<name>``. Invalidating a
+namespace just bumps its generation counter, so every old entry becomes
+unreachable at once (and ages out via the cache TIMEOUT) without having to
+know or delete individual keys. The signal handlers in ``main/signals.py``
+bump the generations when the underlying rows change, once the change commits.
+"""
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+from . import instrumentation, replicas
+
+_MISSING = object()
+_stats = Counter()
+
+
+def _generation_key(namespace):
+    return f'gen:{namespace}'
+
+
+def generation(namespace):
+    key = _generation_key(namespace)
+    gen = cache.get(key)
+    if gen is None:
+        # Seed from the clock so a lost counter can never resurrect old entries
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        gen = cache.get(key)
+    return gen
+
+
+def invalidate(namespace):
+    key = _generation_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def invalidate_on_commit(*namespaces):
+    """
+    ``invalidate()`` the namespaces when the current transaction commits (at
+    once outside one). Bumped any earlier, a concurrent request could cache the
+    pre-commit rows under the new generation for the whole TIMEOUT.
+    """
+    def bump():
+        for namespace in namespaces:
+            invalidate(namespace)
+    transaction.on_commit(bump)
+
+
+def get_or_build_many(namespace, builders, timeout=DEFAULT_TIMEOUT):
+    """
+    Return ``{name: value}`` for every ``name -> builder()`` in ``builders``,
+    serving what is cached for the current generation with one ``get_many``
+    and building + storing the rest with one ``set_many``. Builders read from
+    the primary (see main/replicas.py): a lagging replica's rows would be
+    cached under the new generation.
+    """
+    prefix = f'{namespace}:{generation(namespace)}:'
+    found = cache.get_many([prefix + name for name in builders])
+    result, missed = {}, {}
+    for name, builder in builders.items():
+        value = found.get(prefix + name, _MISSING)
+        if value is _MISSING:
+            with replicas.primary():
+                value = missed[prefix + name] = builder()
+            _stats[namespace, 'misses'] += 1
+        else:
+            _stats[namespace, 'hits'] += 1
+        result[name] = value
+    if missed:
+        cache.set_many(missed, timeout=timeout)
+    instrumentation.count_cache(len(result) - len(missed), len(missed))
+    return result
+
+
+def get_or_build(namespace, name, builder, timeout=DEFAULT_TIMEOUT):
+    return get_or_build_many(namespace, {name: builder}, timeout=timeout)[name]
+
+
+def stats():
+    """Hit/miss counters for this process, e.g. ``{'home': {'hits': 9, 'misses': 3}}``."""
+    out = {}
+    for (namespace, kind), n in _stats.items():
+        out.setdefault(namespace, {'hits': 0, 'misses': 0})[kind] = n
+    return out
+
+
+def reset_stats():
+    _stats.clear()
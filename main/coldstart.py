@@ -0,0 +1,104 @@
+"""
+Helpers that keep serverless cold starts short (``COLD_START_MODE``).
+
+Every cold start of ``api/index.py`` pays for ``django.setup()`` plus whatever
+the first request imports. Work that every request needs is done up front,
+during the function's init phase. Work that only some routes need is deferred
+until one of those routes is hit:
+
+* ``lazy_view()`` — the JSON endpoints (``main/api.py``) are imported on the
+  first API request, so HTML pages never load REST framework.
+* ``LazyAdminResolver`` — with ``SimpleAdminConfig`` the admin modules are not
+  autodiscovered at setup; the first ``/admin/`` request or ``admin:`` reverse
+  does it.
+* ``warm_templates()`` — compiles the project's templates into the cached
+  loader. ``build_files.sh`` runs it through ``manage.py warm_templates`` so a
+  broken template fails the deploy; ``api/index.py`` runs it at import time.
+
+Pillow is already imported only inside the functions that resize images.
+``benchmarks/coldstart.py`` profiles the imports and measures
+time-to-first-response.
+"""
+import time
+from functools import cached_property
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.urls.resolvers import RoutePattern, URLResolver
+
+
+def lazy_view(dotted_path, csrf_exempt=False, is_async=False):
+    """
+    A view that imports ``dotted_path`` on its first call and then delegates to
+    it. Django picks the sync or async handler path before the target is
+    loaded, so ``is_async`` must say which kind the target is.
+    """
+    module_name, _, attr = dotted_path.rpartition('.')
+    target = None
+
+    def load():
+        nonlocal target
+        if target is None:
+            target = getattr(import_module(module_name), attr)
+        return target
+
+    if is_async:
+        async def view(request, *args, **kwargs):
+            return await load()(request, *args, **kwargs)
+    else:
+        def view(request, *args, **kwargs):
+            return load()(request, *args, **kwargs)
+
+    view.__name__ = view.__qualname__ = attr
+    view.__module__ = module_name
+    # CsrfViewMiddleware checks this before the view (and its module) is loaded
+    view.csrf_exempt = csrf_exempt
+    return view
+
+
+class _AdminURLConf:
+    @cached_property
+    def urlpatterns(self):
+        from django.contrib import admin
+
+        admin.autodiscover()
+        return admin.site.get_urls()
+
+
+class LazyAdminResolver(URLResolver):
+    """The ``admin/`` include, with autodiscovery deferred until a URL under it is needed."""
+
+    def __init__(self, route='admin/'):
+        super().__init__(RoutePattern(route), _AdminURLConf(), app_name='admin', namespace='admin')
+
+    def _populate(self):
+        # Any reverse() populates every resolver in the tree, but the root only
+        # needs this one's namespace. resolve() and admin: reverses read
+        # url_patterns directly, which is what loads the admin.
+        if 'url_patterns' in self.__dict__:
+            super()._populate()
+
+
+def project_template_names():
+    """Names of the templates that live in this project (not in Django or third-party apps)."""
+    from django.template.autoreload import get_template_directories
+
+    names = set()
+    for directory in get_template_directories():
+        if not directory.is_relative_to(settings.BASE_DIR):
+            continue
+        names.update(str(path.relative_to(directory)) for path in Path(directory).rglob('*.html'))
+    return sorted(names)
+
+
+def warm_templates():
+    """Compile every project template into the cached loader; return ``{name: ms}``."""
+    from django.template.loader import get_template
+
+    timings = {}
+    for name in project_template_names():
+        start = time.perf_counter()
+        get_template(name)
+        timings[name] = (time.perf_counter() - start) * 1000
+    return timings
@@ -0,0 +1,77 @@
+"""
+Constant-memory bulk export of listings as NDJSON or CSV.
+
+Rows are read with ``values_list().iterator(chunk_size=...)`` (a server-side
+cursor on Postgres) and encoded one at a time, so neither model instances nor
+the full result set are ever held in memory. Shared by the
+``/api/listings/export/`` endpoint and the ``export_listings`` command.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('address', 'address'),
+    ('city', 'city'),
+    ('state', 'state'),
+    ('price', 'price'),
+    ('bedrooms', 'bedrooms'),
+    ('bathrooms', 'bathrooms'),
+    ('sqft', 'sqft'),
+    ('listing_type', 'listing_type'),
+    ('property_type', 'property_type'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('list_date', 'list_date'),
+    ('realtor_name', 'realtor__name'),
+    ('photo_main', 'photo_main'),
+]
+COLUMNS = [name for name, _ in EXPORT_FIELDS]
+
+
+def iter_rows(qs, media_base=None, chunk_size=CHUNK_SIZE):
+    """Yield one dict per listing, ordered by id."""
+    media_base = media_base if media_base is not None else settings.MEDIA_URL
+    photo_idx = COLUMNS.index('photo_main')
+    values = qs.order_by('id').values_list(*(lookup for _, lookup in EXPORT_FIELDS))
+    for row in values.iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[photo_idx] = media_base + row[photo_idx] if row[photo_idx] else ''
+        yield dict(zip(COLUMNS, row))
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            '' if value is None else value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row.values()
+        ])
+
+
+def stream(qs, fmt, media_base=None, chunk_size=CHUNK_SIZE):
+    rows = iter_rows(qs, media_base=media_base, chunk_size=chunk_size)
+    return iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows)
@@ -0,0 +1,113 @@
+"""
+Facet counts for the search filters: state, property type, listing type and
+max-price bucket.
+
+Every option's count comes from one conditional aggregate over the queryset
+the other (non-facet) filters produce:
+
+    SELECT COUNT(id) FILTER (WHERE UPPER(state) = UPPER('Kerala') AND listing_type = 'rent'), ...
+
+Each facet's own selection is left out of its counts, so the state list shows
+what picking another state would return while keeping the other active facets.
+That makes one query with one scan, instead of one COUNT per option. Results
+are cached under the ``facets`` namespace per normalised query string and are
+invalidated by the Listing signals.
+"""
+import hashlib
+
+from django.db.models import Count, Q
+
+from . import caching
+from .models import Listing
+
+STATES = ['Maharashtra', 'Karnataka', 'Delhi', 'Tamil Nadu', 'Gujarat',
+          'Telangana', 'Kerala', 'Rajasthan', 'West Bengal',
+          'Uttar Pradesh', 'Punjab', 'Haryana']
+PRICE_BUCKETS = [
+    (2000000, 'Rs 20L'),
+    (5000000, 'Rs 50L'),
+    (10000000, 'Rs 1Cr'),
+    (20000000, 'Rs 2Cr'),
+    (50000000, 'Rs 5Cr'),
+]
+
+# name -> (lookup, [(value, label), ...])
+FACETS = {
+    'state': ('state__iexact', [(s, s) for s in STATES]),
+    'property_type': ('property_type', Listing.PROPERTY_TYPE_CHOICES),
+    'listing_type': ('listing_type', Listing.LISTING_TYPE_CHOICES),
+    'price': ('price__lte', PRICE_BUCKETS),
+}
+
+# Parameters that only page through or format a result set
+NON_FILTER_PARAMS = {'page', 'cursor', 'page_size', 'format'}
+
+
+def selection(**values):
+    """Normalise raw request values into ``{facet: value}``, dropping empty or malformed ones."""
+    selected = {}
+    for name, value in values.items():
+        value = (value or '').strip()
+        if not value:
+            continue
+        if name == 'price':
+            try:
+                selected[name] = int(value)
+            except ValueError:
+                continue
+        elif name in ('property_type', 'listing_type'):
+            if value.lower() in dict(FACETS[name][1]):   # unknown choices are ignored
+                selected[name] = value.lower()
+        else:
+            selected[name] = value
+    return selected
+
+
+def _q(name, value):
+    return Q(**{FACETS[name][0]: value})
+
+
+def apply(qs, selected):
+    """Narrow ``qs`` by every selected facet."""
+    for name, value in selected.items():
+        qs = qs.filter(_q(name, value))
+    return qs
+
+
+def counts(qs, selected):
+    """
+    ``{facet: {'total': n, 'options': [{'value', 'label', 'count', 'selected'}, ...]}}``
+    for ``qs`` (which must not have the facet filters applied), in one query.
+    """
+    aggregates = {}
+    for name, (_, options) in FACETS.items():
+        others = [_q(other, value) for other, value in selected.items() if other != name]
+        others = Q(*others) if others else None
+        aggregates[f'{name}_total'] = Count('pk', filter=others)
+        for i, (value, _) in enumerate(options):
+            option = _q(name, value)
+            aggregates[f'{name}_{i}'] = Count('pk', filter=option & others if others else option)
+    row = qs.order_by().aggregate(**aggregates)
+    result = {}
+    for name, (_, options) in FACETS.items():
+        current = str(selected.get(name, '')).lower()
+        result[name] = {
+            'total': row[f'{name}_total'],
+            'options': [{'value': value, 'label': str(label), 'count': row[f'{name}_{i}'],
+                         'selected': str(value).lower() == current}
+                        for i, (value, label) in enumerate(options)],
+        }
+    return result
+
+
+def cache_key(scope, params):
+    """``scope`` (which view's parameters these are) plus an order-insensitive digest of them."""
+    items = sorted((k, v.strip()) for k, values in params.lists() for v in values
+                   if k not in NON_FILTER_PARAMS and v.strip())
+    raw = '&'.join(f'{k}={v}' for k, v in items)
+    return f'{scope}:' + hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def cached_counts(scope, qs, selected, params):
+    """``counts()``, cached per normalised query string until a listing changes."""
+    return caching.get_or_build('facets', cache_key(scope, params), lambda: counts(qs, selected))
@@ -0,0 +1,225 @@
+"""
+Radius and bounding-box search over listing coordinates, without PostGIS.
+
+Every listing with coordinates stores their geohash (``Listing.geohash``, 9
+characters, a cell of roughly 5 m). A geohash prefix names a rectangular
+grid cell, and every point inside that cell starts with it. A query box is
+therefore first covered by a handful of cells, and each cell becomes an
+index range scan such as ``geohash >= 'tdr1' AND geohash < 'tdr2'``. That
+works on a plain B-tree on both Postgres and SQLite; the index is partial,
+so only published listings are ever candidates. Only the candidates are then
+checked exactly:
+
+* a bounding box compares latitude and longitude against its edges;
+* a radius computes haversine distance in SQL and keeps rows within it.
+
+SQLite has no trigonometry, but Django registers Python implementations
+of SIN, COS, ASIN and friends on every SQLite connection.
+
+Query parameters (``filter_queryset``), shared by ``search()`` and the API:
+
+    ?lat=19.0760&lng=72.8777&radius=5       within 5 km, annotated ``distance`` (km)
+    ?bbox=72.80,18.90,72.95,19.10           west,south,east,north (GeoJSON order)
+"""
+import math
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+# More (smaller) cells prune tighter but add OR'd range scans to the query
+MAX_CELLS = 16
+MAX_RADIUS_KM = 500
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+# ── Geohash ────────────────────────────────────────────────────────────────────
+
+def encode(lat, lng, precision=PRECISION):
+    """Geohash of a point, e.g. ``encode(19.076, 72.8777) == 'te7ud2evv'``."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value, lng_lo = value * 2 + 1, mid
+            else:
+                value, lng_hi = value * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value, lat_lo = value * 2 + 1, mid
+            else:
+                value, lat_hi = value * 2, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of a geohash cell at ``precision``."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(south, west, north, east, max_cells=MAX_CELLS):
+    """
+    The finest same-length geohash cells covering the box (``west <= east``),
+    or ``None`` if it needs more than ``max_cells`` even at one character.
+    """
+    north, east = min(north, 90 - 1e-9), min(east, 180 - 1e-9)
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((south + 90) / height), math.floor((north + 90) / height) + 1)
+        cols = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+        if len(rows) * len(cols) <= max_cells:
+            return sorted({encode(-90 + (r + .5) * height, -180 + (c + .5) * width, precision)
+                           for r in rows for c in cols})
+    return None
+
+
+def _successor(prefix):
+    """The smallest geohash greater than every hash starting with ``prefix``."""
+    stripped = prefix.rstrip(BASE32[-1])
+    if not stripped:
+        return None
+    return stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+
+
+def cell_ranges(cells):
+    """Merge sorted cells into ``[(low, high), ...]`` ranges; ``high`` is exclusive."""
+    ranges = []
+    for cell in cells:
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1] = (ranges[-1][0], _successor(cell))
+        else:
+            ranges.append((cell, _successor(cell)))
+    return ranges
+
+
+# ── Query filters ──────────────────────────────────────────────────────────────
+
+def _box_q(south, west, north, east):
+    exact = Q(latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east)
+    cells = covering_cells(south, west, north, east)
+    if cells is None:
+        return exact
+    candidates = Q()
+    for low, high in cell_ranges(cells):
+        # Each branch repeats the partial index's predicate: SQLite only uses
+        # a partial index for an OR term that implies it on its own.
+        cell = Q(geohash__gte=low, geohash__lt=high) if high else Q(geohash__gte=low)
+        candidates |= cell & Q(is_published=True)
+    return candidates & exact
+
+
+def within_bbox(qs, south, west, north, east):
+    """Listings inside the box; ``west > east`` means it crosses the antimeridian."""
+    if west <= east:
+        return qs.filter(_box_q(south, west, north, east))
+    return qs.filter(_box_q(south, west, north, 180) | _box_q(south, -180, north, east))
+
+
+def distance_km(lat, lng):
+    """Haversine distance in km from ``(lat, lng)`` to each row, as an expression."""
+    half_dlat = Radians(F('latitude') - Value(lat)) / 2
+    half_dlng = Radians(F('longitude') - Value(lng)) / 2
+    a = (Power(Sin(half_dlat), 2)
+         + Cos(Radians(F('latitude'))) * math.cos(math.radians(lat)) * Power(Sin(half_dlng), 2))
+    # rounding can push sqrt(a) a hair above 1 for antipodal points
+    return 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+def within_radius(qs, lat, lng, radius_km):
+    """Listings within ``radius_km`` of the point, annotated with ``distance`` (km)."""
+    dlat = radius_km / KM_PER_DEGREE
+    south, north = max(lat - dlat, -90), min(lat + dlat, 90)
+    coslat = math.cos(math.radians(lat))
+    if north >= 90 or south <= -90 or dlat / max(coslat, 1e-12) >= 180:
+        qs = qs.filter(latitude__gte=south, latitude__lte=north)   # the circle wraps a pole
+    else:
+        dlng = dlat / coslat
+        west, east = lng - dlng, lng + dlng
+        west, east = (west + 540) % 360 - 180, (east + 540) % 360 - 180   # normalise to [-180, 180)
+        qs = within_bbox(qs, south, west, north, east)
+    return qs.annotate(distance=distance_km(lat, lng)).filter(distance__lte=radius_km)
+
+
+def _float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_bbox(value):
+    """``'west,south,east,north'`` -> ``(south, west, north, east)``, or ``None`` if malformed."""
+    parts = [_float(part) for part in (value or '').split(',')]
+    if len(parts) != 4 or None in parts:
+        return None
+    west, south, east, north = parts
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    return south, west, north, east
+
+
+def parse_radius(params):
+    """``(lat, lng, radius_km)`` from the ``lat``/``lng``/``radius`` parameters, or ``None`` if malformed."""
+    lat, lng, radius = (_float(params.get(name)) for name in ('lat', 'lng', 'radius'))
+    if None in (lat, lng, radius) or not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0:
+        return None
+    return lat, lng, min(radius, MAX_RADIUS_KM)
+
+
+def filter_queryset(qs, params):
+    """
+    Apply the ``bbox`` and ``lat``/``lng``/``radius`` parameters. Malformed
+    values are ignored, like the other search filters. Returns ``(qs, by_distance)``;
+    ``by_distance`` is true when rows carry a ``distance`` annotation.
+    """
+    bbox = parse_bbox(params.get('bbox'))
+    if bbox:
+        qs = within_bbox(qs, *bbox)
+    circle = parse_radius(params)
+    if circle is None:
+        return qs, False
+    return within_radius(qs, *circle), True
+
+
+# ── One point, in Python ───────────────────────────────────────────────────────
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """``distance_km()`` between two points, computed in Python."""
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def point_filter(params):
+    """
+    ``filter_queryset(params)`` as a ``test(lat, lng)`` function for a single
+    point (saved-search matching), or ``None`` when ``params`` has no geo filter.
+    """
+    bbox, circle = parse_bbox(params.get('bbox')), parse_radius(params)
+    if bbox is None and circle is None:
+        return None
+
+    def test(lat, lng):
+        if lat is None or lng is None:
+            return False
+        if bbox:
+            south, west, north, east = bbox
+            if not south <= lat <= north:
+                return False
+            if not (west <= lng <= east if west <= east else lng >= west or lng <= east):
+                return False
+        return circle is None or haversine_km(lat, lng, circle[0], circle[1]) <= circle[2]
+
+    return test
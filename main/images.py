@@ -0,0 +1,150 @@
+"""
+Responsive WebP derivatives for listing and realtor photos.
+
+When a photo is uploaded (``post_listing`` or the admin), the post_save signal
+schedules ``process_instance()`` on a small thread pool, so resizing never
+runs on the request thread. It writes ``<name>.w<width>.webp`` next to the
+original for each width in ``DERIVATIVE_WIDTHS`` that is smaller than the
+original. Then it records what exists in the model's ``photo_variants`` field:
+
+    {'photo_main': {'name': 'listings/2026/02/a.jpg', 'width': 1000, 'widths': [320, 640]}}
+
+Templates build ``srcset`` from that record (see ``templatetags/listing_images``)
+without touching storage. Set ``IMAGE_DERIVATIVE_WORKERS = 0`` to resize
+inline, e.g. in tests or on serverless hosts that freeze after the response.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+WEBP_QUALITY = 80
+
+_executor = None
+
+
+def derivative_name(name, width):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}.w{width}.webp'
+
+
+def generate_derivatives(name, storage=default_storage):
+    """Write the WebP derivatives of ``name``; return ``(original_width, widths_produced)``."""
+    from PIL import Image, ImageOps   # Pillow is only needed when resizing
+
+    with storage.open(name, 'rb') as fh:
+        original = ImageOps.exif_transpose(Image.open(fh))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+    widths = []
+    for width in DERIVATIVE_WIDTHS:
+        if width >= original.width:
+            break
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.Resampling.LANCZOS)
+        buf = ContentFile(b'')
+        resized.save(buf, 'WEBP', quality=WEBP_QUALITY, method=4)
+        target = derivative_name(name, width)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, buf)
+        widths.append(width)
+    return original.width, widths
+
+
+def delete_derivatives(name, widths, storage=default_storage):
+    for width in widths:
+        storage.delete(derivative_name(name, width))
+
+
+def stale_fields(instance):
+    """Image fields whose current file has no up-to-date derivative record."""
+    variants = instance.photo_variants or {}
+    return [field for field in instance.RESPONSIVE_IMAGE_FIELDS
+            if (getattr(instance, field).name or '') != variants.get(field, {}).get('name', '')]
+
+
+def process_instance(model, pk, force=False):
+    """(Re)build derivatives for one Listing/Realtor and store its ``photo_variants``."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    variants = dict(instance.photo_variants or {})
+    fields = instance.RESPONSIVE_IMAGE_FIELDS if force else stale_fields(instance)
+    for field in fields:
+        name = getattr(instance, field).name
+        old = variants.pop(field, None)
+        if old and old.get('name') != name:
+            delete_derivatives(old['name'], old.get('widths', []))
+        if not name:
+            continue
+        try:
+            width, widths = generate_derivatives(name)
+            variants[field] = {'name': name, 'width': width, 'widths': widths}
+        except Exception:
+            logger.exception('Could not build derivatives for %s', name)
+            variants[field] = {'name': name, 'width': None, 'widths': []}
+    updates = {'photo_variants': variants}
+    if hasattr(model, 'updated_at'):
+        updates['updated_at'] = timezone.now()   # srcset changed: new page version
+    model.objects.filter(pk=pk).update(**updates)
+    if hasattr(instance, 'listing_set'):
+        # Listing pages embed the realtor's photo: new versions for them too
+        # (as realtor_touch_listings does for edits)
+        instance.listing_set.update(updated_at=timezone.now())
+    else:
+        # So do the pages showing this listing among their similar listings
+        from . import similar   # imports the models, which import this module
+        similar.touch_referrers([pk])
+    caching.invalidate('home')
+
+
+def _run(model, pk):
+    close_old_connections()
+    try:
+        process_instance(model, pk)
+    except Exception:
+        logger.exception('Derivative job for %s %s failed', model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance):
+    """Queue derivative generation for ``instance`` once the transaction commits."""
+    if not stale_fields(instance):
+        return
+    global _executor
+    model, pk = type(instance), instance.pk
+    workers = settings.IMAGE_DERIVATIVE_WORKERS
+    if workers <= 0:
+        transaction.on_commit(lambda: _run(model, pk))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='img-derivatives')
+    transaction.on_commit(lambda: _executor.submit(_run, model, pk))
+
+
+def srcset(instance, field):
+    """``"url 320w, url 640w, ..."`` for the recorded derivatives (plus the original)."""
+    file = getattr(instance, field)
+    if not file:
+        return ''
+    record = (instance.photo_variants or {}).get(field, {})
+    if record.get('name') != file.name:
+        return ''   # derivatives for this upload are not ready yet
+    storage = file.storage
+    candidates = [f'{storage.url(derivative_name(file.name, w))} {w}w' for w in record.get('widths', [])]
+    if candidates and record.get('width'):
+        candidates.append(f'{file.url} {record["width"]}w')
+    return ', '.join(candidates)
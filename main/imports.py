@@ -0,0 +1,388 @@
+"""
+Bulk listing import from partner inventory feeds (``manage.py import_listings``).
+
+Input is read one row at a time in any of three formats: CSV with a header row,
+NDJSON/JSON Lines, or a single JSON array decoded element by element. Memory
+stays flat however large the feed is. Each row is coerced with the same rules as the
+``post_listing`` form (``_safe_int`` / ``_safe_float``) and validated. Rows are
+then upserted in batches on ``Listing.external_id``: one
+``bulk_create(update_conflicts=True)`` (INSERT ... ON CONFLICT DO UPDATE) per
+batch. If the database rejects a batch, it is retried row by row, so the error
+is reported against the offending row and the rest of the batch still lands.
+
+Bulk writes skip ``Listing.save()`` and the signals, so this module does their
+work itself:
+
+* the geohash, per row;
+* the search index, per batch;
+* saved-search matching of the rows that go live, per batch (skipped with
+  ``alerts=False``);
+* the market statistics and similar-listings rebuilds and the home/facet
+  cache invalidation, once at the end.
+
+Photos are copied from the photo directory into media storage under a
+per-listing name that includes a hash of their content. Re-importing the same
+file reuses the copy, and a changed file is stored anew, even at the same size.
+Its WebP derivatives are left to ``manage.py generate_image_derivatives``.
+The old image's derivatives and record are dropped, so ``srcset`` never
+serves them for the new one. On an update, the realtor, poster and photos a
+row doesn't mention keep their current values.
+
+Columns (CSV header / JSON keys):
+
+    external_id*, title*, city*, state*, price*, address, description,
+    listing_type (sale|rent), property_type, bedrooms, bathrooms, sqft,
+    latitude, longitude, is_published, realtor_email, photo_main, photo_1, photo_2
+"""
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.utils.text import get_valid_filename
+
+from . import caching, images, market_stats, saved_searches, search, similar
+from .models import Listing, Realtor
+from .views import _safe_float, _safe_int
+
+FORMATS = ('csv', 'ndjson', 'json')
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json'}
+BATCH_SIZE = 1000
+TRUE = {'1', 'true', 'yes', 'y', 't'}
+PHOTO_DIGEST_LENGTH = 12   # hex digits of the content hash in stored photo names
+
+REQUIRED_TEXT = ('title', 'city', 'state')
+OPTIONAL_TEXT = ('address', 'description')
+PHOTO_FIELDS = Listing.RESPONSIVE_IMAGE_FIELDS
+# Kept from the existing row when an update doesn't set them
+PRESERVED = ('realtor_id', 'posted_by_id', *PHOTO_FIELDS)
+MAX_LENGTHS = {name: Listing._meta.get_field(name).max_length
+               for name in ('external_id', *REQUIRED_TEXT, *OPTIONAL_TEXT)}
+UPDATE_FIELDS = [
+    'title', 'address', 'city', 'state', 'description', 'price', 'listing_type', 'property_type',
+    'bedrooms', 'bathrooms', 'sqft', 'latitude', 'longitude', 'geohash', 'is_published',
+    'realtor', 'posted_by', *PHOTO_FIELDS, 'photo_variants', 'updated_at',
+]
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = self.created = self.updated = 0
+        self.errors = []   # (line, external_id, message)
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def error(self, line, external_id, message):
+        self.errors.append((line, external_id, message))
+
+
+# ── Readers: yield (line, row dict | RowError) ──────────────────────────────────
+
+def read_csv(fh):
+    reader = csv.DictReader(fh)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(fh):
+    for line, text in enumerate(fh, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except json.JSONDecodeError as exc:
+            yield line, RowError(f'invalid JSON: {exc.msg}')
+
+
+def read_json_array(fh, chunk_size=64 * 1024):
+    """The elements of a top-level JSON array, decoded one at a time; "line" is the element's position."""
+    decoder = json.JSONDecoder()
+    buf, pos = '', 0
+
+    def peek():
+        nonlocal buf, pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                return ''
+            buf, pos = chunk, 0
+
+    if peek() != '[':
+        raise ValueError('expected a JSON array')
+    pos += 1
+    if peek() == ']':
+        return
+    for index in itertools.count(1):
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            # An element that fails, or ends exactly at the end of the buffer (a
+            # number can), may continue in the next chunk
+            if end is None or end == len(buf):
+                chunk = fh.read(chunk_size)
+                if chunk:
+                    buf, pos = buf[pos:] + chunk, 0
+                    continue
+                if end is None:
+                    decoder.raw_decode(buf, pos)   # raises the decode error
+            pos = end
+            break
+        yield index, value
+        sep = peek()
+        if sep == ']':
+            return
+        if sep != ',':
+            raise ValueError(f'expected "," or "]" after element {index}')
+        pos += 1
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson, 'json': read_json_array}
+
+
+def detect_format(path):
+    return EXTENSIONS.get(Path(path).suffix.lower())
+
+
+# ── Row validation ─────────────────────────────────────────────────────────────
+
+def photo_name(external_id, filename, digest):
+    """
+    Storage name of an imported photo, addressed by its content: re-importing
+    the same file reuses it, and a changed file gets a new name (so its
+    derivatives are rebuilt, see ``images.stale_fields``).
+    """
+    stem, suffix = os.path.splitext(get_valid_filename(filename))
+    return f'listings/import/{get_valid_filename(external_id)}/{stem}.{digest[:PHOTO_DIGEST_LENGTH]}{suffix}'
+
+
+def file_digest(path):
+    with path.open('rb') as fh:
+        return hashlib.file_digest(fh, 'sha256').hexdigest()
+
+
+def find_photo(photo_dir, filename):
+    if photo_dir is None:
+        raise RowError('photos given but no photo directory')
+    path = (photo_dir / filename).resolve()
+    if not path.is_relative_to(photo_dir) or not path.is_file():
+        raise RowError(f'photo not found: {filename}')
+    return path
+
+
+def store_photo(external_id, path):
+    """Copy ``path`` into storage unless the same content is there; return its storage name."""
+    name = photo_name(external_id, path.name, file_digest(path))
+    if not default_storage.exists(name):
+        with path.open('rb') as fh:
+            name = default_storage.save(name, File(fh))
+    return name
+
+
+def parse_row(raw, realtors, photo_dir=None, published=True, posted_by=None, dry_run=False):
+    """An unsaved ``Listing`` for one input row; raises ``RowError`` listing every problem."""
+    if not isinstance(raw, dict):
+        raise RowError('not an object')
+
+    def text(name):
+        value = raw.get(name)
+        return '' if value is None else str(value).strip()
+
+    problems = []
+    values = {'external_id': text('external_id')}
+    if not values['external_id']:
+        problems.append('external_id: required')
+    elif len(values['external_id']) > MAX_LENGTHS['external_id']:
+        problems.append('external_id: too long')
+    for name in REQUIRED_TEXT + OPTIONAL_TEXT:
+        values[name] = text(name)
+        if name in REQUIRED_TEXT and not values[name]:
+            problems.append(f'{name}: required')
+        elif MAX_LENGTHS[name] and len(values[name]) > MAX_LENGTHS[name]:
+            problems.append(f'{name}: longer than {MAX_LENGTHS[name]} characters')
+
+    values['price'] = _safe_int(text('price'))
+    if values['price'] is None or values['price'] <= 0:
+        problems.append('price: must be a positive whole number')
+    for name, choices, default in (('listing_type', Listing.LISTING_TYPE_CHOICES, Listing.SALE),
+                                   ('property_type', Listing.PROPERTY_TYPE_CHOICES, Listing.APARTMENT)):
+        values[name] = text(name).lower() or default
+        if values[name] not in dict(choices):
+            problems.append(f'{name}: must be one of {", ".join(dict(choices))}')
+
+    # Same coercion as the form: blank means "not given", anything unparseable is an error
+    numbers = {'bedrooms': (_safe_int, 0, 100), 'sqft': (_safe_int, 1, 10 ** 8),
+               'bathrooms': (_safe_float, 0, 9.9), 'latitude': (_safe_float, -90, 90),
+               'longitude': (_safe_float, -180, 180)}
+    for name, (coerce, low, high) in numbers.items():
+        given = text(name)
+        values[name] = coerce(given)
+        if given and (values[name] is None or not low <= values[name] <= high):
+            problems.append(f'{name}: expected a number from {low} to {high}')
+            values[name] = None
+    if values['bathrooms'] is not None:
+        values['bathrooms'] = Decimal(str(values['bathrooms'])).quantize(Decimal('0.1'))
+    if (values['latitude'] is None) != (values['longitude'] is None):
+        problems.append('latitude/longitude: give both or neither')
+
+    flag = text('is_published')
+    values['is_published'] = flag.lower() in TRUE if flag else published
+
+    provided = set()
+    email = text('realtor_email').lower()
+    if email:
+        values['realtor_id'] = realtors.get(email)
+        provided.add('realtor_id')
+        if values['realtor_id'] is None:
+            problems.append(f'realtor_email: no realtor with email {email}')
+    if posted_by is not None:
+        values['posted_by'] = posted_by
+        provided.add('posted_by_id')
+    photos = {}
+    for field in PHOTO_FIELDS:
+        if filename := text(field):
+            try:
+                photos[field] = find_photo(photo_dir, filename)
+            except RowError as exc:
+                problems.append(f'{field}: {exc}')
+    if problems:
+        raise RowError('; '.join(problems))
+
+    # Only copy the photos of rows that are otherwise valid
+    for field, path in photos.items():
+        values[field] = path.name if dry_run else store_photo(values['external_id'], path)
+        provided.add(field)
+
+    listing = Listing(**values)
+    listing.geohash = listing.compute_geohash()
+    listing._import_provided = provided
+    return listing
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+
+def _upsert(listings, existing, alerts):
+    saved = Listing.objects.bulk_create(listings, update_conflicts=True, unique_fields=['external_id'],
+                                        update_fields=UPDATE_FIELDS)
+    for listing in listings:
+        for record in listing._replaced_variants:
+            transaction.on_commit(partial(images.delete_derivatives, record['name'], record.get('widths', [])))
+    search.update_listings(listing.pk for listing in saved)
+    if alerts:
+        saved_searches.listings_published(
+            listing.pk for listing in saved
+            if listing.is_published and not existing.get(listing.external_id, {}).get('is_published'))
+
+
+def write_batch(batch, report, dry_run=False, alerts=True):
+    """
+    Upsert ``{external_id: (line, listing)}``; a rejected batch is retried row
+    by row. With ``alerts``, rows going live are matched against saved searches.
+    """
+    existing = {row['external_id']: row for row in Listing.objects.filter(external_id__in=list(batch))
+                .values('external_id', 'is_published', 'photo_variants', *PRESERVED)}
+    for external_id, (_, listing) in batch.items():
+        listing._replaced_variants = []
+        if external_id not in existing:
+            continue
+        old = existing[external_id]
+        for name in PRESERVED:
+            if name not in listing._import_provided:
+                setattr(listing, name, old[name])
+        # A photo whose stored file changed loses its derivative record, so
+        # nothing serves the old image's WebPs
+        listing.photo_variants = dict(old['photo_variants'] or {})
+        for field in PHOTO_FIELDS:
+            if getattr(listing, field).name != old[field] and field in listing.photo_variants:
+                listing._replaced_variants.append(listing.photo_variants.pop(field))
+    if dry_run:
+        report.updated += len(existing)
+        report.created += len(batch) - len(existing)
+        return
+    try:
+        with transaction.atomic():
+            _upsert([listing for _, listing in batch.values()], existing, alerts)
+    except DatabaseError:
+        for external_id, (line, listing) in batch.items():
+            listing.pk = None
+            try:
+                with transaction.atomic():
+                    _upsert([listing], existing, alerts)
+            except DatabaseError as exc:
+                report.error(line, external_id, f'rejected by the database: {exc}')
+                continue
+            if external_id in existing:
+                report.updated += 1
+            else:
+                report.created += 1
+        return
+    report.updated += len(existing)
+    report.created += len(batch) - len(existing)
+
+
+def import_file(fh, fmt, photo_dir=None, batch_size=BATCH_SIZE, published=True, posted_by=None,
+                dry_run=False, alerts=True, progress=None):
+    """
+    Import every row of ``fh``; ``progress(report)`` is called after each batch.
+    ``alerts=False`` skips saved-search matching (backfills).
+    """
+    report = ImportReport()
+    realtors = {email.lower(): pk for pk, email in Realtor.objects.values_list('pk', 'email')}
+    photo_dir = Path(photo_dir).resolve() if photo_dir else None
+    batch = {}
+    for line, raw in READERS[fmt](fh):
+        report.rows += 1
+        try:
+            if isinstance(raw, RowError):
+                raise raw
+            listing = parse_row(raw, realtors, photo_dir, published=published, posted_by=posted_by,
+                                dry_run=dry_run)
+        except RowError as exc:
+            external_id = raw.get('external_id', '') if isinstance(raw, dict) else ''
+            report.error(line, external_id, str(exc))
+            continue
+        if listing.external_id in batch:
+            # ON CONFLICT can't touch a row twice in one statement; the later row wins
+            report.error(batch[listing.external_id][0], listing.external_id,
+                         f'superseded by the row at {line} with the same external_id')
+        batch[listing.external_id] = (line, listing)
+        if len(batch) >= batch_size:
+            write_batch(batch, report, dry_run, alerts)
+            batch = {}
+            if progress:
+                progress(report)
+    if batch:
+        write_batch(batch, report, dry_run, alerts)
+        if progress:
+            progress(report)
+    if not dry_run and (report.created or report.updated):
+        market_stats.rebuild()
+        similar.rebuild()
+        caching.invalidate('home')
+        caching.invalidate('facets')
+    return report
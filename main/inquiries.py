@@ -0,0 +1,193 @@
+"""
+Write-behind pipeline for listing inquiries.
+
+``contact()`` makes one indexed lookup: the listing must be published, and a
+signed-in user is told when they already asked about it. ``submit()`` then
+makes one INSERT into ``InquiryOutbox`` and the request returns. A worker
+runs two passes:
+
+1. ``drain()`` claims up to ``BATCH_SIZE`` outbox rows. It bulk-inserts them
+   into ``Contact`` with ``ignore_conflicts``, so the
+   ``contact_listing_user_uniq`` constraint drops a signed-in user's repeat
+   inquiries that raced past the lookup. Rows whose listing was deleted or
+   unpublished meanwhile are discarded. All of this happens in one transaction with the delete of the
+   claimed rows, so nothing is lost or inserted twice.
+2. ``notify()`` emails each new contact (``notified_at`` unset) to the
+   listing's realtor and poster through Django's email backend. A failed send
+   is retried with exponential backoff, up to ``MAX_ATTEMPTS`` times.
+
+``INQUIRY_WORKER`` picks the worker:
+
+* ``thread`` — a daemon thread, woken after each submission commits. It lingers
+  ``LINGER`` seconds so bursts share a batch, and polls every
+  ``POLL_INTERVAL`` for due retries.
+* ``inline`` — both passes run when the submitting transaction commits. The
+  default on Vercel: serverless hosts freeze background threads after the
+  response, which would strand queued inquiries until a later request. Sends
+  that failed are retried on the next submission's pass.
+* ``off`` — nothing runs in the web process. ``manage.py process_inquiries``
+  (``--loop`` to keep running, or from a scheduler) does the work.
+
+The outbox is a table, so anything not yet processed survives restarts and
+is picked up by whichever worker runs next.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Contact, InquiryOutbox, Listing
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+MAX_ATTEMPTS = 8
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=6)
+LINGER = 0.25
+POLL_INTERVAL = 60
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# ── Request side ───────────────────────────────────────────────────────────────
+
+def submit(listing_pk, user, name, email, phone='', message=''):
+    """Queue an inquiry; it becomes a ``Contact`` (and an email) once a worker drains it."""
+    InquiryOutbox.objects.create(listing_pk=listing_pk, user=user, name=name, email=email,
+                                 phone=phone, message=message)
+    transaction.on_commit(_wake)
+
+
+def _wake():
+    mode = settings.INQUIRY_WORKER
+    if mode == 'inline':
+        process()
+    elif mode == 'thread':
+        _ensure_worker()
+        _wakeup.set()
+
+
+# ── Passes ─────────────────────────────────────────────────────────────────────
+
+def drain(batch_size=BATCH_SIZE):
+    """Move one batch from the outbox into ``Contact``; returns the number of outbox rows consumed."""
+    with transaction.atomic():
+        # Workers in several processes skip each other's rows (a no-op on SQLite,
+        # which serialises writers anyway)
+        rows = list(InquiryOutbox.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not rows:
+            return 0
+        live = set(Listing.objects.filter(pk__in={row.listing_pk for row in rows}, is_published=True)
+                   .values_list('pk', flat=True))
+        Contact.objects.bulk_create([
+            Contact(listing_id=row.listing_pk, user_id=row.user_id, name=row.name, email=row.email,
+                    phone=row.phone, message=row.message, contact_date=row.created_at,
+                    notify_after=row.created_at)
+            for row in rows if row.listing_pk in live
+        ], ignore_conflicts=True)
+        InquiryOutbox.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    if dropped := sum(row.listing_pk not in live for row in rows):
+        logger.info('Dropped %s inquiries for listings no longer published', dropped)
+    return len(rows)
+
+
+def recipients(listing):
+    emails = [listing.realtor.email if listing.realtor else '',
+              listing.posted_by.email if listing.posted_by else '']
+    return list(dict.fromkeys(e for e in emails if e))
+
+
+def build_message(contact, connection=None):
+    listing = contact.listing
+    body = (
+        f'{contact.name} sent an inquiry about "{listing.title}" ({listing.address}, {listing.city}).\n\n'
+        f'Email: {contact.email}\n'
+        f'Phone: {contact.phone or "-"}\n\n'
+        f'{contact.message}\n'
+    )
+    return EmailMessage(subject=f'New inquiry: {listing.title}', body=body, to=recipients(listing),
+                        reply_to=[contact.email], connection=connection)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def notify(batch_size=BATCH_SIZE):
+    """Send the due notifications; returns ``(sent, failed)``."""
+    now = timezone.now()
+    due = list(Contact.objects.filter(notified_at__isnull=True, notify_after__lte=now,
+                                      notify_attempts__lt=MAX_ATTEMPTS)
+               .select_related('listing__realtor', 'listing__posted_by').order_by('notify_after')[:batch_size])
+    if not due:
+        return 0, 0
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        for contact in due:
+            message = build_message(contact, connection)
+            try:
+                if message.to:   # no one to tell: nothing to retry either
+                    connection.open()   # once per batch; retried if the server was unreachable
+                    message.send()
+            except Exception as exc:
+                contact.notify_attempts += 1
+                contact.notify_after = now + retry_delay(contact.notify_attempts)
+                contact.notify_error = f'{type(exc).__name__}: {exc}'
+                failed.append(contact)
+                logger.warning('Inquiry %s notification failed (attempt %s): %s',
+                               contact.pk, contact.notify_attempts, exc)
+            else:
+                contact.notified_at = timezone.now()
+                contact.notify_error = ''
+                sent.append(contact)
+    finally:
+        connection.close()
+    Contact.objects.bulk_update(sent + failed, ['notified_at', 'notify_attempts', 'notify_after', 'notify_error'])
+    return len(sent), len(failed)
+
+
+def process():
+    """Drain the outbox, then send what's due; returns ``(inquiries, sent, failed)``."""
+    inquiries = 0
+    while batch := drain():
+        inquiries += batch
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = notify()
+        sent, failed = sent + batch_sent, failed + batch_failed
+        if not batch_sent:
+            break   # failures are rescheduled, so only progress warrants another round
+    return inquiries, sent, failed
+
+
+# ── Background worker ──────────────────────────────────────────────────────────
+
+def _run_worker():
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        time.sleep(LINGER)   # let a burst of submissions land in one batch
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            process()
+        except Exception:
+            logger.exception('Inquiry worker pass failed')
+        finally:
+            close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='inquiry-worker', daemon=True)
+            _worker.start()
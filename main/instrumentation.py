@@ -0,0 +1,253 @@
+"""
+Per-request cost accounting: SQL queries and time, template render time and
+query-cache hits/misses (``main/caching.py``).
+
+``RequestInstrumentationMiddleware`` puts a ``Recorder`` in a context variable
+for the duration of each request; async views' ORM calls run in other
+threads but see it too, because ``sync_to_async`` copies the context. Then it:
+
+* sets a ``Server-Timing`` header (``db``, ``tpl``, ``cache``, ``app``). A
+  streamed response gets the figures as of its first byte;
+* adds the request to its route's rolling window of ``INSTRUMENTATION_WINDOW``
+  requests. Streamed responses are added once the last chunk is sent;
+* every ``INSTRUMENTATION_LOG_EVERY`` requests of a route, logs that route's
+  p50/p95 as ``key=value`` pairs (logger ``main.instrumentation``);
+* logs a warning when a route runs more queries than its
+  ``QUERY_BUDGETS`` entry. The test suite enforces the same budgets.
+
+``/stats/requests/`` shows the windows to staff. Queries are seen through a
+``connection_created`` hook (``install()``) that adds an execute wrapper to
+every connection. Templates are timed by ``InstrumentedDjangoTemplates``, the
+template backend.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_recorder', default=None)
+
+
+class Recorder:
+    """What one request cost so far."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = self.cache_misses = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'app;dur={self.elapsed * 1000:.1f}',
+        ])
+
+
+def current():
+    """The current request's ``Recorder``, or ``None`` outside a request."""
+    return _current.get()
+
+
+def count_cache(hits, misses):
+    if rec := _current.get():
+        rec.cache_hits += hits
+        rec.cache_misses += misses
+
+
+# ── Probes ─────────────────────────────────────────────────────────────────────
+
+def _time_query(execute, sql, params, many, context):
+    rec = _current.get()
+    if rec is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        rec.queries += 1
+        rec.db_time += time.perf_counter() - start
+
+
+def _install_query_probe(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def install():
+    """Hook the query probe into every new connection (``MainConfig.ready``)."""
+    connection_created.connect(_install_query_probe, dispatch_uid='main.instrumentation')
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        rec = _current.get()
+        if rec is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            rec.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render (includes count toward their parent)."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ── Per-route windows ──────────────────────────────────────────────────────────
+
+_windows = {}   # route -> deque of (seconds, queries, db seconds, template seconds)
+_seen = {}      # route -> requests since startup
+_lock = threading.Lock()
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _summary(samples):
+    durations, queries, db, templates = (sorted(column) for column in zip(*samples))
+    return {
+        'requests': len(samples),
+        'p50_ms': _percentile(durations, 0.5) * 1000, 'p95_ms': _percentile(durations, 0.95) * 1000,
+        'queries_p50': _percentile(queries, 0.5), 'queries_max': queries[-1],
+        'db_p95_ms': _percentile(db, 0.95) * 1000, 'template_p95_ms': _percentile(templates, 0.95) * 1000,
+    }
+
+
+def record(route, rec):
+    """Add a finished request to ``route``'s window; log the window's summary every so often."""
+    with _lock:
+        window = _windows.get(route)
+        if window is None:
+            window = _windows[route] = deque(maxlen=settings.INSTRUMENTATION_WINDOW)
+        window.append((rec.elapsed, rec.queries, rec.db_time, rec.template_time))
+        _seen[route] = seen = _seen.get(route, 0) + 1
+        summary = _summary(window) if seen % settings.INSTRUMENTATION_LOG_EVERY == 0 else None
+    if summary:
+        logger.info('route=%s %s', route, ' '.join(
+            f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}' for key, value in summary.items()))
+    budget = settings.QUERY_BUDGETS.get(route)
+    if budget is not None and rec.queries > budget:
+        logger.warning('route=%s queries=%s budget=%s', route, rec.queries, budget)
+
+
+def route_stats():
+    """``{route: summary}`` of the current windows, busiest route first."""
+    with _lock:
+        windows = {route: list(window) for route, window in _windows.items()}
+    stats = {route: {**_summary(samples), 'budget': settings.QUERY_BUDGETS.get(route)}
+             for route, samples in windows.items()}
+    return dict(sorted(stats.items(), key=lambda item: -item[1]['requests']))
+
+
+def reset():
+    with _lock:
+        _windows.clear()
+        _seen.clear()
+
+
+# ── Middleware ─────────────────────────────────────────────────────────────────
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def _stream(chunks, rec, route):
+    # Queries made while the body is generated count toward the request
+    it = iter(chunks)
+    while True:
+        token = _current.set(rec)
+        try:
+            chunk = next(it)
+        except StopIteration:
+            break
+        finally:
+            _current.reset(token)
+        yield chunk
+    record(route, rec)
+
+
+async def _astream(chunks, rec, route):
+    it = aiter(chunks)
+    while True:
+        token = _current.set(rec)
+        try:
+            chunk = await anext(it)
+        except StopAsyncIteration:
+            break
+        finally:
+            _current.reset(token)
+        yield chunk
+    record(route, rec)
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        rec = Recorder()
+        token = _current.set(rec)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, rec)
+
+    async def __acall__(self, request):
+        rec = Recorder()
+        token = _current.set(rec)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, rec)
+
+    def _finish(self, request, response, rec):
+        route = _route(request)
+        response['Server-Timing'] = rec.server_timing()
+        if response.streaming:
+            stream = _astream if response.is_async else _stream
+            response.streaming_content = stream(response.streaming_content, rec, route)
+        else:
+            record(route, rec)
+        return response
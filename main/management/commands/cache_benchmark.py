@@ -0,0 +1,79 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Compare get/set latency of the available cache backends: LocMem, the shared '
+            'SQLite file cache, and Redis / Memcached when their URLs are given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument('--value-size', type=int, default=20,
+                            help='Number of listing-like dicts in each cached value.')
+        parser.add_argument('--redis', default=os.environ.get('BENCH_REDIS_URL'),
+                            help='e.g. redis://localhost:6379/1')
+        parser.add_argument('--memcached', default=os.environ.get('BENCH_MEMCACHED'),
+                            help='e.g. localhost:11211')
+
+    def handle(self, *args, **opts):
+        with tempfile.TemporaryDirectory(prefix='cache-bench-') as tmpdir:
+            self.bench(tmpdir, opts)
+
+    def bench(self, tmpdir, opts):
+        backends = [
+            ('locmem', 'django.core.cache.backends.locmem.LocMemCache', 'bench', {}),
+            ('sqlite', 'main.cache_backends.SQLiteCache', os.path.join(tmpdir, 'cache.sqlite3'),
+             {'OPTIONS': {'MAX_ENTRIES': 100000}}),
+        ]
+        if opts['redis']:
+            backends.append(('redis', 'django.core.cache.backends.redis.RedisCache', opts['redis'], {}))
+        if opts['memcached']:
+            backends.append(('memcached', 'django.core.cache.backends.memcached.PyMemcacheCache',
+                             opts['memcached'], {}))
+
+        value = [{'id': i, 'title': f'3BHK apartment #{i}', 'city': 'Pune', 'state': 'Maharashtra',
+                  'price': 7_500_000 + i, 'photo_main': f'listings/2026/01/{i}.jpg'}
+                 for i in range(opts['value_size'])]
+        n = opts['iterations']
+        self.stdout.write(f'{n} iterations, value of {opts["value_size"]} dicts; latency in µs')
+        self.stdout.write(f'{"backend":<10} {"op":<5} {"p50":>8} {"p99":>8} {"mean":>8}')
+        for name, path, location, params in backends:
+            try:
+                cache = import_string(path)(location, params)
+                results = self.run(cache, value, n)
+            except Exception as exc:   # e.g. server not reachable / client library missing
+                self.stdout.write(self.style.WARNING(f'{name:<10} skipped: {exc}'))
+                continue
+            for op, samples in results.items():
+                self.stdout.write(f'{name:<10} {op:<5} {_percentile(samples, 50):8.1f} '
+                                  f'{_percentile(samples, 99):8.1f} {statistics.fmean(samples):8.1f}')
+            cache.clear()
+
+    @staticmethod
+    def run(cache, value, n):
+        keys = [f'bench:{i}' for i in range(min(n, 500))]
+        timings = {'set': [], 'hit': [], 'miss': []}
+        clock = time.perf_counter_ns
+        for i in range(n):
+            key = keys[i % len(keys)]
+            t0 = clock()
+            cache.set(key, value)
+            t1 = clock()
+            cache.get(key)
+            t2 = clock()
+            cache.get(f'{key}:absent')
+            t3 = clock()
+            timings['set'].append((t1 - t0) / 1000)
+            timings['hit'].append((t2 - t1) / 1000)
+            timings['miss'].append((t3 - t2) / 1000)
+        return timings
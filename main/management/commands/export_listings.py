@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import exports
+from main.views import filter_listings
+
+
+class Command(BaseCommand):
+    help = 'Stream published listings as NDJSON or CSV in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+        parser.add_argument('--media-base', default=None,
+                            help='Prefix for photo paths, e.g. https://example.com/media/ (default: MEDIA_URL).')
+        for name in ('city', 'state', 'bedrooms', 'price', 'q', 'type'):
+            parser.add_argument(f'--{name}', help=f'Same as the API "{name}" filter.')
+
+    def handle(self, *args, **opts):
+        params = {k: opts[k] for k in ('city', 'state', 'bedrooms', 'price', 'q', 'type') if opts[k]}
+        chunks = exports.stream(filter_listings(params), opts['format'],
+                                media_base=opts['media_base'], chunk_size=opts['chunk_size'])
+        try:
+            out = open(opts['output'], 'w', newline='', encoding='utf-8') if opts['output'] else None
+        except OSError as exc:
+            raise CommandError(exc)
+        rows = -1 if opts['format'] == 'csv' else 0   # don't count the CSV header
+        try:
+            for chunk in chunks:
+                if out:
+                    out.write(chunk)
+                else:
+                    self.stdout.write(chunk, ending='')
+                rows += 1
+        finally:
+            if out:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {rows} listings.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main import images
+from main.models import Listing, Realtor
+
+
+class Command(BaseCommand):
+    help = 'Backfill the responsive WebP derivatives for listing and realtor photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild derivatives even when they are already recorded.')
+
+    def handle(self, *args, **opts):
+        for model in (Listing, Realtor):
+            has_photo = Q()
+            for field in model.RESPONSIVE_IMAGE_FIELDS:
+                has_photo |= ~Q(**{field: ''})
+            qs = model.objects.filter(has_photo).order_by('pk')
+            done = 0
+            for obj in qs.iterator(chunk_size=500):
+                if opts['force'] or images.stale_fields(obj):
+                    images.process_instance(model, obj.pk, force=opts['force'])
+                    done += 1
+            self.stdout.write(f'{model.__name__}: processed {done} of {qs.count()} with photos')
@@ -0,0 +1,69 @@
+import csv
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main import imports
+
+
+class Command(BaseCommand):
+    help = ('Upsert listings from a partner CSV / NDJSON / JSON feed, keyed on external_id. '
+            'See main/imports.py for the columns.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Feed to import ("-" reads stdin; then --format is required).')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='Default: from the file extension (.csv, .ndjson/.jsonl, .json).')
+        parser.add_argument('--photos', help='Directory the photo_* columns are relative to.')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+        parser.add_argument('--posted-by', help='Username to record as the poster of every row.')
+        parser.add_argument('--unpublished', action='store_true',
+                            help='Import rows without an is_published column as drafts.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing.')
+        parser.add_argument('--no-alerts', action='store_true',
+                            help="Don't match the rows that go live against saved searches (backfills).")
+        parser.add_argument('--errors', help='Also write the per-row errors to this CSV file.')
+
+    def handle(self, *args, **opts):
+        fmt = opts['format'] or imports.detect_format(opts['file'])
+        if fmt is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+        posted_by = None
+        if opts['posted_by']:
+            posted_by = User.objects.filter(username=opts['posted_by']).first()
+            if posted_by is None:
+                raise CommandError(f'No user named {opts["posted_by"]!r}.')
+
+        def progress(report):
+            self.stderr.write(f'{report.rows:,} rows  {report.created:,} new  {report.updated:,} updated  '
+                              f'{len(report.errors):,} errors  {report.rate:,.0f} rows/s')
+
+        try:
+            fh = sys.stdin if opts['file'] == '-' else open(opts['file'], newline='', encoding='utf-8-sig')
+        except OSError as exc:
+            raise CommandError(exc)
+        try:
+            report = imports.import_file(fh, fmt, photo_dir=opts['photos'], batch_size=opts['batch_size'],
+                                         published=not opts['unpublished'], posted_by=posted_by,
+                                         dry_run=opts['dry_run'], alerts=not opts['no_alerts'], progress=progress)
+        except ValueError as exc:   # the file itself is malformed (e.g. not a JSON array)
+            raise CommandError(f'{opts["file"]}: {exc}')
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+        for line, external_id, message in report.errors:
+            self.stderr.write(self.style.WARNING(f'{line}: {external_id or "-"}: {message}'))
+        if opts['errors']:
+            with open(opts['errors'], 'w', newline='', encoding='utf-8') as out:
+                writer = csv.writer(out)
+                writer.writerow(['line', 'external_id', 'error'])
+                writer.writerows(report.errors)
+        verb = 'Validated' if opts['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.created + report.updated:,} of {report.rows:,} rows '
+            f'({report.created:,} new, {report.updated:,} updated, {len(report.errors):,} errors) '
+            f'in {report.elapsed:.1f}s, {report.rate:,.0f} rows/s.'))
+        if report.created + report.updated and opts['photos'] and not opts['dry_run']:
+            self.stdout.write('Run `manage.py generate_image_derivatives` to build WebP sizes for the new photos.')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import inquiries
+
+
+class Command(BaseCommand):
+    help = 'Turn queued inquiries into contacts and send the due realtor notifications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling the outbox every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **opts):
+        while True:
+            close_old_connections()
+            done, sent, failed = inquiries.process()
+            if done or sent or failed or not opts['loop']:
+                self.stdout.write(f'{done} inquiries saved, {sent} notifications sent, {failed} failed')
+            if not opts['loop']:
+                return
+            time.sleep(opts['interval'])
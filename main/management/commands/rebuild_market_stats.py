@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main import market_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute every market statistics group from the published listings (e.g. after bulk loads).'
+
+    def handle(self, *args, **options):
+        groups = market_stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Market statistics rebuilt ({groups} groups).'))
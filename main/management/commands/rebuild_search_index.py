@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = 'Recompute the full-text search index for every listing (e.g. after bulk loads).'
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind is None:
+            self.stdout.write(self.style.WARNING('No full-text backend on this database; nothing to do.'))
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({kind}).'))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import similar
+
+
+class Command(BaseCommand):
+    help = "Recompute every published listing's similar listings (e.g. after bulk loads)."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = similar.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Similar listings rebuilt ({rows} rows in {time.perf_counter() - started:.1f}s).'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import background
+
+
+class Command(BaseCommand):
+    help = ('Run the deferred refreshes of derived tables (market-stat percentiles, similar listings): '
+            'the worker for REFRESH_WORKER=off.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, looking for stale rows every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **opts):
+        while True:
+            close_old_connections()
+            results = background.run_all()
+            if any(results.values()) or not opts['loop']:
+                self.stdout.write(', '.join(f'{path.rsplit(".", 2)[-2]}: {n} refreshed'
+                                            for path, n in results.items()))
+            if not opts['loop']:
+                return
+            time.sleep(opts['interval'])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import saved_searches
+
+
+class Command(BaseCommand):
+    help = 'Email users a digest of the new listings that matched their saved searches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking for new matches every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=300.0)
+
+    def handle(self, *args, **opts):
+        while True:
+            close_old_connections()
+            sent = failed = 0
+            while True:
+                batch_sent, batch_failed, batch_dropped = saved_searches.notify()
+                sent, failed = sent + batch_sent, failed + batch_failed
+                if not (batch_sent or batch_failed or batch_dropped):
+                    break   # every user handled leaves the queue or backs off, so each round moves on
+            if sent or failed or not opts['loop']:
+                self.stdout.write(f'{sent} alerts sent, {failed} failed')
+            if not opts['loop']:
+                return
+            time.sleep(opts['interval'])
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over every SQLite replica: local stand-in for replication, '
+            'for trying DATABASE_REPLICA_URLS with two files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep copying every --interval seconds, i.e. replicas lag by up to that much.')
+        parser.add_argument('--interval', type=float, default=2.0)
+
+    def handle(self, *args, **opts):
+        aliases = [DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES]
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_URLS.')
+        if any(connections[alias].vendor != 'sqlite' for alias in aliases):
+            raise CommandError('Only SQLite primaries and replicas can be copied.')
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+            try:
+                for alias in settings.REPLICA_DATABASES:
+                    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                    try:
+                        source.backup(target)   # a consistent snapshot, even mid-write
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            if not opts['loop']:
+                self.stdout.write(f'{len(settings.REPLICA_DATABASES)} replica(s) synced in '
+                                  f'{time.perf_counter() - started:.2f}s')
+                return
+            time.sleep(opts['interval'])
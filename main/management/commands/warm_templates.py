@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.coldstart import warm_templates
+
+
+class Command(BaseCommand):
+    help = 'Compile every project template (fails on syntax errors) and report compile times.'
+
+    def handle(self, *args, **options):
+        timings = warm_templates()
+        for name, ms in sorted(timings.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'{ms:8.2f} ms  {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Compiled {len(timings)} templates in {sum(timings.values()):.1f} ms.'))
@@ -0,0 +1,251 @@
+"""
+Market statistics per city, state and property type, kept in ``MarketStat``.
+
+Each group is a ``(dimension, value, listing_type)`` triple, e.g.
+``('city', 'Pune', 'rent')``. It stores the count, sum, min/max/mean and the
+25th/50th/75th price percentiles of its published listings, plus the median
+price per sqft. ``/api/stats/`` reads those rows, so a request costs
+O(groups) no matter how many listings there are.
+
+Maintenance:
+
+* The Listing signals call ``record()`` with a listing's values before and
+  after a write. In the write's own transaction, each group it left or joined
+  gets its count, sum and mean adjusted (and min/max widened), a few
+  single-row UPDATEs whatever the table size. The group is also marked
+  ``dirty``.
+* Percentiles can't be maintained from running totals, nor can min/max once
+  a listing leaves. ``refresh_dirty()`` recomputes the dirty groups in
+  batches off the request path (``main/background.py``), so a burst of writes
+  costs one pass per group.
+* ``manage.py rebuild_market_stats`` recomputes everything. Run it after
+  bulk writes that bypass signals (``update()``, ``bulk_create()``).
+
+A recompute loads ``(group, price)`` for the rows it needs and computes every
+group at once with NumPy: one sort, then index arithmetic per group.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import Cast, Greatest, Least
+from django.utils import timezone
+
+from . import background, caching
+from .models import Listing, MarketStat
+
+DIMENSIONS = [MarketStat.CITY, MarketStat.STATE, MarketStat.PROPERTY_TYPE]
+FIELDS = [*DIMENSIONS, 'listing_type', 'price', 'sqft']   # what record() needs of a listing
+STAT_FIELDS = ['count', 'price_sum', 'min_price', 'max_price', 'mean_price', 'p25_price', 'median_price',
+               'p75_price', 'median_price_per_sqft']
+
+
+# ── Vectorised summaries ───────────────────────────────────────────────────────
+
+def _percentile(values, starts, counts, q):
+    """Linear-interpolated ``q`` quantile of each sorted segment (NumPy's default method)."""
+    import numpy as np
+
+    pos = starts + q * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def summarise(group_ids, values, n_groups):
+    """
+    Count/min/max/mean/p25/median/p75 of ``values`` for each group in
+    ``0..n_groups-1``, as a dict of arrays. Every group must be non-empty.
+    """
+    import numpy as np
+
+    values = values.astype(np.float64)
+    counts = np.bincount(group_ids, minlength=n_groups)
+    sums = np.bincount(group_ids, weights=values, minlength=n_groups)
+    values = values[np.lexsort((values, group_ids))]   # by group, then value
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return {
+        'count': counts,
+        'sum': sums,
+        'min': values[starts],
+        'max': values[starts + counts - 1],
+        'mean': sums / counts,
+        'p25': _percentile(values, starts, counts, 0.25),
+        'median': _percentile(values, starts, counts, 0.5),
+        'p75': _percentile(values, starts, counts, 0.75),
+    }
+
+
+def compute(rows, dimension):
+    """
+    Build unsaved ``MarketStat`` objects from ``(value, listing_type, price, sqft)``
+    rows of one dimension.
+    """
+    import numpy as np
+
+    if not rows:
+        return []
+    values, listing_types, prices, sqft = zip(*rows)
+    keys = np.array([f'{value}\x1f{listing_type}' for value, listing_type in zip(values, listing_types)])
+    groups, group_ids = np.unique(keys, return_inverse=True)
+    group_ids = group_ids.ravel()
+    prices = np.array(prices, dtype=np.float64)
+    price = summarise(group_ids, prices, len(groups))
+
+    sqft = np.array([s or 0 for s in sqft], dtype=np.float64)
+    has_area = sqft > 0
+    per_sqft_median = np.full(len(groups), np.nan)
+    area_groups = group_ids[has_area]
+    if area_groups.size:
+        present = np.unique(area_groups)
+        # renumber the groups that have any area so every segment is non-empty
+        remap = np.searchsorted(present, area_groups)
+        per_sqft = summarise(remap, prices[has_area] / sqft[has_area], len(present))
+        per_sqft_median[present] = per_sqft['median']
+
+    stats = []
+    for i, key in enumerate(groups):
+        value, listing_type = str(key).split('\x1f')
+        stats.append(MarketStat(
+            dimension=dimension, value=value, listing_type=listing_type,
+            count=int(price['count'][i]),
+            price_sum=round(price['sum'][i]),
+            min_price=int(price['min'][i]),
+            max_price=int(price['max'][i]),
+            mean_price=float(price['mean'][i]),
+            p25_price=float(price['p25'][i]),
+            median_price=float(price['median'][i]),
+            p75_price=float(price['p75'][i]),
+            median_price_per_sqft=None if np.isnan(per_sqft_median[i]) else float(per_sqft_median[i]),
+        ))
+    return stats
+
+
+# ── Full and incremental refresh ───────────────────────────────────────────────
+
+REFRESH_BATCH = 200   # dirty groups recomputed per pass
+
+
+def _rows(qs, dimension):
+    return list(qs.values_list(dimension, 'listing_type', 'price', 'sqft'))
+
+
+def _save(stats):
+    MarketStat.objects.bulk_create(
+        stats, update_conflicts=True, unique_fields=['dimension', 'value', 'listing_type'],
+        update_fields=[*STAT_FIELDS, 'dirty', 'updated_at'], batch_size=500,
+    )
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every group; returns the number of groups."""
+    published = Listing.objects.filter(is_published=True)
+    stats = [stat for dimension in DIMENSIONS for stat in compute(_rows(published, dimension), dimension)]
+    MarketStat.objects.all().delete()
+    _save(stats)
+    caching.invalidate('market-stats')
+    return len(stats)
+
+
+@transaction.atomic
+def refresh(groups):
+    """Recompute the ``{(dimension, value)}`` groups (both listing types), dropping emptied ones."""
+    stats = []
+    for dimension in DIMENSIONS:
+        values = {value for dim, value in groups if dim == dimension}
+        if not values:
+            continue
+        # Lock the rows first: a write that commits meanwhile then adjusts them
+        # after this recompute, instead of being overwritten by it
+        list(MarketStat.objects.select_for_update().filter(dimension=dimension, value__in=values).values('pk'))
+        fresh = compute(_rows(Listing.objects.filter(is_published=True, **{f'{dimension}__in': values}),
+                              dimension), dimension)
+        keep = Q()
+        for stat in fresh:
+            keep |= Q(value=stat.value, listing_type=stat.listing_type)
+        MarketStat.objects.filter(dimension=dimension, value__in=values).exclude(keep).delete()
+        stats.extend(fresh)
+    _save(stats)
+    caching.invalidate('market-stats')
+
+
+def refresh_dirty(batch_size=REFRESH_BATCH):
+    """Recompute the groups marked dirty, a batch at a time; returns the number of groups."""
+    done = 0
+    while groups := set(MarketStat.objects.filter(dirty=True).order_by()
+                        .values_list('dimension', 'value').distinct()[:batch_size]):
+        refresh(groups)
+        done += len(groups)
+    return done
+
+
+# ── Running totals ─────────────────────────────────────────────────────────────
+
+def _adjust(dimension, value, listing_type, n, total, low=None, high=None):
+    """
+    Add ``n`` listings (negative: remove them) with prices summing to ``total``
+    and spanning ``low..high`` to one group. It is marked dirty for
+    ``refresh_dirty()``.
+    """
+    group = MarketStat.objects.filter(dimension=dimension, value=value, listing_type=listing_type)
+    if n < 0 and group.filter(count__lte=-n).delete()[0]:
+        return   # emptied
+    updates = {'count': F('count') + n, 'price_sum': F('price_sum') + total,
+               'mean_price': Cast(F('price_sum') + total, FloatField()) / (F('count') + n),
+               'dirty': True, 'updated_at': timezone.now()}
+    if n > 0:
+        updates.update(min_price=Least(F('min_price'), low), max_price=Greatest(F('max_price'), high))
+    if group.update(**updates) or n < 0:
+        return
+    try:
+        with transaction.atomic():
+            # A new group: exact for one listing; the refresh fills in the rest
+            MarketStat.objects.create(dimension=dimension, value=value, listing_type=listing_type, count=n,
+                                      price_sum=total, min_price=low, max_price=high, mean_price=total / n,
+                                      p25_price=total / n, median_price=total / n, p75_price=total / n,
+                                      dirty=True)
+    except IntegrityError:   # created concurrently
+        group.update(**updates)
+
+
+def apply_totals(rows, sign):
+    """
+    Add (``sign`` 1) or remove (-1) listings in bulk. ``rows`` maps each
+    dimension to grouped rows: the dimension's value and ``listing_type``, with
+    ``n``, ``total``, ``low`` and ``high`` of their prices (see ``totals()``).
+    """
+    for dimension, dimension_rows in rows.items():
+        for row in dimension_rows:
+            _adjust(dimension, row[dimension], row['listing_type'], sign * row['n'], sign * row['total'],
+                    row['low'], row['high'])
+    _changed()
+
+
+def totals(queryset):
+    """``apply_totals()`` rows for the listings in ``queryset``: one grouped query per dimension."""
+    return {dimension: list(queryset.order_by().values(dimension, 'listing_type')
+                            .annotate(n=Count('id'), total=Sum('price'), low=Min('price'), high=Max('price')))
+            for dimension in DIMENSIONS}
+
+
+def record(before=None, after=None):
+    """
+    Account for one listing's write. ``before`` and ``after`` are its ``FIELDS``
+    (a dict or Listing) while published, or ``None`` when it wasn't.
+    """
+    get = lambda values, name: values.get(name) if isinstance(values, dict) else getattr(values, name)
+    if before is None and after is None:
+        return
+    if before is not None and after is not None and all(get(before, f) == get(after, f) for f in FIELDS):
+        return   # e.g. a title edit: no group changes
+    for values, sign in ((before, -1), (after, 1)):
+        if values is not None:
+            price = get(values, 'price')
+            for dimension in DIMENSIONS:
+                _adjust(dimension, get(values, dimension), get(values, 'listing_type'), sign, sign * price,
+                        price, price)
+    _changed()
+
+
+def _changed():
+    caching.invalidate_on_commit('market-stats')
+    background.schedule(refresh_dirty)
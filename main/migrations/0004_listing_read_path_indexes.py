@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-18 00:14
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_alter_contact_unique_together_listing_property_type_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-list_date'], name='listing_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['listing_type', '-list_date'], name='listing_pub_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['property_type', '-list_date'], name='listing_pub_ptype_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.functions.text.Upper('state'), models.OrderBy(models.F('list_date'), descending=True), condition=models.Q(('is_published', True)), name='listing_pub_state_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['price'], name='listing_pub_price_idx'),
+        ),
+    ]
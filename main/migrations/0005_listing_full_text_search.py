@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from main import search
+
+
+def forwards(apps, schema_editor):
+    search.create_schema(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    search.drop_schema(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_listing_read_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_listing_full_text_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_pub_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-list_date', '-id'], name='listing_pub_date_id_idx'),
+        ),
+    ]
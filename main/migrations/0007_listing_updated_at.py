@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    Listing = apps.get_model('main', 'Listing')
+    Listing.objects.update(updated_at=models.F('list_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_listing_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['updated_at'], name='listing_pub_updated_idx'),
+        ),
+    ]
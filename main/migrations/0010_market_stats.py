@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_listing_geo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('city', 'City'), ('state', 'State'), ('property_type', 'Property type')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('listing_type', models.CharField(choices=[('sale', 'For Sale'), ('rent', 'For Rent')], max_length=10)),
+                ('count', models.PositiveIntegerField()),
+                ('min_price', models.IntegerField()),
+                ('max_price', models.IntegerField()),
+                ('mean_price', models.FloatField()),
+                ('p25_price', models.FloatField()),
+                ('median_price', models.FloatField()),
+                ('p75_price', models.FloatField()),
+                ('median_price_per_sqft', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['dimension', 'value', 'listing_type'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value', 'listing_type'), name='marketstat_group_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_contacts(apps, schema_editor):
+    Contact = apps.get_model('main', 'Contact')
+    # Existing inquiries predate notifications; don't email them all now
+    Contact.objects.update(notified_at=models.F('contact_date'))
+    # The exists() check this constraint replaces could race; keep each user's first inquiry
+    first = (Contact.objects.filter(user__isnull=False).values('listing', 'user')
+             .annotate(first=models.Min('id')).values('first'))
+    Contact.objects.filter(user__isnull=False).exclude(id__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_market_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InquiryOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_pk', models.BigIntegerField()),
+                ('name', models.CharField(max_length=200)),
+                ('email', models.CharField(max_length=254)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'inquiry outbox',
+            },
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='notify_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='notify_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='notify_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='contact',
+            name='contact_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['notify_after'], name='contact_notify_pending_idx'),
+        ),
+        migrations.RunPython(backfill_contacts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='contact',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('listing', 'user'), name='contact_listing_user_uniq'),
+        ),
+        migrations.AddField(
+            model_name='inquiryoutbox',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
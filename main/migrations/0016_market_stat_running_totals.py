@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Round
+
+
+def backfill_price_sum(apps, schema_editor):
+    MarketStat = apps.get_model('main', 'MarketStat')
+    MarketStat.objects.update(price_sum=Cast(Round(models.F('mean_price') * models.F('count')),
+                                             models.BigIntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_similar_listings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketstat',
+            name='dirty',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='marketstat',
+            name='price_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_price_sum, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='marketstat',
+            index=models.Index(condition=models.Q(('dirty', True)), fields=['dimension', 'value'], name='marketstat_dirty_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_notify_after(apps, schema_editor):
+    SavedSearchMatch = apps.get_model('main', 'SavedSearchMatch')
+    SavedSearchMatch.objects.filter(notified_at__isnull=True).update(notify_after=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_market_stat_running_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='savedsearchmatch',
+            name='savedsearchmatch_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='savedsearchmatch',
+            name='notify_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='savedsearchmatch',
+            name='notify_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_notify_after, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='savedsearchmatch',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['notify_after'], name='savedsearchmatch_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_saved_search_alert_retries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRefresh',
+            fields=[
+                ('listing_pk', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('moved', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -1,5 +1,13 @@
+from urllib.parse import urlencode
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import geo, images
 
 
 class Realtor(models.Model):
@@ -10,10 +18,18 @@ class Realtor(models.Model):
     email = models.EmailField()
     is_mvp = models.BooleanField(default=False)
     hire_date = models.DateTimeField(auto_now_add=True)
+    # Responsive WebP derivatives, maintained by main/images.py
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    RESPONSIVE_IMAGE_FIELDS = ('photo',)
 
     def __str__(self):
         return self.name
 
+    @property
+    def photo_srcset(self):
+        return images.srcset(self, 'photo')
+
 
 class Listing(models.Model):
     # ── Listing purpose ─────────────────────────────────────
@@ -41,6 +57,8 @@ class Listing(models.Model):
     realtor = models.ForeignKey(Realtor, on_delete=models.SET_NULL, null=True, blank=True)
     posted_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
                                   related_name='listings')
+    # Key of the row in a partner's inventory feed; import_listings upserts on it
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
 
     listing_type = models.CharField(max_length=10, choices=LISTING_TYPE_CHOICES, default=SALE)
     property_type = models.CharField(max_length=20, choices=PROPERTY_TYPE_CHOICES, default=APARTMENT)
@@ -56,20 +74,74 @@ class Listing(models.Model):
     bathrooms = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)
     sqft = models.IntegerField(null=True, blank=True, help_text='Area in sqft or sq.yards for land')
 
+    latitude = models.FloatField(null=True, blank=True,
+                                 validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True,
+                                  validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Grid cell of (latitude, longitude) for radius/bbox search, see main/geo.py
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
+
     description = models.TextField(blank=True)
     photo_main = models.ImageField(upload_to='listings/%Y/%m/', blank=True)
     photo_1 = models.ImageField(upload_to='listings/%Y/%m/', blank=True)
     photo_2 = models.ImageField(upload_to='listings/%Y/%m/', blank=True)
+    # Responsive WebP derivatives, maintained by main/images.py
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_published = models.BooleanField(default=False)
     list_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    RESPONSIVE_IMAGE_FIELDS = ('photo_main', 'photo_1', 'photo_2')
+
+    class Meta:
+        # Every public read path filters on is_published=True and orders by
+        # -list_date, so the indexes are partial on published rows and end in
+        # list_date to let the planner walk them in order (no sort step).
+        indexes = [
+            # id breaks list_date ties for the API's keyset pagination
+            models.Index(fields=['-list_date', '-id'], name='listing_pub_date_id_idx',
+                         condition=Q(is_published=True)),
+            models.Index(fields=['listing_type', '-list_date'], name='listing_pub_type_date_idx',
+                         condition=Q(is_published=True)),
+            models.Index(fields=['property_type', '-list_date'], name='listing_pub_ptype_date_idx',
+                         condition=Q(is_published=True)),
+            # state is matched with __iexact, i.e. UPPER(state) = UPPER(%s) on Postgres
+            models.Index(Upper('state'), models.F('list_date').desc(), name='listing_pub_state_date_idx',
+                         condition=Q(is_published=True)),
+            models.Index(fields=['price'], name='listing_pub_price_idx',
+                         condition=Q(is_published=True)),
+            # max(updated_at) for the API's collection ETag
+            models.Index(fields=['updated_at'], name='listing_pub_updated_idx',
+                         condition=Q(is_published=True)),
+            # geohash range scans prune radius/bbox candidates
+            models.Index(fields=['geohash'], name='listing_pub_geohash_idx',
+                         condition=Q(is_published=True)),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.geohash = self.compute_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+    def compute_geohash(self):
+        """Geohash of the coordinates ('' without them); bulk writes must set it themselves."""
+        if self.latitude is None or self.longitude is None:
+            return ''
+        return geo.encode(self.latitude, self.longitude)
+
     @property
     def price_inr(self):
         return '₹{:,}'.format(self.price)
 
+    @property
+    def photo_main_srcset(self):
+        return images.srcset(self, 'photo_main')
+
     @property
     def type_label(self):
         return 'For Rent' if self.listing_type == self.RENT else 'For Sale'
@@ -85,6 +157,49 @@ class Listing(models.Model):
         return icons.get(self.property_type, 'fas fa-home')
 
 
+class MarketStat(models.Model):
+    """Price statistics of the published listings in one group, maintained by main/market_stats.py."""
+    CITY = 'city'
+    STATE = 'state'
+    PROPERTY_TYPE = 'property_type'
+    DIMENSION_CHOICES = [
+        (CITY, 'City'),
+        (STATE, 'State'),
+        (PROPERTY_TYPE, 'Property type'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=100)
+    # Sale prices and monthly rents are never mixed
+    listing_type = models.CharField(max_length=10, choices=Listing.LISTING_TYPE_CHOICES)
+
+    count = models.PositiveIntegerField()
+    price_sum = models.BigIntegerField(default=0)
+    min_price = models.IntegerField()
+    max_price = models.IntegerField()
+    mean_price = models.FloatField()
+    p25_price = models.FloatField()
+    median_price = models.FloatField()
+    p75_price = models.FloatField()
+    # Over the listings in the group that have an area
+    median_price_per_sqft = models.FloatField(null=True, blank=True)
+    # Count, sum and mean are kept exact by each write; the rest await a refresh
+    dirty = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value', 'listing_type'], name='marketstat_group_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'value'], condition=Q(dirty=True), name='marketstat_dirty_idx'),
+        ]
+        ordering = ['dimension', 'value', 'listing_type']
+
+    def __str__(self):
+        return f'{self.get_dimension_display()} {self.value} ({self.listing_type})'
+
+
 class Contact(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
@@ -92,7 +207,160 @@ class Contact(models.Model):
     email = models.EmailField()
     phone = models.CharField(max_length=20, blank=True)
     message = models.TextField(blank=True)
-    contact_date = models.DateTimeField(auto_now_add=True)
+    # When the inquiry was submitted; rows are written later, by main/inquiries.py
+    contact_date = models.DateTimeField(default=timezone.now)
+    # Email notification to the listing's realtor/poster (main/inquiries.py)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    notify_attempts = models.PositiveSmallIntegerField(default=0)
+    notify_after = models.DateTimeField(default=timezone.now)
+    notify_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # one inquiry per signed-in user and listing
+            models.UniqueConstraint(fields=['listing', 'user'], condition=Q(user__isnull=False),
+                                    name='contact_listing_user_uniq'),
+        ]
+        indexes = [
+            # latest inquiries per listing on the poster dashboard
+            models.Index(fields=['listing', '-contact_date'], name='contact_listing_date_idx'),
+            models.Index(fields=['notify_after'], name='contact_notify_pending_idx',
+                         condition=Q(notified_at__isnull=True)),
+        ]
 
     def __str__(self):
         return f'{self.name} → {self.listing.title}'
+
+
+class InquiryOutbox(models.Model):
+    """A submitted inquiry waiting to become a Contact (see main/inquiries.py)."""
+    # Not a foreign key: the request doesn't look the listing up; the worker does
+    listing_pk = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    name = models.CharField(max_length=200)
+    email = models.CharField(max_length=254)
+    phone = models.CharField(max_length=20, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = 'inquiry outbox'
+
+    def __str__(self):
+        return f'{self.name} → listing {self.listing_pk}'
+
+
+class SavedSearch(models.Model):
+    """A user's ``/search/`` filters, matched against newly published listings (see main/saved_searches.py)."""
+    ANY_PRICE = 2_147_483_647   # no max-price filter; the largest IntegerField value
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    # Normalised search() parameters (saved_searches.normalize), and the same as a query string
+    params = models.JSONField(default=dict)
+    query = models.CharField(max_length=1000, editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # The predicate index, derived from params on save: '' matches any value.
+    # state is upper-cased because search() matches it case-insensitively.
+    state = models.CharField(max_length=100, blank=True, default='', editable=False)
+    listing_type = models.CharField(max_length=10, blank=True, default='', editable=False)
+    property_type = models.CharField(max_length=20, blank=True, default='', editable=False)
+    max_price = models.IntegerField(default=ANY_PRICE, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'query'], name='savedsearch_user_query_uniq'),
+        ]
+        indexes = [
+            # a new listing's candidates: 2 x 2 x 2 key prefixes, each a range scan on max_price
+            models.Index(fields=['state', 'listing_type', 'property_type', 'max_price'],
+                         name='savedsearch_predicate_idx'),
+        ]
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return self.summary
+
+    def save(self, *args, **kwargs):
+        self.set_index_fields()
+        super().save(*args, **kwargs)
+
+    def set_index_fields(self):
+        """Derive ``query`` and the predicate index from ``params``; bulk writes must call it themselves."""
+        self.query = urlencode(sorted(self.params.items()))
+        self.state = self.params.get('state', '').upper()
+        self.listing_type = self.params.get('listing_type', '')
+        self.property_type = self.params.get('property_type', '')
+        self.max_price = min(int(self.params.get('price', self.ANY_PRICE)), self.ANY_PRICE)
+
+    @property
+    def summary(self):
+        """e.g. 'Apartment / Flat for rent in Kochi, Kerala · up to ₹25,000 · 2+ bedrooms'."""
+        p = self.params
+        what = dict(Listing.PROPERTY_TYPE_CHOICES).get(p.get('property_type'), 'Property')
+        if p.get('listing_type'):
+            what += f' for {p["listing_type"]}'
+        where = ', '.join(v for v in (p.get('city'), p.get('state')) if v)
+        parts = [f'{what} in {where}' if where else what]
+        if 'keywords' in p:
+            parts.append(f'"{p["keywords"]}"')
+        if 'price' in p:
+            parts.append(f'up to ₹{int(p["price"]):,}')
+        if 'bedrooms' in p:
+            parts.append(f'{p["bedrooms"]}+ bedrooms')
+        if 'radius' in p:
+            parts.append(f'within {p["radius"]} km')
+        if 'bbox' in p:
+            parts.append('in a map area')
+        return ' · '.join(parts)
+
+
+class SavedSearchMatch(models.Model):
+    """A newly published listing that matched a saved search; waits for the owner's alert email."""
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    # The owner's digest (main/saved_searches.py); a failed send backs off
+    notified_at = models.DateTimeField(null=True, blank=True)
+    notify_attempts = models.PositiveSmallIntegerField(default=0)
+    notify_after = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['saved_search', 'listing'], name='savedsearchmatch_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['notify_after'], name='savedsearchmatch_pending_idx',
+                         condition=Q(notified_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.saved_search} → listing {self.listing_id}'
+
+
+class SimilarListing(models.Model):
+    """One of a published listing's nearest neighbours, kept by main/similar.py."""
+    # The (listing, rank) constraint's index serves the listing page's lookup
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar', db_index=False)
+    neighbour = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'rank'], name='similarlisting_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.listing_id} ~ {self.neighbour_id} (#{self.rank})'
+
+
+class SimilarRefresh(models.Model):
+    """A listing whose ``SimilarListing`` rows wait for main/similar.py's ``refresh_dirty()``."""
+    # Not a foreign key: a deleted listing's referrers are queued, not the listing
+    listing_pk = models.BigIntegerField(primary_key=True)
+    # Its features changed, so other listings may now rank it among their neighbours
+    moved = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'listing {self.listing_pk}{" (moved)" if self.moved else ""}'
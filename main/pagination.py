@@ -0,0 +1,148 @@
+"""
+Pagination helpers that stay cheap on large result sets.
+
+API pages are keyed on ``(list_date, id)`` — or ``(distance, id)`` for radius
+searches — instead of OFFSET, so fetching page 1000 costs the same index range
+scan as page 1 (``ListingCursorPage`` in ``main/api.py``). Cursors are opaque base64 tokens carrying the boundary
+row's key and the direction of travel. ``LookaheadPage`` paginates HTML pages
+without an exact ``COUNT(*)``, and ``EstimatedCountPaginator`` spares the admin
+one by reading the planner's table statistics. Nothing here imports DRF, so
+the HTML views can use it without loading the API stack.
+"""
+import base64
+import json
+import math
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(key, pk, reverse=False):
+    """``key`` is the boundary row's sort value: its ``list_date``, or its ``distance`` (float)."""
+    key = {'d': key.isoformat()} if hasattr(key, 'isoformat') else {'v': float(key)}
+    raw = json.dumps({**key, 'i': pk, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(key, id, reverse)`` or raise ``ValueError``."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        key = parse_datetime(raw['d']) if 'd' in raw else float(raw['v'])
+        if key is None:
+            raise ValueError(token)
+        return key, int(raw['i']), bool(raw.get('r'))
+    except (TypeError, KeyError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(token) from exc
+
+
+class LookaheadPage:
+    """
+    A page of results that never issues an unbounded ``COUNT(*)``.
+
+    ``per_page + 1`` rows are fetched to learn whether a next page exists, and
+    the total is counted only up to ``count_cap`` (shown as e.g. "1,000+").
+    Page numbers past the last page are clamped to it, as ``Paginator.get_page``
+    does; counting them costs one bounded count.
+    Exposes the subset of Django's ``Page`` API the templates use.
+    """
+
+    def __init__(self, queryset, number, per_page, count_cap=1000):
+        try:
+            self.number = min(max(1, int(number)), count_cap // per_page + 1)
+        except (TypeError, ValueError):
+            self.number = 1
+        rows = self._fetch(queryset, per_page)
+        count = None
+        if not rows and self.number > 1:
+            # Past the last page: the results end before the offset, so within the cap
+            count = queryset[:count_cap + 1].count()
+            self.number = max(1, math.ceil(count / per_page))
+            rows = self._fetch(queryset, per_page) if count else []
+        self.object_list = rows[:per_page]
+        self._has_next = len(rows) > per_page
+        if count is not None:
+            self.count = count
+        elif self.number == 1 and not self._has_next:
+            self.count = len(self.object_list)
+        else:
+            self.count = queryset[:count_cap + 1].count()   # bounded subquery count
+        self.count_capped = self.count > count_cap
+        self.count = min(self.count, count_cap)
+
+    def _fetch(self, queryset, per_page):
+        offset = (self.number - 1) * per_page
+        return list(queryset[offset:offset + per_page + 1])
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def count_label(self):
+        return '{:,}{}'.format(self.count, '+' if self.count_capped else '')
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def estimated_count(model, using='default'):
+    """
+    ``model``'s row count as of the last ``ANALYZE``: ``pg_class.reltuples`` on
+    PostgreSQL, ``sqlite_stat1`` on SQLite. ``None`` when the table was never
+    analyzed or the backend keeps no such statistics.
+    """
+    conn = connections[using]
+    table = model._meta.db_table
+    try:
+        with conn.cursor() as cursor:
+            if conn.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            elif conn.vendor == 'sqlite':
+                # One row per index, led by its row count; partial indexes hold fewer rows
+                cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:   # sqlite_stat1 only exists once ANALYZE has run
+        return None
+    if row is None or row[0] is None:
+        return None
+    return row[0] if row[0] >= 0 else None   # reltuples is -1 until the first ANALYZE
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    ``Paginator`` whose count of an unfiltered queryset on a big table comes
+    from ``estimated_count()`` instead of a ``COUNT(*)`` that scans it.
+    Filtered querysets, and tables under ``estimate_above`` rows, are counted
+    exactly.
+    """
+
+    estimate_above = 100_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if isinstance(qs, QuerySet) and not qs.query.where:
+            estimate = estimated_count(qs.model, qs.db)
+            if estimate is not None and estimate > self.estimate_above:
+                return estimate
+        return super().count
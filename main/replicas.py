@@ -0,0 +1,180 @@
+"""
+Read replicas: ``DATABASE_REPLICA_URLS`` adds one ``replicaN`` database per URL
+(``config/settings.py``), and ``ReplicaRouter`` sends reads there, writes to
+the primary (``default``).
+
+Reads leave the primary only inside a request that opted in.
+``ReplicaRoutingMiddleware`` opens a ``Route`` to one randomly chosen replica
+for GET/HEAD/OPTIONS requests. Everything else reads from the primary: other
+requests, management commands, the inquiry and image workers. A job that reads
+then writes therefore never acts on rows a replica hasn't caught up with yet.
+Within a routed request:
+
+* the first write pins the rest of the request to the primary. The signal
+  handlers and ``on_commit`` refreshes read what was just written;
+* reads inside a transaction stay on the primary;
+* read-your-writes across requests: a request that wrote sets the
+  ``PIN_COOKIE`` for ``REPLICA_STICKY_SECONDS``. During that window, that
+  browser's requests read from the primary. So after ``post_listing`` or
+  ``contact`` redirects to the dashboard or the listing page, the user sees
+  their own rows however far the replicas lag. It covers signing in too,
+  which writes the session.
+
+Shared caches outlive the request and its route. Their entries
+(``caching.get_or_build_many``) are built inside ``primary()``: an entry built
+from a lagging replica would be stored under the generation its write had
+already bumped, and served to the writer's pinned requests as well.
+
+Streamed bodies (the export) keep the request's route while they generate.
+Migrations only run on the primary; replication copies the schema. Locally,
+two SQLite files can stand in for a primary and its replica, with
+``manage.py sync_sqlite_replicas`` as the replication (``--loop`` for lag).
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current = ContextVar('replica_route', default=None)
+
+
+class Route:
+    """Where the current request reads from: ``replica`` (an alias), or the primary once it is ``None``."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def current():
+    """The current request's ``Route``, or ``None`` outside a routed request."""
+    return _current.get()
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, whatever the request's route."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def pinned(request):
+    """Whether ``request`` falls in its browser's read-your-writes window."""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        route = _current.get()
+        if route is None or route.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return route.replica
+
+    def db_for_write(self, model, **hints):
+        if route := _current.get():
+            route.replica = None
+            route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every database holds the same rows
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in settings.REPLICA_DATABASES else None
+
+
+# ── Middleware ─────────────────────────────────────────────────────────────────
+
+def _stream(chunks, route):
+    # Queries made while the body is generated follow the request's route
+    it = iter(chunks)
+    while True:
+        token = _current.set(route)
+        try:
+            chunk = next(it)
+        except StopIteration:
+            break
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+async def _astream(chunks, route):
+    it = aiter(chunks)
+    while True:
+        token = _current.set(route)
+        try:
+            chunk = await anext(it)
+        except StopAsyncIteration:
+            break
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _route(self, request):
+        if request.method in SAFE_METHODS and not pinned(request):
+            return Route(random.choice(settings.REPLICA_DATABASES))
+        return Route(None)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        route = self._route(request)
+        token = _current.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(response, route)
+
+    async def __acall__(self, request):
+        route = self._route(request)
+        token = _current.set(route)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(response, route)
+
+    def _finish(self, response, route):
+        if route.wrote:
+            sticky = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{time.time() + sticky:.3f}', max_age=math.ceil(sticky),
+                                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+        if response.streaming:
+            stream = _astream if response.is_async else _stream
+            response.streaming_content = stream(response.streaming_content, route)
+        return response
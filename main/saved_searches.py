@@ -0,0 +1,223 @@
+"""
+Saved searches: a user's ``/search/`` filters, matched against each newly
+published listing so they don't have to keep re-running the search.
+
+Running every saved query against every new listing would cost one query per
+saved search. Instead each ``SavedSearch`` row splits its filters in two:
+
+* the predicate index: ``state``, ``listing_type``, ``property_type`` ('' for
+  any) and ``max_price`` (``ANY_PRICE`` for any), behind one composite B-tree.
+  A listing's candidates come from one lookup: ``state IN (S, '') AND
+  listing_type IN (T, '') AND property_type IN (P, '') AND max_price >= price``,
+  i.e. 8 range scans, whose cost depends on the matches, not the table;
+* the other filters (city, keywords, bedrooms, radius/bbox) stay in
+  ``params`` and are checked in Python, for the candidates only. They mirror
+  ``search()`` and ``geo.filter_queryset``.
+
+Publishing a listing (Listing signals, the admin's publish action,
+``import_listings``) calls ``listings_published()``. Once the transaction
+commits, ``match()`` queues one ``SavedSearchMatch`` per hit. Listings in the
+same state/type/property-type bucket share one candidate query.
+``notify()`` (``manage.py send_saved_search_alerts``) emails each user one
+digest of their queued matches. A failed digest is retried with the inquiry
+emails' backoff (``notify_after``), so it never holds up the users behind it.
+"""
+import logging
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from . import facets, geo, search
+from .inquiries import MAX_ATTEMPTS, retry_delay
+from .models import Listing, SavedSearch, SavedSearchMatch
+
+logger = logging.getLogger(__name__)
+
+# The search() parameters a saved search keeps
+PARAMS = ('keywords', 'city', 'state', 'property_type', 'listing_type', 'price', 'bedrooms',
+          'lat', 'lng', 'radius', 'bbox')
+MAX_PER_USER = 25
+MATCH_CHUNK = 1000     # listings loaded per pass of match()
+BATCH_SIZE = 100       # users emailed per notify() pass
+DIGEST_LISTINGS = 10   # listings spelled out per digest; the rest are counted
+
+LISTING_FIELDS = ('id', 'posted_by_id', 'state', 'listing_type', 'property_type', 'price', 'city', 'bedrooms',
+                  'latitude', 'longitude', 'title', 'description', 'address')
+
+
+# ── Saving ─────────────────────────────────────────────────────────────────────
+
+def normalize(query):
+    """
+    The filters of a ``/search/`` query (a QueryDict) as ``{name: str}``.
+    Empty and malformed values are dropped, as ``search()`` ignores them.
+    """
+    raw = {name: (query.get(name) or '').strip() for name in PARAMS}
+    params = {name: str(value) for name, value in facets.selection(
+        state=raw['state'], property_type=raw['property_type'], listing_type=raw['listing_type'],
+        price=raw['price']).items()}
+    if terms := search._terms(raw['keywords']):
+        params['keywords'] = ' '.join(terms)
+    if raw['city']:
+        params['city'] = raw['city']
+    if raw['bedrooms'].isdigit():
+        params['bedrooms'] = str(int(raw['bedrooms']))
+    if geo.parse_radius(raw):
+        params.update(lat=raw['lat'], lng=raw['lng'], radius=raw['radius'])
+    if geo.parse_bbox(raw['bbox']):
+        params['bbox'] = raw['bbox']
+    return params
+
+
+def save(user, query):
+    """Save the filters of ``query`` for ``user``; returns ``(saved_search, created)``."""
+    params = normalize(query)
+    if not params:
+        raise ValueError('Pick at least one filter to save a search.')
+    existing = SavedSearch.objects.filter(user=user, query=urlencode(sorted(params.items()))).first()
+    if existing:
+        return existing, False
+    if SavedSearch.objects.filter(user=user).count() >= MAX_PER_USER:
+        raise ValueError(f'You can keep up to {MAX_PER_USER} saved searches; delete one first.')
+    return SavedSearch.objects.create(user=user, params=params), True
+
+
+# ── Matching ───────────────────────────────────────────────────────────────────
+
+def residual(params):
+    """The filters the predicate index doesn't cover, as ``test(listing)``, or ``None`` if there are none."""
+    tests = []
+    if city := params.get('city', '').lower():
+        tests.append(lambda listing: city in listing['city'].lower())
+    if 'bedrooms' in params:
+        bedrooms = int(params['bedrooms'])
+        tests.append(lambda listing: listing['bedrooms'] is not None and listing['bedrooms'] >= bedrooms)
+    if keywords := params.get('keywords'):
+        tests.append(lambda listing: search.matches(keywords, listing['words']))
+    if point := geo.point_filter(params):
+        tests.append(lambda listing: point(listing['latitude'], listing['longitude']))
+    if not tests:
+        return None
+    return lambda listing: all(test(listing) for test in tests)
+
+
+def candidates(state, listing_type, property_type, price):
+    """Saved searches whose indexed filters accept a listing with these values."""
+    return SavedSearch.objects.filter(state__in=['', state.upper()], listing_type__in=['', listing_type],
+                                      property_type__in=['', property_type], max_price__gte=price)
+
+
+def _match_bucket(key, listings):
+    # One candidate query for every listing in the bucket, from the cheapest price up
+    listings.sort(key=lambda listing: listing['price'])
+    rows = (candidates(*key, listings[0]['price']).order_by()
+            .values_list('id', 'user_id', 'max_price', 'params').iterator(chunk_size=2000))
+    found = []
+    for search_id, user_id, max_price, params in rows:
+        test = residual(params)
+        for listing in listings:
+            if listing['price'] > max_price:
+                break
+            if listing['posted_by_id'] != user_id and (test is None or test(listing)):
+                found.append(SavedSearchMatch(saved_search_id=search_id, listing_id=listing['id']))
+    return found
+
+
+def match(listing_ids):
+    """Queue a ``SavedSearchMatch`` for every saved search each published listing satisfies; returns the count."""
+    listing_ids = list(listing_ids)
+    queued = 0
+    for start in range(0, len(listing_ids), MATCH_CHUNK):
+        buckets = defaultdict(list)
+        for listing in Listing.objects.filter(pk__in=listing_ids[start:start + MATCH_CHUNK],
+                                              is_published=True).values(*LISTING_FIELDS):
+            listing['words'] = search.words(listing['title'], listing['description'], listing['address'],
+                                            listing['city'])
+            buckets[listing['state'].upper(), listing['listing_type'], listing['property_type']].append(listing)
+        found = [m for key, listings in buckets.items() for m in _match_bucket(key, listings)]
+        SavedSearchMatch.objects.bulk_create(found, ignore_conflicts=True, batch_size=1000)
+        queued += len(found)
+    return queued
+
+
+def listings_published(pks):
+    """Match listings that just went live once the current transaction commits."""
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: match(pks))
+
+
+# ── Alerts ─────────────────────────────────────────────────────────────────────
+
+def build_digest(user, matches, connection=None):
+    by_search = defaultdict(list)
+    for m in matches:
+        by_search[m.saved_search].append(m.listing)
+    lines = []
+    for saved_search, listings in by_search.items():
+        lines.append(f'{saved_search.summary}:')
+        for listing in listings[:DIGEST_LISTINGS]:
+            lines.append(f'  {listing.title}, {listing.city} - {listing.price_inr}'
+                         f'{"/mo" if listing.listing_type == Listing.RENT else ""}\n'
+                         f'  {settings.SITE_URL}/listings/{listing.pk}/')
+        if len(listings) > DIGEST_LISTINGS:
+            lines.append(f'  ...and {len(listings) - DIGEST_LISTINGS} more: '
+                         f'{settings.SITE_URL}/search/?{saved_search.query}')
+        lines.append('')
+    n = len({m.listing_id for m in matches})   # a listing can match several searches
+    return EmailMessage(subject=f'{n} new propert{"y" if n == 1 else "ies"} for your saved searches',
+                        body=f'Hi {user.first_name or user.username},\n\n' + '\n'.join(lines),
+                        to=[user.email], connection=connection)
+
+
+def notify(batch_size=BATCH_SIZE):
+    """
+    Email up to ``batch_size`` due users a digest of their queued matches,
+    longest-waiting first; returns ``(sent, failed, dropped)``. ``dropped``
+    counts the users with nothing to send: no email address, or only listings
+    unpublished since. A failed digest backs its matches off like an inquiry's
+    notification (``inquiries.retry_delay``) and gives up on them after
+    ``MAX_ATTEMPTS``.
+    """
+    now = timezone.now()
+    pending = SavedSearchMatch.objects.filter(notified_at__isnull=True, notify_attempts__lt=MAX_ATTEMPTS)
+    users = list(pending.filter(notify_after__lte=now).values('saved_search__user')
+                 .annotate(due=Min('notify_after')).order_by('due', 'saved_search__user')
+                 .values_list('saved_search__user', flat=True)[:batch_size])
+    if not users:
+        return 0, 0, 0
+    # Listings unpublished since they matched aren't worth an email
+    pending.filter(saved_search__user__in=users, listing__is_published=False).update(notified_at=now)
+    by_user = defaultdict(list)
+    for m in (pending.filter(saved_search__user__in=users)
+              .select_related('saved_search__user', 'listing').order_by('saved_search', '-listing__list_date')):
+        by_user[m.saved_search.user].append(m)
+    sent, failed, done = 0, [], []
+    connection = get_connection()
+    try:
+        for user, matches in by_user.items():
+            try:
+                if user.email:   # nowhere to send: drop the matches
+                    connection.open()
+                    build_digest(user, matches, connection).send()
+                    sent += 1
+            except Exception as exc:
+                attempts = max(m.notify_attempts for m in matches) + 1
+                failed.append((user.pk, max(m.pk for m in matches), attempts))
+                logger.warning('Saved-search alert for user %s failed (attempt %s): %s', user.pk, attempts, exc)
+            else:
+                done.append((user.pk, max(m.pk for m in matches)))
+    finally:
+        connection.close()
+    # Up to the last match read, so one queued meanwhile waits for the next digest
+    for user_pk, last in done:
+        pending.filter(saved_search__user=user_pk, pk__lte=last).update(notified_at=timezone.now())
+    for user_pk, last, attempts in failed:
+        pending.filter(saved_search__user=user_pk, pk__lte=last).update(
+            notify_attempts=attempts, notify_after=now + retry_delay(attempts))
+    return sent, len(failed), len(users) - sent - len(failed)
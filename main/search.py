@@ -0,0 +1,179 @@
+"""
+Full-text search over Listing (title, description, address, city).
+
+Production (PostgreSQL) keeps a weighted ``tsvector`` column on ``main_listing``
+behind a GIN index; local DEBUG (SQLite) keeps an FTS5 table keyed by listing id.
+Neither structure is a model field — both are created by migration 0005 and kept
+in sync by the Listing save/delete signals (see ``main/signals.py``).
+Any other backend, or an SQLite build without FTS5, falls back to ``icontains``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'main_listing_fts'
+MAX_TERMS = 8
+
+# title > city/address > description
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(address, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+FTS5_WEIGHTS = '10.0, 2.0, 4.0, 4.0'  # title, description, address, city
+
+
+def _terms(text):
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+_fts5_databases = {}   # (alias, NAME) -> whether the FTS5 table exists
+
+
+def _key(conn):
+    return conn.alias, str(conn.settings_dict['NAME'])
+
+
+def backend(conn=None):
+    """Return 'postgresql', 'sqlite' or None (no full-text support)."""
+    conn = conn or connection
+    if conn.vendor == 'postgresql':
+        return 'postgresql'
+    if conn.vendor == 'sqlite':
+        key = _key(conn)
+        if key not in _fts5_databases:
+            # A query: async views build their filters in a thread (see main/api.py)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fts5_databases[key] = cursor.fetchone() is not None
+        if _fts5_databases[key]:
+            return 'sqlite'
+    return None
+
+
+# ── Schema (called from migrations) ─────────────────────────────────────────────
+
+def create_schema(schema_editor):
+    conn = schema_editor.connection
+    _fts5_databases.pop(_key(conn), None)   # asked again after the migration
+    if conn.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE main_listing ADD COLUMN IF NOT EXISTS search_vector tsvector')
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS listing_search_vector_idx '
+                              'ON main_listing USING GIN (search_vector)')
+    elif conn.vendor == 'sqlite':
+        try:
+            schema_editor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                                  f'USING fts5(title, description, address, city, prefix=\'2 3\')')
+        except Exception:
+            return  # SQLite compiled without FTS5 — search falls back to icontains
+    rebuild_index(conn)
+
+
+def drop_schema(schema_editor):
+    conn = schema_editor.connection
+    _fts5_databases.pop(_key(conn), None)
+    if conn.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS listing_search_vector_idx')
+        schema_editor.execute('ALTER TABLE main_listing DROP COLUMN IF EXISTS search_vector')
+    elif conn.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+# ── Index maintenance ───────────────────────────────────────────────────────────
+
+def rebuild_index(conn=None):
+    """Recompute the search data for every listing (backfill / after bulk loads)."""
+    conn = conn or connection
+    kind = backend(conn)
+    with conn.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(f'UPDATE main_listing SET search_vector = {PG_VECTOR_SQL}')
+        elif kind == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, title, description, address, city) '
+                           f'SELECT id, title, description, address, city FROM main_listing')
+
+
+def update_listing(pk):
+    """Re-index a single listing after it was saved."""
+    kind = backend()
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(f'UPDATE main_listing SET search_vector = {PG_VECTOR_SQL} WHERE id = %s', [pk])
+        elif kind == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, title, description, address, city) '
+                           f'SELECT id, title, description, address, city FROM main_listing WHERE id = %s', [pk])
+
+
+def update_listings(pks):
+    """Re-index a batch of listings in one statement per backend (bulk imports)."""
+    pks = list(pks)
+    kind = backend()
+    if not pks or kind is None:
+        return
+    marks = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(f'UPDATE main_listing SET search_vector = {PG_VECTOR_SQL} WHERE id IN ({marks})', pks)
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})', pks)
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, title, description, address, city) '
+                           f'SELECT id, title, description, address, city FROM main_listing WHERE id IN ({marks})',
+                           pks)
+
+
+def remove_listing(pk):
+    if backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+# ── Querying ────────────────────────────────────────────────────────────────────
+
+def search_listings(qs, text, ranked=True):
+    """
+    Filter ``qs`` to listings matching every word of ``text`` (each word also
+    matches as a prefix) and order by relevance, newest first on ties.
+    With ``ranked=False`` only the filter is applied and ``qs`` keeps its order.
+    Returns ``qs`` unchanged when ``text`` has no searchable words.
+    """
+    terms = _terms(text)
+    if not terms:
+        return qs
+    kind = backend()
+    if kind == 'postgresql':
+        tsquery = ' & '.join(f'{t}:*' for t in terms)
+        match = RawSQL("main_listing.search_vector @@ to_tsquery('simple', %s)", [tsquery],
+                       output_field=BooleanField())
+        rank = RawSQL("ts_rank(main_listing.search_vector, to_tsquery('simple', %s))", [tsquery],
+                      output_field=FloatField())
+    elif kind == 'sqlite':
+        fts_query = ' '.join(f'"{t}"*' for t in terms)
+        match = RawSQL(f'main_listing.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+                       [fts_query], output_field=BooleanField())
+        # bm25() is lower-is-better, so negate it to get a "higher is more relevant" rank
+        rank = RawSQL(f'(SELECT -bm25({FTS_TABLE}, {FTS5_WEIGHTS}) FROM {FTS_TABLE} '
+                      f'WHERE {FTS_TABLE} MATCH %s AND rowid = main_listing.id)',
+                      [fts_query], output_field=FloatField())
+    else:
+        for t in terms:
+            qs = qs.filter(Q(title__icontains=t) | Q(description__icontains=t) |
+                           Q(address__icontains=t) | Q(city__icontains=t))
+        return qs.order_by('-list_date') if ranked else qs
+    if not ranked:
+        return qs.filter(match)
+    return qs.filter(match).annotate(search_rank=rank).order_by('-search_rank', '-list_date')
+
+
+def words(*texts):
+    """The searchable words of a listing's title, description, address and city."""
+    return set(re.findall(r'\w+', ' '.join(t or '' for t in texts).lower()))
+
+
+def matches(text, listing_words):
+    """``search_listings()``'s filter for one listing's ``words()``: every word of ``text`` as a prefix."""
+    return all(any(word.startswith(term) for word in listing_words) for term in _terms(text))
@@ -0,0 +1,65 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, images, market_stats, saved_searches, search, similar
+from .models import Listing, Realtor
+
+
+@receiver(pre_save, sender=Listing)
+def listing_remember_stat_groups(sender, instance, raw=False, **kwargs):
+    # The row as it counted in the market stats before this save (it may move
+    # out of its groups) and its similarity features (an edit that keeps them
+    # needs no refresh)
+    instance._stats_before = None
+    instance._similar_before = None
+    if not raw and instance.pk:
+        before = (Listing.objects.filter(pk=instance.pk, is_published=True)
+                  .values(*{*market_stats.FIELDS, *similar.FIELDS}).first())
+        if before:
+            instance._stats_before = before
+            instance._similar_before = similar.features_of(before)
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.update_listing(instance.pk)
+        images.schedule(instance)
+        market_stats.record(before=instance._stats_before, after=instance if instance.is_published else None)
+        if instance.is_published and instance._stats_before is None:
+            saved_searches.listings_published([instance.pk])
+        if instance.is_published and instance._similar_before == similar.features_of(instance):
+            similar.touch_referrers([instance.pk])   # same neighbours; their pages show its card
+        else:
+            similar.mark_dirty([instance.pk])
+    caching.invalidate_on_commit('home', 'facets')
+
+
+@receiver(pre_delete, sender=Listing)
+def listing_deleting(sender, instance, **kwargs):
+    # Rows naming it as a neighbour cascade away with it, so find their listings first
+    similar.mark_dirty(stale=similar.referrers([instance.pk]))
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    search.remove_listing(instance.pk)
+    if instance.is_published:
+        market_stats.record(before=instance)
+    caching.invalidate_on_commit('home', 'facets')
+
+
+@receiver([post_save, pre_delete], sender=Realtor)
+def realtor_touch_listings(sender, instance, raw=False, **kwargs):
+    # Listing pages and API rows embed realtor details, so bump their versions
+    # (ETags); pre_delete because SET_NULL detaches the listings on delete.
+    if not raw:
+        Listing.objects.filter(realtor=instance).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Realtor)
+def realtor_changed(sender, instance, raw=False, **kwargs):
+    if kwargs['signal'] is post_save and not raw:
+        images.schedule(instance)
+    caching.invalidate_on_commit('home')
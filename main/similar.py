@@ -0,0 +1,311 @@
+"""
+"Similar properties" for the listing page, precomputed into ``SimilarListing``.
+
+Every published listing keeps its ``K`` nearest published neighbours of the
+same listing type, since sale and rent prices aren't comparable. The page
+reads them with one lookup on the ``(listing, rank)`` index instead of running
+a similarity query per view.
+
+The distance is Euclidean over fixed-scale features:
+
+* price and sqft as log2, so doubling either one is a step of 1;
+* bedrooms and bathrooms at ``SCALE`` per room;
+* property_type and city as one-hot columns: a mismatch costs ``MISMATCH``.
+  They are compared as integer codes rather than materialised.
+
+A missing sqft costs ``MISSING``. No scale depends on the other listings, so
+an incremental refresh gives the same rows as a full rebuild.
+
+Maintenance:
+
+* ``rebuild()`` (``manage.py rebuild_similar_listings``, imports) recomputes
+  every row. Distances are computed with NumPy for a chunk of listings against
+  the whole pool at once, and the top ``K`` of each row are picked with
+  ``argpartition``.
+* The Listing signals and the admin's publish actions call ``mark_dirty()``
+  with the listings that changed. It queues them in ``SimilarRefresh`` (an
+  INSERT, in the writing transaction), and after the commit
+  ``refresh_dirty()`` runs on the ``REFRESH_WORKER`` (main/background.py): a
+  refresh loads a whole pool, so it stays off the request path and one pass
+  covers a burst of edits. ``refresh()`` recomputes only the affected rows. Those are the changed listings themselves, the listings that
+  had one of them as a neighbour, and the listings where one of them now beats
+  the current ``K``-th neighbour. Distance is symmetric, so that last check
+  needs only the changed listings' rows of the distance matrix.
+* A listing page embeds its neighbours' cards. Listings whose neighbours
+  changed, or whose neighbours were edited, get ``updated_at`` bumped, as
+  ``realtor_touch_listings`` does for realtors, so the page ETag changes. The
+  refresh runs after the edit's commit, so it bumps the edited listing too
+  when its own neighbours change.
+"""
+import itertools
+
+from django.db import transaction
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from . import background
+from .models import Listing, SimilarListing, SimilarRefresh
+
+K = 6                        # neighbours stored per listing
+SHOWN = 3                    # shown on the listing page
+CHUNK_ELEMENTS = 4_000_000   # distance-matrix cells computed at once
+REFRESH_BATCH = 5000         # queued listings per refresh_dirty() pass
+
+SCALE = {'price': 1.0, 'sqft': 1.0, 'bedrooms': 0.5, 'bathrooms': 0.5}
+MISMATCH = {'property_type': 1.5, 'city': 1.0}
+MISSING = 1.0
+FEATURES = (*SCALE, *MISMATCH)
+FIELDS = ('listing_type', *FEATURES)   # the pool and the features: what an edit must keep to keep the rows
+
+
+def features_of(values):
+    """The ``FIELDS`` of a listing (a dict or Listing), to tell whether an edit moves it."""
+    get = values.get if isinstance(values, dict) else lambda name: getattr(values, name)
+    return tuple(get(name) for name in FIELDS)
+
+
+# ── Vectorised distances ───────────────────────────────────────────────────────
+
+def vectors(rows):
+    """
+    ``(left, right, codes)`` arrays for ``FEATURES`` rows. ``left[i] @ right[j]``
+    is the numeric part of the squared distance between rows i and j, so a
+    chunk's distances are one matrix product. ``codes`` holds one integer code
+    per category column.
+
+    Per numeric column, with ``p`` 1 where the value ``v`` is present (``v`` is 0
+    where it isn't):
+
+        p_i p_j (v_i - v_j)^2 + (1 - p_i p_j) MISSING^2
+            = v_i^2 p_j + p_i v_j^2 - 2 v_i v_j + MISSING^2 - MISSING^2 p_i p_j
+    """
+    import numpy as np
+
+    if not rows:
+        width = 4 * len(SCALE) + 1
+        return np.empty((0, width)), np.empty((0, width)), np.empty((0, len(MISMATCH)), dtype=np.int64)
+    price, sqft, bedrooms, bathrooms, *categories = zip(*rows)
+    numeric = np.column_stack([
+        np.log2(np.maximum(np.array(price, dtype=np.float64), 1)),
+        np.log2(np.array([s if s and s > 0 else np.nan for s in sqft], dtype=np.float64)),
+        np.array([b or 0 for b in bedrooms], dtype=np.float64),
+        np.array([float(b or 0) for b in bathrooms], dtype=np.float64),
+    ]) * np.array(list(SCALE.values()))
+    present = ~np.isnan(numeric)
+    v = np.where(present, numeric, 0.0)
+    p = present.astype(np.float64)
+    ones = np.ones((len(v), 1))
+    left = np.hstack([v ** 2, p, -2 * v, -MISSING ** 2 * p, ones])
+    right = np.hstack([p, v ** 2, v, p, np.full((len(v), 1), MISSING ** 2 * len(SCALE))])
+    codes = np.column_stack([
+        np.unique([str(value).strip().lower() for value in column], return_inverse=True)[1].ravel()
+        for column in categories
+    ])
+    return left, right, codes
+
+
+def squared_distances(rows, left, right, codes):
+    """Squared distances from the pool rows ``rows`` (indices) to every row of the pool."""
+    import numpy as np
+
+    d2 = left[rows] @ right.T
+    np.maximum(d2, 0, out=d2)   # rounding can take identical rows just below zero
+    for j, weight in enumerate(MISMATCH.values()):
+        np.add(d2, weight ** 2, out=d2, where=np.not_equal.outer(codes[rows, j], codes[:, j]))
+    d2[np.arange(len(rows)), rows] = np.inf   # a listing isn't its own neighbour
+    return d2
+
+
+def _chunks(rows, pool_size):
+    """``rows`` split so each chunk's distance matrix stays within ``CHUNK_ELEMENTS``."""
+    step = max(1, CHUNK_ELEMENTS // max(pool_size, 1))
+    for start in range(0, len(rows), step):
+        yield rows[start:start + step]
+
+
+def _top(d2, candidates, ids, k):
+    """The ``k`` nearest of each row of ``d2`` (columns: the pool rows ``candidates``), sorted by (distance, id)."""
+    import numpy as np
+
+    top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    top_d2 = np.take_along_axis(d2, top, axis=1)
+    top = candidates[top]
+    order = np.lexsort((ids[top], top_d2), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_d2, order, axis=1)
+
+
+def nearest(rows, ids, left, right, codes):
+    """
+    Yield unsaved ``SimilarListing`` rows for the pool rows ``rows``, nearest first (ties by id).
+
+    Listings differing in any category are at least ``min(MISMATCH)`` apart. So
+    each row is first ranked within its block (the rows sharing every category);
+    if its ``k``-th neighbour there is closer than that, no other row can get in.
+    Only the rest are ranked against the whole pool.
+    """
+    import numpy as np
+
+    k = min(K, len(ids) - 1)
+    if k < 1:
+        return
+    rows = np.asarray(rows, dtype=np.int64)
+    bound = min(MISMATCH.values()) ** 2
+    _, block = np.unique(codes, axis=0, return_inverse=True)
+    block = block.ravel()
+    pool = np.argsort(block, kind='stable')   # grouped by block, in row order within one
+    starts = np.searchsorted(block[pool], np.arange(block.max() + 2))
+    rows = rows[np.argsort(block[rows], kind='stable')]
+    row_starts = np.searchsorted(block[rows], np.arange(block.max() + 2))
+    found, rest = [], []
+    for b in np.unique(block[rows]):
+        members = pool[starts[b]:starts[b + 1]]
+        targets = rows[row_starts[b]:row_starts[b + 1]]
+        if len(members) <= k:
+            rest.append(targets)
+            continue
+        for chunk in _chunks(targets, len(members)):
+            d2 = left[chunk] @ right[members].T
+            np.maximum(d2, 0, out=d2)
+            d2[np.arange(len(chunk)), np.searchsorted(members, chunk)] = np.inf
+            top, top_d2 = _top(d2, members, ids, k)
+            inside = top_d2[:, -1] < bound
+            found.append((chunk[inside], top[inside], top_d2[inside]))
+            rest.append(chunk[~inside])
+    for chunk in _chunks(np.concatenate(rest) if rest else rows[:0], len(ids)):
+        found.append((chunk, *_top(squared_distances(chunk, left, right, codes), np.arange(len(ids)), ids, k)))
+    for chunk, top, top_d2 in found:
+        distance = np.sqrt(top_d2)
+        for i, row in enumerate(chunk):
+            for rank in range(k):
+                yield SimilarListing(listing_id=int(ids[row]), neighbour_id=int(ids[top[i, rank]]),
+                                     rank=rank, distance=float(distance[i, rank]))
+
+
+def _pool(listing_type, with_kth=False):
+    """
+    ``(ids, left, right, codes, kth)`` for the published listings of ``listing_type``;
+    ``kth`` is each one's stored ``K``-th neighbour distance (inf if it has fewer).
+    """
+    import numpy as np
+
+    qs = Listing.objects.filter(is_published=True, listing_type=listing_type).order_by('id')
+    fields = ['id', *FEATURES]
+    if with_kth:
+        qs = qs.annotate(kth=FilteredRelation('similar', condition=Q(similar__rank=K - 1)))
+        fields.append('kth__distance')
+    rows = list(qs.values_list(*fields))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    left, right, codes = vectors([row[1:1 + len(FEATURES)] for row in rows])
+    kth = np.array([row[-1] if with_kth and row[-1] is not None else np.inf for row in rows], dtype=np.float64)
+    return ids, left, right, codes, kth
+
+
+# ── Full and incremental refresh ───────────────────────────────────────────────
+
+def _save(rows, batch_size=2000):
+    """Insert ``rows`` (any iterable) a batch at a time; returns ``{listing_id: [neighbour_id, ...]}``."""
+    saved, rows = {}, iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        SimilarListing.objects.bulk_create(batch)
+        for row in batch:
+            saved.setdefault(row.listing_id, []).append(row.neighbour_id)
+    return saved
+
+
+def _touch(pks, batch_size=5000):
+    pks, now = list(pks), timezone.now()
+    for start in range(0, len(pks), batch_size):
+        Listing.objects.filter(pk__in=pks[start:start + batch_size]).update(updated_at=now)
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every listing's neighbours; returns the number of rows."""
+    before = {}
+    for listing_id, neighbour_id in SimilarListing.objects.order_by('listing', 'rank').values_list(
+            'listing_id', 'neighbour_id').iterator(chunk_size=10000):
+        before.setdefault(listing_id, []).append(neighbour_id)
+    SimilarListing.objects.all().delete()
+    SimilarRefresh.objects.all().delete()   # covered by this rebuild
+    after = {}
+    for listing_type, _ in Listing.LISTING_TYPE_CHOICES:
+        ids, left, right, codes, _ = _pool(listing_type)
+        after.update(_save(nearest(range(len(ids)), ids, left, right, codes)))
+    _touch([pk for pk in after if after[pk] != before.get(pk)])
+    return sum(len(neighbours) for neighbours in after.values())
+
+
+@transaction.atomic
+def refresh(changed, stale=()):
+    """
+    Recompute the rows the ``changed`` listings affect (see the module
+    docstring) and those of the ``stale`` listings; returns their count.
+    """
+    import numpy as np
+
+    changed = set(changed)
+    affected = changed | set(stale) | set(referrers(changed))
+    live = dict(Listing.objects.filter(pk__in=affected, is_published=True).values_list('pk', 'listing_type'))
+    rows = []
+    for listing_type in sorted(set(live.values())):
+        ids, left, right, codes, kth = _pool(listing_type, with_kth=True)
+        index = {pk: i for i, pk in enumerate(ids.tolist())}
+        moved = [index[pk] for pk in changed if pk in index]
+        for chunk in _chunks(np.asarray(moved, dtype=np.int64), len(ids)):
+            beaten = (squared_distances(chunk, left, right, codes) <= np.square(kth)).any(axis=0)
+            affected.update(ids[beaten].tolist())
+        rows.extend(nearest(sorted(index[pk] for pk in affected if pk in index), ids, left, right, codes))
+    before = {}
+    for listing_id, neighbour_id in SimilarListing.objects.filter(listing__in=affected).order_by(
+            'listing', 'rank').values_list('listing_id', 'neighbour_id'):
+        before.setdefault(listing_id, []).append(neighbour_id)
+    SimilarListing.objects.filter(listing__in=affected).delete()
+    after = _save(rows)
+    # New neighbours, or a card of a changed listing: the page changed, even if
+    # its listing's own edit already bumped updated_at before this refresh ran
+    _touch(pk for pk in affected if after.get(pk) != before.get(pk) or changed.intersection(after.get(pk, ())))
+    return len(affected)
+
+
+def referrers(pks):
+    """Listings that show one of ``pks`` among their neighbours."""
+    return list(SimilarListing.objects.filter(neighbour__in=pks).values_list('listing_id', flat=True).distinct())
+
+
+def touch_referrers(pks):
+    """Bump the pages showing ``pks`` (edited without moving) so their ETags change."""
+    _touch(referrers(pks))
+
+
+def mark_dirty(changed=(), stale=()):
+    """Queue the rows affected by ``changed`` (and ``stale``'s own) for ``refresh_dirty()``."""
+    changed, stale = set(changed), set(stale) - set(changed)
+    if not (changed or stale):
+        return
+    SimilarRefresh.objects.bulk_create([SimilarRefresh(listing_pk=pk, moved=True) for pk in changed],
+                                       update_conflicts=True, unique_fields=['listing_pk'], update_fields=['moved'])
+    SimilarRefresh.objects.bulk_create([SimilarRefresh(listing_pk=pk) for pk in stale], ignore_conflicts=True)
+    background.schedule(refresh_dirty)
+
+
+def refresh_dirty(batch_size=REFRESH_BATCH):
+    """``refresh()`` the queued listings, a batch at a time; returns the number of listings recomputed."""
+    done = 0
+    while True:
+        with transaction.atomic():
+            # Locked until the refresh commits: a mark made meanwhile queues the listing again
+            queued = dict(SimilarRefresh.objects.select_for_update().order_by('listing_pk')
+                          .values_list('listing_pk', 'moved')[:batch_size])
+            if not queued:
+                return done
+            done += refresh([pk for pk, moved in queued.items() if moved],
+                            [pk for pk, moved in queued.items() if not moved])
+            SimilarRefresh.objects.filter(listing_pk__in=queued).delete()
+
+
+# ── Reading ────────────────────────────────────────────────────────────────────
+
+def for_listing(pk):
+    """The listings shown as similar to ``pk``: one lookup on the ``(listing, rank)`` index."""
+    return [row.neighbour for row in SimilarListing.objects.filter(listing=pk, neighbour__is_published=True)
+            .select_related('neighbour').order_by('rank')[:SHOWN]]
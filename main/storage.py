@@ -0,0 +1,70 @@
+"""
+Static files storage used by ``collectstatic`` (see ``build_files.sh``).
+
+On top of WhiteNoise's ``CompressedManifestStaticFilesStorage`` (content-hashed
+names, gzip and — when the ``brotli`` package is installed — Brotli siblings),
+every PNG/JPEG gets ``.webp`` and ``.avif`` conversions before hashing, so the
+conversions are fingerprinted, compressed and listed in the manifest like any
+other file. Templates pick them up via ``{% static_picture %}`` and
+``{% static_background %}`` in ``templatetags/static_images``.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+CONVERTIBLE = ('.png', '.jpg', '.jpeg')
+MODERN_FORMATS = {
+    # extension: (Pillow format, save options)
+    '.avif': ('AVIF', {'quality': 55}),
+    '.webp': ('WEBP', {'quality': 80, 'method': 6}),
+}
+
+
+def modern_variants(path):
+    """``{'.avif': 'img/x.avif', '.webp': 'img/x.webp'}`` for a convertible image path."""
+    stem, ext = os.path.splitext(path)
+    if ext.lower() not in CONVERTIBLE:
+        return {}
+    return {fmt_ext: stem + fmt_ext for fmt_ext in MODERN_FORMATS}
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    # Before collectstatic has written a manifest (local runs, tests) hash the
+    # file in STATIC_ROOT on the fly instead of failing the render.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for path, (storage, source_path) in list(paths.items()):
+                if path.startswith('admin/'):
+                    continue
+                for variant in self._convert(storage, source_path, path):
+                    paths[variant] = (self, variant)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def _convert(self, storage, source_path, path):
+        from PIL import Image, features   # Pillow is only needed at build time
+
+        variants = modern_variants(path)
+        if not variants:
+            return []
+        with storage.open(source_path) as fh:
+            image = Image.open(fh)
+            image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        written = []
+        for fmt_ext, name in variants.items():
+            fmt, opts = MODERN_FORMATS[fmt_ext]
+            if not features.check(fmt.lower()):
+                continue   # this Pillow build can't encode the format
+            buf = io.BytesIO()
+            image.save(buf, fmt, **opts)
+            if self.exists(name):
+                self.delete(name)
+            self._save(name, ContentFile(buf.getvalue()))
+            written.append(name)
+        return written
@@ -0,0 +1,27 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from main import images
+
+register = template.Library()
+
+CARD_SIZES = '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw'
+
+
+@register.simple_tag
+def responsive_img(instance, field, sizes=CARD_SIZES, **attrs):
+    """
+    ``<img>`` for ``instance.<field>`` with a WebP ``srcset`` once derivatives exist.
+
+        {% responsive_img l 'photo_main' class='prop-img' alt=l.title %}
+    """
+    file = getattr(instance, field)
+    if not file:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    srcset = images.srcset(instance, field)
+    if srcset:
+        attrs.update(srcset=srcset, sizes=sizes)
+    return format_html('<img src="{}"{} />', file.url, flatatt(attrs))
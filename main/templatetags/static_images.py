@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from main.storage import modern_variants
+
+register = template.Library()
+
+MIME_TYPES = {'.avif': 'image/avif', '.webp': 'image/webp'}
+
+
+@lru_cache(maxsize=None)
+def _available(path):
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if hashed_files:   # collected with the manifest storage: trust the manifest
+        return staticfiles_storage.hash_key(path) in hashed_files
+    return bool(finders.find(path))
+
+
+def _variants(path):
+    """``[(mime, url), ...]`` for the AVIF/WebP conversions built by collectstatic."""
+    return [(MIME_TYPES[ext], static(name)) for ext, name in modern_variants(path).items()
+            if _available(name)]
+
+
+@register.simple_tag
+def static_picture(path, **attrs):
+    """
+    ``<picture>`` with AVIF/WebP sources falling back to the original image.
+
+        {% static_picture 'img/villa_pool.png' alt='Luxury Villa' %}
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    img = format_html('<img src="{}"{} />', static(path), flatatt(attrs))
+    sources = format_html_join('', '<source type="{}" srcset="{}" />', _variants(path))
+    if not sources:
+        return img
+    return format_html('<picture>{}{}</picture>', sources, img)
+
+
+@register.simple_tag
+def static_background(path):
+    """
+    Inline ``background-image`` declarations: the original first for old
+    browsers, then an ``image-set()`` preferring AVIF/WebP.
+
+        <div style="{% static_background 'img/hero_bg.png' %}"></div>
+    """
+    fallback = format_html("background-image:url('{}')", static(path))
+    variants = _variants(path)
+    if not variants:
+        return fallback
+    candidates = variants + [(f'image/{path.rsplit(".", 1)[-1].lower()}', static(path))]
+    image_set = format_html_join(', ', "url('{1}') type('{0}')", candidates)
+    return format_html('{};background-image:image-set({})', fallback, image_set)
@@ -1,3 +1,1725 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import re
+from datetime import timedelta
+from functools import partial
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, QueryDict
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import (caching, facets, geo, images, imports, inquiries, instrumentation, market_stats, replicas,
+               saved_searches, search, similar, views)
+from .cache_backends import SQLiteCache
+from .coldstart import warm_templates
+from .models import (Contact, InquiryOutbox, Listing, MarketStat, Realtor, SavedSearch, SavedSearchMatch,
+                     SimilarListing, SimilarRefresh)
+from .pagination import EstimatedCountPaginator, LookaheadPage, encode_cursor, estimated_count
+
+
+STATES = ['Maharashtra', 'Karnataka', 'Delhi', 'Tamil Nadu', 'Gujarat', 'Telangana']
+CITIES = ['Mumbai', 'Pune', 'Bengaluru', 'New Delhi', 'Chennai', 'Ahmedabad', 'Hyderabad']
+
+
+def read_json(resp):
+    """Decode a response body, streamed (the listings API) or not."""
+    return json.loads(resp.getvalue())
+
+
+def seed_listings(n, seed=42):
+    """Bulk-insert ``n`` synthetic listings (~90% published) and refresh planner stats."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    ptypes = [c for c, _ in Listing.PROPERTY_TYPE_CHOICES]
+    Listing.objects.bulk_create([
+        Listing(
+            title=f'{rng.choice(ptypes).title()} #{i}',
+            address=f'{i} MG Road',
+            city=rng.choice(CITIES),
+            state=rng.choice(STATES),
+            price=rng.randrange(500_000, 60_000_000, 10_000),
+            bedrooms=rng.randint(1, 5),
+            sqft=rng.randint(400, 5000),
+            listing_type=rng.choice([Listing.SALE, Listing.RENT]),
+            property_type=rng.choice(ptypes),
+            is_published=rng.random() < 0.9,
+        )
+        for i in range(n)
+    ], batch_size=1000)
+    # list_date is auto_now_add, so spread it out afterwards to get a realistic ordering
+    for pk in Listing.objects.values_list('pk', flat=True)[::50]:
+        Listing.objects.filter(pk__gte=pk, pk__lt=pk + 50).update(list_date=now - timedelta(minutes=pk))
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class ListingQueryPlanTests(TestCase):
+    """Guards the read-path indexes: every ordered Listing query issued by the
+    public views must be served by an index and must not sort at the top level."""
+
+    ROWS = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(cls.ROWS)
+
+    def setUp(self):
+        cache.clear()   # so cached pages (e.g. the home page) still hit the database
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertIndexedPlan(self, sql):
+        plan = self.explain(sql)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on main_listing', plan, plan)
+            top = plan.splitlines()[0].lstrip()
+            if top.startswith('Limit'):
+                top = plan.splitlines()[1].lstrip(' ->')
+            self.assertFalse(top.startswith('Sort'), plan)
+        else:
+            self.assertRegex(plan, r'main_listing USING (COVERING )?INDEX listing_pub_', plan)
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan, plan)
+
+    def assertViewUsesIndexes(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            resp.getvalue()   # API list pages are streamed
+        ordered = [q['sql'] for q in ctx.captured_queries
+                   if re.search(r'FROM "main_listing"', q['sql']) and 'ORDER BY' in q['sql']]
+        self.assertTrue(ordered, f'{url} issued no ordered Listing query')
+        for sql in ordered:
+            with self.subTest(url=url, sql=sql):
+                self.assertIndexedPlan(sql)
+
+    def test_index(self):
+        self.assertViewUsesIndexes(reverse('index'))
+
+    def test_listings(self):
+        self.assertViewUsesIndexes(reverse('listings'))
+        self.assertViewUsesIndexes(reverse('listings') + '?type=rent&page=3')
+
+    # Keyword queries are relevance-ordered (an unavoidable sort over the
+    # full-text matches), so only the structured filters are covered here.
+    def test_search(self):
+        base = reverse('search')
+        for qs in ['', '?listing_type=sale', '?property_type=villa', '?state=Karnataka',
+                   '?city=pune&bedrooms=2', '?price=2000000']:
+            self.assertViewUsesIndexes(base + qs)
+
+    def test_api_listings(self):
+        base = reverse('api-listings')
+        for qs in ['', '?type=rent', '?state=delhi&bedrooms=3', '?city=mumbai&price=5000000']:
+            self.assertViewUsesIndexes(base + qs)
+
+    def test_api_listings_deep_cursor(self):
+        url = reverse('api-listings') + '?page_size=100'
+        for _ in range(10):
+            url = read_json(self.client.get(url))['next']
+        self.assertViewUsesIndexes(url)
+        self.assertViewUsesIndexes(read_json(self.client.get(url))['previous'])
+
+
+class FullTextSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        def make(title, **kw):
+            return Listing.objects.create(title=title, address=kw.pop('address', '1 Main St'),
+                                          city=kw.pop('city', 'Pune'), state='Maharashtra',
+                                          price=5_000_000, is_published=True, **kw)
+        cls.villa = make('Sea-facing villa', description='Private pool and garden')
+        cls.flat = make('2BHK flat', description='Close to a villa colony')
+        cls.shop = make('Retail shop', city='Bengaluru', address='Koramangala 5th Block')
+
+    def titles(self, text):
+        return [l.title for l in search.search_listings(Listing.objects.all(), text)]
+
+    def test_searches_all_text_fields(self):
+        self.assertEqual(self.titles('garden'), ['Sea-facing villa'])
+        self.assertEqual(self.titles('koramangala'), ['Retail shop'])
+        self.assertEqual(self.titles('bengaluru'), ['Retail shop'])
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles('villa'), ['Sea-facing villa', '2BHK flat'])
+
+    def test_prefix_and_all_terms(self):
+        self.assertEqual(self.titles('vil gard'), ['Sea-facing villa'])
+        self.assertEqual(self.titles('villa shop'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.shop.title = 'Retail showroom'
+        self.shop.save()
+        self.assertEqual(self.titles('showroom'), ['Retail showroom'])
+        self.shop.delete()
+        self.assertEqual(self.titles('showroom'), [])
+
+    def test_views_use_full_text(self):
+        resp = self.client.get(reverse('search'), {'keywords': 'pool'})
+        self.assertEqual([l.title for l in resp.context['listings']], ['Sea-facing villa'])
+        resp = self.client.get(reverse('api-listings'), {'q': 'koramangala'})
+        self.assertEqual([r['title'] for r in read_json(resp)['results']], ['Retail shop'])
+
+
+@override_settings(LISTINGS_API_PAGE_SIZE=4, LISTINGS_API_MAX_PAGE_SIZE=10)
+class ListingApiPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(30)
+        # force list_date ties so the id tie-breaker is exercised
+        Listing.objects.filter(pk__lte=15).update(list_date=timezone.now())
+        cls.expected = list(Listing.objects.filter(is_published=True)
+                            .order_by('-list_date', '-id').values_list('id', flat=True))
+
+    def walk(self, url, direction='next'):
+        ids, pages = [], 0
+        while url:
+            body = read_json(self.client.get(url))
+            ids.extend(r['id'] for r in body['results'])
+            url, pages = body[direction], pages + 1
+        return ids, body, pages
+
+    def test_forward_walk_covers_every_row_once(self):
+        ids, last, pages = self.walk(reverse('api-listings'))
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, -(-len(self.expected) // 4))
+        self.assertIsNotNone(last['previous'])
+
+    def test_previous_walks_back(self):
+        url = reverse('api-listings')
+        pages = []
+        while url:
+            body = read_json(self.client.get(url))
+            pages.append([r['id'] for r in body['results']])
+            last, url = body, body['next']
+        back = read_json(self.client.get(last['previous']))
+        self.assertEqual([r['id'] for r in back['results']], pages[-2])
+
+    def test_filters_combine_with_cursor(self):
+        ids, _, _ = self.walk(reverse('api-listings') + '?type=rent&page_size=3')
+        expected = [pk for pk in self.expected if Listing.objects.get(pk=pk).listing_type == 'rent']
+        self.assertEqual(ids, expected)
+
+    def test_page_size_is_capped(self):
+        body = read_json(self.client.get(reverse('api-listings'), {'page_size': 1000}))
+        self.assertEqual(len(body['results']), 10)
+
+    def test_invalid_cursor(self):
+        for cursor in ['garbage', encode_cursor(timezone.now(), 1)[:-3]]:
+            resp = self.client.get(reverse('api-listings'), {'cursor': cursor})
+            self.assertEqual(resp.status_code, 404)
+
+
+class SearchPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(60)
+
+    def test_lookahead_page_caps_the_count(self):
+        qs = Listing.objects.order_by('-list_date', '-id')
+        page = LookaheadPage(qs, 2, per_page=10, count_cap=25)
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next() and page.has_previous())
+        self.assertEqual(page.count_label, '25+')
+        last = LookaheadPage(qs, 6, per_page=10, count_cap=100)
+        self.assertFalse(last.has_next())
+        self.assertEqual(last.count_label, '60')
+
+    def test_out_of_range_page_is_clamped(self):
+        resp = self.client.get(reverse('search'), {'keywords': 'flat', 'page': '9' * 20})
+        self.assertEqual(resp.status_code, 200)
+        page = resp.context['listings']
+        self.assertEqual((page.number, len(page), page.has_other_pages()), (1, 0, False))   # no results
+        self.assertNotContains(resp, '>«<')
+
+        qs = Listing.objects.order_by('-list_date', '-id')
+        page = LookaheadPage(qs, 50, per_page=9)
+        self.assertEqual((page.number, len(page), page.count_label), (7, 6, '60'))
+        page = LookaheadPage(qs.none(), 50, per_page=9)
+        self.assertEqual((page.number, len(page), page.has_previous()), (1, 0, False))
+
+    def test_single_page_skips_count_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            page = LookaheadPage(Listing.objects.all(), 1, per_page=100)
+        self.assertEqual((len(ctx.captured_queries), page.count), (1, 60))
+
+    def test_page_links_keep_filters(self):
+        resp = self.client.get(reverse('search'), {'listing_type': 'sale', 'bedrooms': '1'})
+        page = resp.context['listings']
+        self.assertEqual(len(page), 9)
+        self.assertTrue(page.has_next())
+        self.assertContains(resp, '?listing_type=sale&amp;bedrooms=1&amp;page=2')
+        resp = self.client.get(reverse('search'), {'listing_type': 'sale', 'page': 'x'})
+        self.assertEqual(resp.context['listings'].number, 1)
+
+
+class ListingExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(40)
+
+    def test_ndjson_honours_api_filters(self):
+        resp = self.client.get(reverse('api-listings-export'), {'type': 'rent', 'bedrooms': 3})
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+        expected = Listing.objects.filter(is_published=True, listing_type='rent', bedrooms__gte=3)
+        self.assertEqual([r['id'] for r in rows], list(expected.order_by('id').values_list('id', flat=True)))
+
+    def test_csv(self):
+        resp = self.client.get(reverse('api-listings-export'), {'format': 'csv'})
+        lines = list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode())))
+        self.assertEqual(lines[0][:3], ['id', 'title', 'address'])
+        self.assertEqual(len(lines) - 1, Listing.objects.filter(is_published=True).count())
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('api-listings-export'), {'format': 'xml'}).status_code, 400)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('export_listings', '--state', 'delhi', stdout=out, stderr=io.StringIO())
+        ids = [json.loads(line)['id'] for line in out.getvalue().splitlines() if line.startswith('{')]
+        expected = Listing.objects.filter(is_published=True, state='Delhi').order_by('id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+
+@override_settings(REFRESH_WORKER='inline')
+class HomePageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(20)
+
+    def setUp(self):
+        cache.clear()
+        caching.reset_stats()
+
+    def test_second_hit_is_served_from_cache(self):
+        with self.assertNumQueries(3):   # latest listings, realtors, one grouped count
+            first = self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('index'))
+        self.assertEqual(first.context['for_sale_count'], second.context['for_sale_count'])
+        self.assertEqual(caching.stats()['home'], {'hits': 3, 'misses': 3})
+
+    def test_counts_match_live_data(self):
+        resp = self.client.get(reverse('index'))
+        published = Listing.objects.filter(is_published=True)
+        self.assertEqual(resp.context['for_sale_count'], published.filter(listing_type='sale').count())
+        self.assertEqual(resp.context['for_rent_count'], published.filter(listing_type='rent').count())
+
+    def test_listing_and_realtor_writes_invalidate(self):
+        self.client.get(reverse('index'))
+        listing = Listing.objects.filter(is_published=True).first()
+        listing.title = 'Freshly renamed'
+        listing.list_date = timezone.now() + timedelta(days=1)
+        generation = caching.generation('home')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+            # not before the commit, or a concurrent rebuild would cache the old rows anew
+            self.assertEqual(caching.generation('home'), generation)
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.context['listings'][0].title, 'Freshly renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Realtor.objects.create(name='Asha', phone='1', email='a@example.com', is_mvp=True)
+        resp = self.client.get(reverse('index'))
+        self.assertEqual([r.name for r in resp.context['realtors']], ['Asha'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        resp = self.client.get(reverse('index'))
+        self.assertNotIn(listing.pk, [l.pk for l in resp.context['listings']])
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f'{tmp.name}/cache.sqlite3'
+        self.cache = self.worker()
+
+    def worker(self, **options):
+        """A separate backend instance on the same file, like another gunicorn worker."""
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_are_shared_between_workers(self):
+        self.cache.set('k', {'v': [1, 2]})
+        other = self.worker()
+        self.assertEqual(other.get('k'), {'v': [1, 2]})
+        self.assertEqual(other.get_many(['k', 'missing']), {'k': {'v': [1, 2]}})
+        other.delete('k')
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_expiry_and_add(self):
+        self.cache.set('gone', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 2))
+        self.assertFalse(self.cache.add('gone', 3))
+        self.assertEqual(self.cache.get('gone'), 2)
+
+    def test_incr_is_seen_by_every_worker(self):
+        other = self.worker()
+        self.cache.set('gen', 10, timeout=None)
+        self.assertEqual(other.incr('gen'), 11)
+        self.assertEqual(self.cache.incr('gen', 5), 16)
+        with self.assertRaises(ValueError):
+            self.cache.incr('nope')
+
+    def test_lru_eviction(self):
+        cache = self.worker(MAX_ENTRIES=100, CULL_FREQUENCY=4)
+        for i in range(100):
+            cache.set(f'k{i}', i)
+        with cache._conn() as conn:
+            conn.execute("UPDATE cache_entry SET accessed = 0 WHERE key LIKE '%:k1_'")
+        cache.set('one-more', 1)
+        self.assertIsNone(cache.get('k10'))
+        self.assertEqual(cache.get('k99'), 99)
+        self.assertLessEqual(cache._conn().execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0], 100)
+
+
+@override_settings(REFRESH_WORKER='inline')
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.realtor = Realtor.objects.create(name='Ravi', phone='1', email='r@example.com')
+        cls.listing = Listing.objects.create(title='Lake view flat', address='1 Lake Rd', city='Pune',
+                                             state='Maharashtra', price=4_000_000, is_published=True,
+                                             realtor=cls.realtor)
+
+    def revalidate(self, url, resp, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'], **extra)
+
+    def test_detail_api_304_until_changed(self):
+        url = reverse('api-listing-detail', args=[self.listing.pk])
+        first = self.client.get(url)
+        self.assertTrue(first.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+        self.listing.price = 3_900_000
+        self.listing.save()
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_realtor_change_invalidates_listing(self):
+        url = reverse('api-listing-detail', args=[self.listing.pk])
+        first = self.client.get(url)
+        self.realtor.name = 'Ravi K.'
+        self.realtor.save()
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_listing_page_etag_varies_by_user(self):
+        url = reverse('listing', args=[self.listing.pk])
+        anon = self.client.get(url)
+        self.assertEqual(self.revalidate(url, anon).status_code, 304)
+        self.assertIn('private', anon['Cache-Control'])
+        user = User.objects.create_user('buyer', password='pw')
+        self.client.force_login(user)
+        self.assertEqual(self.revalidate(url, anon).status_code, 200)
+
+        # The inquiry form carries the CSRF token and the user's profile
+        page = self.client.get(url)
+        self.assertEqual(self.revalidate(url, page).status_code, 304)
+        user.email = 'buyer@example.com'
+        user.save()
+        self.assertEqual(self.revalidate(url, page).status_code, 200)
+        page = self.client.get(url)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'x' * 32   # rotated
+        self.assertEqual(self.revalidate(url, page).status_code, 200)
+
+    def test_unknown_listing_still_404s(self):
+        url = reverse('api-listing-detail', args=[self.listing.pk + 100])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"x"').status_code, 404)
+
+    def test_collection_etag_tracks_filter_set(self):
+        url = reverse('api-listings') + '?city=pune'
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        other = self.client.get(reverse('api-listings') + '?city=mumbai')
+        self.assertNotEqual(first['ETag'], other['ETag'])
+        self.listing.is_published = False
+        self.listing.save()
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_collection_etag_tracks_facet_counts(self):
+        url = reverse('api-listings') + '?city=pune&property_type=apartment'
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url)['ETag'], first['ETag'])
+        self.assertFalse(any('MAX(' in q['sql'] for q in ctx.captured_queries))   # only revalidations aggregate
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            # outside the selected facet, but counted in the body's facets
+            Listing.objects.create(title='Pune bungalow', address='2 Lake Rd', city='Pune', state='Maharashtra',
+                                   price=9_000_000, property_type=Listing.HOUSE, is_published=True)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+
+class AsyncApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(30)
+
+    async def read_async(self, resp):
+        self.assertTrue(resp.is_async)   # an async iterator, not buffered by the handler
+        return json.loads(b''.join([chunk async for chunk in resp.streaming_content]))
+
+    def test_views_are_async(self):
+        for url in [reverse('api-listings'), reverse('api-listing-detail', args=[1])]:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)
+
+    async def test_asgi_streams_the_same_pages_as_wsgi(self):
+        url = reverse('api-listings') + '?page_size=4&type=sale'
+        pages = []
+        while url:
+            body = await self.read_async(await self.async_client.get(url))
+            pages.append(body)
+            url = body['next']
+        wsgi = await sync_to_async(self.client.get)(reverse('api-listings') + '?page_size=4&type=sale')
+        self.assertEqual(pages[0], await sync_to_async(read_json)(wsgi))
+        back = await self.read_async(await self.async_client.get(pages[-1]['previous']))
+        self.assertEqual(back['results'], pages[-2]['results'])
+        expected = [pk async for pk in Listing.objects.filter(is_published=True, listing_type='sale')
+                    .order_by('-list_date', '-id').values_list('id', flat=True)]
+        self.assertEqual([r['id'] for page in pages for r in page['results']], expected)
+
+    async def test_keyword_search_probes_fts_outside_the_event_loop(self):
+        # A fresh worker's first keyword search is where the FTS table is looked up
+        await sync_to_async(search.rebuild_index)()
+        search._fts5_databases.clear()
+        resp = await self.async_client.get(reverse('api-listings') + '?q=road')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue((await self.read_async(resp))['results'])
+
+    async def test_keyword_search_without_the_fts_table(self):
+        # SQLite without FTS5 falls back to icontains; the missing table is probed once
+        def drop_table():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {search.FTS_TABLE}')
+        await sync_to_async(drop_table)()
+        search._fts5_databases.clear()
+        self.addCleanup(search._fts5_databases.clear)
+        for _ in range(2):
+            resp = await self.async_client.get(reverse('api-listings') + '?q=road')
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue((await self.read_async(resp))['results'])
+            self.assertEqual(list(search._fts5_databases.values()), [False])
+
+    async def test_asgi_conditional_get_and_errors(self):
+        listing = await Listing.objects.filter(is_published=True).afirst()
+        url = reverse('api-listing-detail', args=[listing.pk])
+        first = await self.async_client.get(url)
+        self.assertEqual(json.loads(first.content)['id'], listing.pk)
+        self.assertEqual((await self.async_client.get(url, headers={'if-none-match': first['ETag']})).status_code, 304)
+        missing = await self.async_client.get(reverse('api-listing-detail', args=[listing.pk + 1000]))
+        self.assertEqual((missing.status_code, missing['Content-Type']), (404, 'application/json'))
+        self.assertEqual((await self.async_client.get(reverse('api-listings'), {'cursor': 'x'})).status_code, 404)
+        self.assertEqual((await self.async_client.post(reverse('api-listings'))).status_code, 405)
+
+
+def _jpeg(width=1600, height=900):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buf, 'JPEG')
+    return SimpleUploadedFile('photo.jpg', buf.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_DERIVATIVE_WORKERS=0, REFRESH_WORKER='inline')
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def make_listing(self, **kw):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Listing.objects.create(title='Photo flat', address='1 A St', city='Pune', state='Maharashtra',
+                                          price=1, is_published=True, **kw)
+
+    def test_upload_builds_webp_derivatives(self):
+        listing = self.make_listing(photo_main=_jpeg())
+        listing.refresh_from_db()
+        record = listing.photo_variants['photo_main']
+        self.assertEqual((record['width'], record['widths']), (1600, [320, 640, 1280]))
+        srcset = listing.photo_main_srcset
+        self.assertIn('.w320.webp 320w', srcset)
+        self.assertTrue(srcset.endswith('.jpg 1600w'))
+        resp = self.client.get(reverse('listing', args=[listing.pk]))
+        self.assertContains(resp, 'srcset="')
+
+    def test_small_originals_are_not_upscaled(self):
+        listing = self.make_listing(photo_main=_jpeg(500, 300))
+        listing.refresh_from_db()
+        self.assertEqual(listing.photo_variants['photo_main']['widths'], [320])
+
+    def test_realtor_derivatives_give_their_listings_a_new_version(self):
+        realtor = Realtor.objects.create(name='Meera', phone='1', email='m@example.com',
+                                         photo=_jpeg())
+        listing = self.make_listing(realtor=realtor)
+        before = Listing.objects.get(pk=listing.pk).updated_at
+        images.process_instance(Realtor, realtor.pk)
+        self.assertGreater(Listing.objects.get(pk=listing.pk).updated_at, before)
+
+    def test_listing_derivatives_give_pages_showing_it_a_new_version(self):
+        listing = self.make_listing(photo_main=_jpeg())
+        other = self.make_listing()
+        self.assertTrue(SimilarListing.objects.filter(listing=other, neighbour=listing).exists())
+        before = Listing.objects.get(pk=other.pk).updated_at
+        images.process_instance(Listing, listing.pk, force=True)
+        self.assertGreater(Listing.objects.get(pk=other.pk).updated_at, before)
+
+    def test_backfill_command(self):
+        listing = self.make_listing()
+        listing.photo_main.save('photo.jpg', _jpeg(), save=False)   # as if uploaded before the pipeline
+        Listing.objects.filter(pk=listing.pk).update(photo_main=listing.photo_main.name)
+        call_command('generate_image_derivatives', stdout=io.StringIO())
+        listing.refresh_from_db()
+        self.assertEqual(listing.photo_variants['photo_main']['widths'], [320, 640, 1280])
+
+
+class ColdStartTests(TestCase):
+    PROBE = (
+        'import sys, django; django.setup()\n'
+        'from django.urls import resolve, reverse\n'
+        'resolve("/listings/"); reverse("api-listings")\n'
+        'before = [m in sys.modules for m in ("rest_framework.views", "main.api", "main.admin")]\n'
+        'resolve("/admin/")\n'
+        'print(before, "main.admin" in sys.modules)\n'
+    )
+
+    def test_admin_and_drf_load_on_first_use(self):
+        env = {**os.environ, 'COLD_START_MODE': 'True', 'DEBUG': 'True',
+               'DJANGO_SETTINGS_MODULE': 'config.settings'}
+        env.pop('DATABASE_URL', None)
+        proc = subprocess.run([sys.executable, '-c', self.PROBE], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(proc.stdout.strip(), '[False, False, False] True')
+
+    def test_lazy_api_view(self):
+        match = resolve(reverse('api-listings'))
+        self.assertEqual((match.func.__module__, match.func.__name__), ('main.api', 'api_listings'))
+        self.assertEqual(self.client.get(reverse('api-listings')).status_code, 200)
+
+    def test_warm_templates(self):
+        timings = warm_templates()
+        self.assertIn('base.html', timings)
+        self.assertIn('listing.html', timings)
+        self.assertFalse([name for name in timings if name.startswith(('admin/', 'rest_framework/'))])
+
+
+class ListingRowSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(12)
+        realtor = Realtor.objects.create(name='Meera Rao', phone='1', email='meera@example.com')
+        Listing.objects.filter(pk__lte=6).update(realtor=realtor, bathrooms=Decimal('2'),
+                                                 photo_main='listings/2026/10/flat one.jpg')
+        Listing.objects.filter(pk=2).update(latitude=18.94, longitude=72.83, geohash=geo.encode(18.94, 72.83))
+
+    def test_matches_the_drf_serializer(self):
+        from .api import ListingRowSerializer, ListingSerializer
+
+        request = RequestFactory().get('/api/listings/')
+        qs, _ = geo.filter_queryset(Listing.objects.all(), {'lat': '18.9', 'lng': '72.8', 'radius': '50'})
+        for queryset in [Listing.objects.select_related('realtor'), qs.select_related('realtor')]:
+            fast = ListingRowSerializer(request, annotations=queryset.query.annotations)
+            rows = list(queryset.order_by('id').values(*fast.columns))
+            drf = ListingSerializer(list(queryset.order_by('id')), many=True, context={'request': request}).data
+            self.assertEqual([fast.to_representation(row) for row in rows], json.loads(json.dumps(drf)))
+        self.assertEqual(fast.to_representation(rows[0])['photo_main'],
+                         'http://testserver/media/listings/2026/10/flat%20one.jpg')
+
+    def test_sparse_fieldsets(self):
+        url = reverse('api-listings')
+        with CaptureQueriesContext(connection) as ctx:
+            body = read_json(self.client.get(url, {'fields': 'title, price_inr,id', 'page_size': 5}))
+        self.assertEqual(list(body['results'][0]), ['id', 'title', 'price_inr'])
+        page_sql = next(q['sql'] for q in ctx.captured_queries if 'LIMIT 6' in q['sql'])
+        self.assertNotIn('"description"', page_sql)
+        self.assertNotIn('main_realtor', page_sql)
+        with CaptureQueriesContext(connection) as ctx:
+            full = read_json(self.client.get(url, {'page_size': 5}))
+        self.assertIn('LEFT OUTER JOIN "main_realtor"', ctx.captured_queries[-2]['sql'])   # no query per realtor
+        self.assertEqual([r['title'] for r in full['results']], [r['title'] for r in body['results']])
+        self.assertEqual(read_json(self.client.get(body['next']))['results'][0].keys(), {'id', 'title', 'price_inr'})
+
+        detail = reverse('api-listing-detail', args=[1])
+        resp = self.client.get(detail, {'fields': 'id,realtor_name'})
+        self.assertEqual(json.loads(resp.content), {'id': 1, 'realtor_name': 'Meera Rao'})
+        self.assertNotEqual(resp['ETag'], self.client.get(detail)['ETag'])
+        for target in [url, detail]:
+            resp = self.client.get(target, {'fields': 'id,secret'})
+            self.assertEqual((resp.status_code, json.loads(resp.content)), (400, {'detail': 'Unknown fields: secret'}))
+
+
+class GeoSearchTests(TestCase):
+    # CSMT station; Bandra is ~13 km north, Thane ~34 km, Pune ~120 km away
+    CSMT = (18.9398, 72.8355)
+    PLACES = {'CSMT flat': CSMT, 'Bandra flat': (19.0596, 72.8295),
+              'Thane flat': (19.2183, 72.9781), 'Pune flat': (18.5204, 73.8567)}
+
+    @classmethod
+    def setUpTestData(cls):
+        for title, (lat, lng) in cls.PLACES.items():
+            Listing.objects.create(title=title, address='1 A St', city='X', state='Maharashtra', price=1,
+                                   is_published=True, latitude=lat, longitude=lng)
+        Listing.objects.create(title='No coordinates', address='1 A St', city='X', state='Maharashtra',
+                               price=1, is_published=True)
+
+    def near(self, **params):
+        lat, lng = self.CSMT
+        return {'lat': lat, 'lng': lng, **params}
+
+    def test_geohash_is_kept_in_sync(self):
+        listing = Listing.objects.get(title='CSMT flat')
+        self.assertEqual(listing.geohash, geo.encode(*self.CSMT))
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        listing.latitude, listing.longitude = self.PLACES['Pune flat']
+        listing.save(update_fields=['latitude', 'longitude'])
+        listing.refresh_from_db()
+        self.assertEqual(listing.geohash, geo.encode(*self.PLACES['Pune flat']))
+
+    def test_radius_prunes_by_geohash_then_sorts_by_distance(self):
+        with CaptureQueriesContext(connection) as ctx:
+            body = read_json(self.client.get(reverse('api-listings'), self.near(radius=40)))
+        self.assertEqual([r['title'] for r in body['results']], ['CSMT flat', 'Bandra flat', 'Thane flat'])
+        distances = [r['distance'] for r in body['results']]
+        self.assertAlmostEqual(distances[0], 0, places=3)
+        self.assertAlmostEqual(distances[1], 13.4, delta=0.5)
+        self.assertIn('"geohash" >=', ctx.captured_queries[-1]['sql'])
+        qs, _ = geo.filter_queryset(Listing.objects.filter(is_published=True), self.near(radius=40))
+        self.assertIn('listing_pub_geohash_idx', qs.explain())
+
+    def test_distance_cursor_walk(self):
+        url, titles = reverse('api-listings') + '?' + urlencode(self.near(radius=200, page_size=1)), []
+        while url:
+            body = read_json(self.client.get(url))
+            titles.extend(r['title'] for r in body['results'])
+            url = body['next']
+        self.assertEqual(titles, ['CSMT flat', 'Bandra flat', 'Thane flat', 'Pune flat'])
+
+    def test_bbox_and_search_page(self):
+        body = read_json(self.client.get(reverse('api-listings'), {'bbox': '72.7,18.8,73.0,19.1'}))
+        self.assertEqual(sorted(r['title'] for r in body['results']), ['Bandra flat', 'CSMT flat'])
+        resp = self.client.get(reverse('search'), self.near(radius=20))
+        self.assertEqual([l.title for l in resp.context['listings']], ['CSMT flat', 'Bandra flat'])
+        self.assertContains(resp, 'km away')
+
+    def test_post_listing_validates_coordinates(self):
+        self.client.force_login(User.objects.create_user('poster', password='pw'))
+        form = {'title': 'Harbour flat', 'address': '2 Dock Rd', 'city': 'Mumbai', 'state': 'Maharashtra',
+                'price': '5000000'}
+        for coordinates, error in (({'latitude': '95', 'longitude': '72.8'}, 'latitude must be a number from -90'),
+                                   ({'latitude': '18.9', 'longitude': '-200'}, 'longitude must be a number'),
+                                   ({'latitude': '18.9'}, 'give both latitude and longitude')):
+            resp = self.client.post(reverse('post-listing'), {**form, **coordinates}, follow=True)
+            self.assertContains(resp, error)
+        self.assertFalse(Listing.objects.filter(title='Harbour flat').exists())
+        self.client.post(reverse('post-listing'), {**form, 'latitude': '18.94', 'longitude': '72.84'})
+        listing = Listing.objects.get(title='Harbour flat')
+        self.assertEqual(listing.geohash, geo.encode(18.94, 72.84))
+
+    def test_antimeridian_box(self):
+        a = Listing.objects.create(title='Fiji', address='-', city='-', state='-', price=1, is_published=True,
+                                   latitude=-17.7, longitude=179.9)
+        b = Listing.objects.create(title='Samoa', address='-', city='-', state='-', price=1, is_published=True,
+                                   latitude=-17.7, longitude=-179.9)
+        qs = geo.within_bbox(Listing.objects.all(), -18, 179.5, -17, -179.5)
+        self.assertEqual(set(qs), {a, b})
+
+
+@override_settings(REFRESH_WORKER='inline')
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(120)
+
+    def setUp(self):
+        cache.clear()
+        caching.reset_stats()
+
+    def test_counts_in_one_query_excluding_own_filter(self):
+        published = Listing.objects.filter(is_published=True)
+        selected = facets.selection(state='delhi', listing_type='rent', price='20000000')
+        with self.assertNumQueries(1):
+            result = facets.counts(published, selected)
+        by_state = {o['value']: o['count'] for o in result['state']['options']}
+        for state in ('Delhi', 'Maharashtra'):
+            self.assertEqual(by_state[state], published.filter(
+                state=state, listing_type='rent', price__lte=20000000).count())
+        by_type = {o['value']: o['count'] for o in result['listing_type']['options']}
+        self.assertEqual(by_type['sale'], published.filter(
+            state='Delhi', listing_type='sale', price__lte=20000000).count())
+        self.assertEqual(result['listing_type']['total'], published.filter(
+            state='Delhi', price__lte=20000000).count())
+        self.assertTrue(next(o for o in result['state']['options'] if o['value'] == 'Delhi')['selected'])
+
+    def test_api_facets_are_cached_per_normalised_query(self):
+        url = reverse('api-listings')
+        body = read_json(self.client.get(url + '?type=rent&state=Delhi'))
+        rent_total = sum(o['count'] for o in body['facets']['listing_type']['options'] if o['value'] == 'rent')
+        self.assertEqual(rent_total, Listing.objects.filter(is_published=True, state='Delhi',
+                                                            listing_type='rent').count())
+        self.client.get(url + '?state=Delhi&type=rent&page_size=5').getvalue()
+        self.assertEqual(caching.stats()['facets'], {'hits': 1, 'misses': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(is_published=True).first().save()
+        self.client.get(url + '?state=Delhi&type=rent').getvalue()
+        self.assertEqual(caching.stats()['facets'], {'hits': 1, 'misses': 2})
+
+    def test_search_page_shows_counts(self):
+        resp = self.client.get(reverse('search'), {'listing_type': 'sale'})
+        n = Listing.objects.filter(is_published=True, listing_type='rent').count()
+        self.assertContains(resp, f'For Rent ({n})')
+        self.assertTrue(all(l.listing_type == 'sale' for l in resp.context['listings']))
+
+
+@override_settings(REFRESH_WORKER='inline')
+class MarketStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(200)
+        market_stats.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rebuild_matches_direct_computation(self):
+        import numpy as np
+
+        for dimension in market_stats.DIMENSIONS:
+            for stat in MarketStat.objects.filter(dimension=dimension):
+                rows = Listing.objects.filter(is_published=True, listing_type=stat.listing_type,
+                                              **{dimension: stat.value})
+                prices = np.array(rows.values_list('price', flat=True), dtype=float)
+                self.assertEqual(stat.count, len(prices))
+                self.assertEqual((stat.min_price, stat.max_price), (prices.min(), prices.max()))
+                self.assertAlmostEqual(stat.mean_price, prices.mean(), places=4)
+                self.assertEqual([stat.p25_price, stat.median_price, stat.p75_price],
+                                 list(np.percentile(prices, [25, 50, 75])))
+                per_sqft = [p / s for p, s in rows.values_list('price', 'sqft') if s]
+                self.assertAlmostEqual(stat.median_price_per_sqft, np.median(per_sqft), places=6)
+
+    def test_signals_refresh_only_touched_groups(self):
+        listing = Listing.objects.filter(is_published=True, listing_type='rent').first()
+        old_city = listing.city
+        old = MarketStat.objects.get(dimension='city', value=old_city, listing_type='rent')
+        untouched = MarketStat.objects.exclude(dimension='city', value__in=[old_city, 'Kochi']) \
+            .exclude(dimension='state', value=listing.state).exclude(dimension='property_type',
+                                                                      value=listing.property_type)
+        before = {s.pk: s.updated_at for s in untouched}
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.city = 'Kochi'
+            listing.save()
+        self.assertEqual(MarketStat.objects.get(dimension='city', value=old_city, listing_type='rent').count,
+                         old.count - 1)
+        kochi = MarketStat.objects.get(dimension='city', value='Kochi', listing_type='rent')
+        self.assertEqual((kochi.count, kochi.median_price), (1, listing.price))
+        self.assertEqual({s.pk: s.updated_at for s in untouched}, before)
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertFalse(MarketStat.objects.filter(dimension='city', value='Kochi').exists())
+
+    @override_settings(REFRESH_WORKER='off')
+    def test_writes_keep_totals_and_defer_percentiles(self):
+        listing = Listing.objects.filter(is_published=True, listing_type='sale').first()
+        group = {'dimension': 'property_type', 'value': listing.property_type, 'listing_type': 'sale'}
+        before = MarketStat.objects.get(**group)
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.price += 1_000_000
+            listing.save()
+        stat = MarketStat.objects.get(**group)
+        self.assertEqual((stat.count, stat.price_sum), (before.count, before.price_sum + 1_000_000))
+        self.assertAlmostEqual(stat.mean_price, stat.price_sum / stat.count)
+        self.assertEqual((stat.median_price, stat.dirty), (before.median_price, True))
+        rows = self.client.get(reverse('api-market-stats'), {'dimension': 'property_type', 'type': 'sale'}).json()
+        self.assertTrue(next(r for r in rows['results'] if r['value'] == listing.property_type)['dirty'])
+
+        # The scheduler's entry point (Vercel cron), behind CRON_SECRET
+        url = reverse('refresh-stale')
+        self.assertEqual(self.client.get(url).status_code, 403)   # no secret configured
+        with override_settings(CRON_SECRET='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+            resp = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertGreater(resp.json()['refreshed']['market_stats'], 0)
+        self.assertFalse(MarketStat.objects.filter(dirty=True).exists())
+        columns = ['dimension', 'value', 'listing_type', *market_stats.STAT_FIELDS]
+        refreshed = list(MarketStat.objects.order_by(*columns[:3]).values_list(*columns))
+        market_stats.rebuild()
+        self.assertEqual(refreshed, list(MarketStat.objects.order_by(*columns[:3]).values_list(*columns)))
+
+    def test_api_is_cached(self):
+        with self.assertNumQueries(1):
+            body = self.client.get(reverse('api-market-stats'), {'dimension': 'state', 'type': 'sale'}).json()
+        self.assertEqual(len(body['results']),
+                         MarketStat.objects.filter(dimension='state', listing_type='sale').count())
+        with self.assertNumQueries(0):
+            self.client.get(reverse('api-market-stats'), {'dimension': 'state', 'type': 'sale'})
+        self.assertEqual(self.client.get(reverse('api-market-stats'), {'dimension': 'zip'}).status_code, 400)
+
+
+@override_settings(INQUIRY_WORKER='inline', REFRESH_WORKER='inline')
+class InquiryPipelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.realtor = Realtor.objects.create(name='Ravi', phone='1', email='ravi@example.com')
+        cls.owner = User.objects.create_user('owner', email='owner@example.com', password='pw')
+        cls.buyer = User.objects.create_user('buyer', password='pw')
+        cls.listing = Listing.objects.create(title='Lake view flat', address='1 Lake Rd', city='Pune',
+                                             state='Maharashtra', price=4_000_000, is_published=True,
+                                             realtor=cls.realtor, posted_by=cls.owner)
+
+    def inquire(self, listing_pk=None, **extra):
+        data = {'listing_id': listing_pk or self.listing.pk, 'name': 'Asha', 'email': 'asha@example.com',
+                'phone': '98', 'message': 'Is it available?', **extra}
+        return self.client.post(reverse('contact'), data)
+
+    def test_request_only_queues(self):
+        self.client.force_login(self.buyer)
+        self.client.get(reverse('dashboard'))   # session and user lookups are warm afterwards
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            self.assertRedirects(self.inquire(), reverse('listing', args=[self.listing.pk]),
+                                 fetch_redirect_response=False)
+        writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual([sql.split()[2] for sql in writes if sql.startswith('INSERT')], ['"main_inquiryoutbox"'])
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_worker_saves_dedupes_and_notifies(self):
+        self.client.force_login(self.buyer)
+        def feedback(resp):
+            return [str(m) for m in get_messages(resp.wsgi_request)][-1]   # earlier ones are still unread
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIn('Your inquiry has been sent!', feedback(self.inquire()))
+            # still queued: told so, as once it is saved
+            self.assertIn('already submitted', feedback(self.inquire(message='Second try')))
+        self.assertIn('already submitted', feedback(self.inquire(message='Third try')))
+        contact = Contact.objects.get()
+        self.assertEqual((contact.user, contact.message), (self.buyer, 'Is it available?'))
+        self.assertIsNotNone(contact.notified_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ravi@example.com', 'owner@example.com'])
+        self.assertEqual(mail.outbox[0].reply_to, ['asha@example.com'])
+        self.assertFalse(InquiryOutbox.objects.exists())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Contact.objects.create(listing=self.listing, user=self.buyer, name='x', email='x@example.com')
+
+    def test_unknown_and_unpublished_listings(self):
+        draft = Listing.objects.create(title='Draft', address='2 Lake Rd', city='Pune', state='Maharashtra',
+                                       price=1, is_published=False)
+        self.assertEqual(self.inquire(listing_pk=self.listing.pk + 100).status_code, 404)
+        self.assertEqual(self.inquire(listing_pk=draft.pk).status_code, 404)
+        self.assertEqual(self.client.post(reverse('contact'), {'listing_id': 'x'}).status_code, 404)
+        self.assertFalse(InquiryOutbox.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inquire(name='Anon')   # anonymous inquiries are never deduplicated
+            self.inquire(name='Anon')
+        self.assertEqual(Contact.objects.count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inquire(name='Late')
+            Listing.objects.filter(pk=self.listing.pk).update(is_published=False)   # before the worker runs
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertFalse(InquiryOutbox.objects.exists())
+
+    def test_failed_notification_is_retried_with_backoff(self):
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('smtp down')), \
+                self.assertLogs('main.inquiries', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            self.inquire()
+        contact = Contact.objects.get()
+        self.assertEqual((contact.notify_attempts, contact.notified_at), (1, None))
+        self.assertIn('smtp down', contact.notify_error)
+        self.assertGreater(contact.notify_after, timezone.now())
+        self.assertEqual(inquiries.notify(), (0, 0))   # not due yet
+        Contact.objects.update(notify_after=timezone.now())
+        self.assertEqual(inquiries.notify(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(inquiries.retry_delay(20), inquiries.RETRY_MAX)
+
+
+class DashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.poster = User.objects.create_user('poster', password='pw')
+        cls.buyers = [User.objects.create_user(f'buyer{i}', password='pw') for i in range(5)]
+
+    def add_listings(self, n):
+        """``n`` listings, every other one live; the i-th has min(i, 5) inquiries, an hour apart."""
+        now = timezone.now()
+        listings = Listing.objects.bulk_create(
+            Listing(title=f'Flat {n}-{i}', address='1 Main St', city='Pune', state='Maharashtra', price=1_000_000,
+                    is_published=i % 2 == 0, posted_by=self.poster, list_date=now - timedelta(days=i))
+            for i in range(n))
+        Contact.objects.bulk_create(
+            Contact(listing=listing, user=buyer, name=buyer.username, email=f'{buyer.username}@example.com',
+                    contact_date=now - timedelta(hours=j))
+            for i, listing in enumerate(listings) for j, buyer in enumerate(self.buyers[:i]))
+
+    def test_inquiry_counts_in_a_fixed_number_of_queries(self):
+        self.client.force_login(self.poster)
+        elsewhere = Listing.objects.create(title='Elsewhere', address='2 Rd', city='Pune', state='Maharashtra',
+                                           price=1, is_published=True)
+        Contact.objects.create(listing=elsewhere, user=self.poster, name='poster', email='poster@example.com')
+        self.add_listings(2)
+        # session, user, listings with counts, latest inquiries, inquiries sent
+        with self.assertNumQueries(5):
+            self.client.get(reverse('dashboard'))
+        self.add_listings(10)
+        with self.assertNumQueries(5):
+            resp = self.client.get(reverse('dashboard'))
+
+        listings = {l.title: l for l in resp.context['my_listings']}
+        self.assertEqual(len(listings), 12)
+        self.assertEqual(resp.context['live_count'], 1 + 5)
+        self.assertEqual(resp.context['received_count'], 1 + (0 + 1 + 2 + 3 + 4 + 5 * 5))
+        self.assertEqual(listings['Flat 10-7'].inquiry_count, 5)
+        self.assertEqual([c.name for c in listings['Flat 10-7'].latest_inquiries], ['buyer0', 'buyer1', 'buyer2'])
+        self.assertEqual(listings['Flat 10-0'].latest_inquiries, [])
+        self.assertEqual([c.listing.title for c in resp.context['contacts']], ['Elsewhere'])
+        self.assertContains(resp, '5 inquiries')
+        self.assertContains(resp, '1 inquiry\n')
+        self.assertContains(resp, 'Pending')
+
+
+@override_settings(REFRESH_WORKER='inline')
+class ListingAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        seed_listings(150)
+        realtors = Realtor.objects.bulk_create(Realtor(name=f'R{i}', phone='1', email=f'r{i}@example.com')
+                                               for i in range(3))
+        for i, realtor in enumerate(realtors):
+            Listing.objects.filter(pk__gt=i * 40).update(realtor=realtor, posted_by=cls.admin)
+        Listing.objects.filter(pk=1).update(title='Heritage bungalow', external_id='feed-77')
+        search.rebuild_index()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:main_listing_changelist')
+
+    def test_changelist_query_count_is_independent_of_the_page(self):
+        self.client.get(self.url)   # warm the cached filter choices
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(len(resp.context['cl'].result_list), 100)
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([sql for sql in sqls if 'DISTINCT' in sql])
+        self.assertEqual(sum('"auth_user"' in sql for sql in sqls), 2)   # the session user, the page join
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url, {'p': 2})   # the last 50 rows
+        self.assertEqual(len(small.captured_queries), len(sqls))
+        self.assertContains(resp, 'Pune')   # city filter choices, from the cache
+
+    def test_unfiltered_count_is_estimated(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_above', 100):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(self.url)
+            self.assertEqual(resp.context['cl'].result_count, 150)   # sqlite_stat1, from ANALYZE
+            self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+            resp = self.client.get(self.url, {'listing_type': 'rent'})
+            self.assertEqual(resp.context['cl'].result_count, Listing.objects.filter(listing_type='rent').count())
+        self.assertIsNone(estimated_count(Contact))
+
+    def test_search_uses_the_full_text_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url, {'q': 'heritage'})
+        self.assertEqual([l.pk for l in resp.context['cl'].result_list], [1])
+        self.assertTrue(any(search.FTS_TABLE in q['sql'] for q in ctx.captured_queries))
+        resp = self.client.get(self.url, {'q': 'feed-77'})
+        self.assertEqual([l.pk for l in resp.context['cl'].result_list], [1])
+
+    def test_bulk_publish_is_one_update(self):
+        market_stats.rebuild()
+        drafts = list(Listing.objects.filter(is_published=False).values_list('pk', flat=True))
+        home = caching.generation('home')
+        before = {(s.dimension, s.value, s.listing_type): s.count for s in MarketStat.objects.all()}
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(self.url, {'action': 'publish', '_selected_action': drafts[:5] + [1, 2]},
+                                    follow=True)
+        self.assertContains(resp, 'Published 5 listing(s).')
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "main_listing"') for q in ctx.captured_queries), 1)
+        self.assertEqual(Listing.objects.filter(pk__in=drafts[:5], is_published=True).count(), 5)
+        self.assertTrue(all(l.updated_at > l.list_date for l in Listing.objects.filter(pk__in=drafts[:5])))
+        self.assertNotEqual(caching.generation('home'), home)
+        after = {(s.dimension, s.value, s.listing_type): s.count for s in MarketStat.objects.all()}
+        self.assertEqual(sum(after.values()) - sum(before.values()), 5 * len(market_stats.DIMENSIONS))
+
+        self.client.post(self.url, {'action': 'unpublish', '_selected_action': drafts[:5]})
+        self.assertFalse(Listing.objects.filter(pk__in=drafts[:5], is_published=True).exists())
+
+
+class QueryBudgetMixin:
+    """``assertWithinQueryBudget()``: a GET may run at most ``settings.QUERY_BUDGETS[url_name]`` queries."""
+
+    def assertWithinQueryBudget(self, url_name, args=(), params=None):
+        budget = settings.QUERY_BUDGETS[url_name]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse(url_name, args=args), params or {})
+            if resp.streaming:
+                resp.getvalue()   # streamed bodies run their queries as they are sent
+        self.assertEqual(resp.status_code, 200, url_name)
+        self.assertLessEqual(len(ctx), budget, '{} ran {} queries (budget {}):\n{}'.format(
+            url_name, len(ctx), budget, '\n'.join(q['sql'] for q in ctx.captured_queries)))
+        return resp
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(60)
+        cls.user = User.objects.create_user('poster', password='pw', is_staff=True)
+        realtor = Realtor.objects.create(name='Meera', phone='1', email='meera@example.com')
+        Listing.objects.update(realtor=realtor)
+        Listing.objects.filter(pk__lte=20).update(posted_by=cls.user)
+        Contact.objects.bulk_create(Contact(listing_id=pk, name='Asha', email='asha@example.com')
+                                    for pk in range(1, 21) for _ in range(3))
+        market_stats.rebuild()
+        cls.published = Listing.objects.filter(is_published=True).values_list('pk', flat=True).first()
+
+    def setUp(self):
+        cache.clear()   # budgets hold for the uncached path
+        search._fts5_databases.clear()   # and for a fresh worker, whose first keyword search probes for FTS5
+        self.client.force_login(self.user)
+
+    def test_routes_stay_within_their_query_budgets(self):
+        self.assertWithinQueryBudget('index')
+        self.assertWithinQueryBudget('listings', params={'type': 'rent', 'page': 2})
+        self.assertWithinQueryBudget('listing', args=[self.published])
+        self.assertWithinQueryBudget('search', params={'keywords': 'villa', 'state': 'Delhi'})
+        self.assertWithinQueryBudget('dashboard')
+        self.assertWithinQueryBudget('saved-searches')
+        self.assertWithinQueryBudget('api-listings', params={'page_size': 50})
+        search._fts5_databases.clear()
+        self.assertWithinQueryBudget('api-listings', params={'q': 'villa', 'state': 'Delhi'})
+        self.assertWithinQueryBudget('api-listing-detail', args=[self.published])
+        self.assertWithinQueryBudget('api-market-stats')
+        self.assertEqual(set(settings.QUERY_BUDGETS) - {'index', 'listings', 'listing', 'search', 'dashboard',
+                                                        'saved-searches', 'api-listings', 'api-listing-detail',
+                                                        'api-market-stats'},
+                         set())
+
+    def test_server_timing_and_route_windows(self):
+        instrumentation.reset()
+        resp = self.client.get(reverse('dashboard'))
+        self.assertRegex(resp['Server-Timing'], r'^db;dur=[\d.]+;desc="5 queries", tpl;dur=[\d.]+, '
+                                                r'cache;desc="0 hits, 0 misses", app;dur=[\d.]+$')
+        self.assertNotIn('tpl;dur=0.0,', resp['Server-Timing'])
+        self.assertIn('cache;desc="0 hits, 3 misses"', self.client.get(reverse('index'))['Server-Timing'])
+        self.assertIn('desc="2 queries", tpl;dur=', self.client.get(reverse('index'))['Server-Timing'])
+        self.assertIn('cache;desc="3 hits, 0 misses"', self.client.get(reverse('index'))['Server-Timing'])
+        api = self.client.get(reverse('api-listings'))
+        self.assertNotIn('api-listings', instrumentation.route_stats())   # recorded once the body is sent
+        api.getvalue()
+        stats = instrumentation.route_stats()
+        self.assertEqual(stats['index']['requests'], 3)
+        self.assertEqual(stats['api-listings']['queries_max'], 3)
+        self.assertEqual(stats['dashboard']['budget'], 5)
+
+        with override_settings(QUERY_BUDGETS={'dashboard': 1}), self.assertLogs('main.instrumentation', 'WARNING'):
+            self.client.get(reverse('dashboard'))
+        body = json.loads(self.client.get(reverse('request-stats'), {'format': 'json'}).content)
+        self.assertEqual(body['routes']['dashboard']['requests'], 2)
+        self.assertContains(self.client.get(reverse('request-stats')), '<code>api-listings</code>')
+        self.client.force_login(User.objects.create_user('buyer', password='pw'))
+        self.assertEqual(self.client.get(reverse('request-stats')).status_code, 302)
+
+    async def test_async_views_count_their_queries(self):
+        resp = await self.async_client.get(reverse('api-listing-detail', args=[self.published]))
+        self.assertIn('desc="2 queries"', resp['Server-Timing'])
+
+
+@override_settings(REFRESH_WORKER='inline')
+class ImportListingsTests(TestCase):
+    HEADER = 'external_id,title,address,city,state,price,listing_type,bedrooms,bathrooms,latitude,longitude,photo_main\n'
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        override = override_settings(MEDIA_ROOT=os.path.join(self.dir, 'media'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_import(self, text, name='feed.csv', *args):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_listings', path, '--batch-size', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upsert_with_per_row_errors(self):
+        os.makedirs(os.path.join(self.dir, 'photos'))
+        with open(os.path.join(self.dir, 'photos', 'a.jpg'), 'wb') as fh:
+            fh.write(_jpeg(40, 30).read())
+        feed = self.HEADER + (
+            'p-1,Sea view flat,1 Marine Dr,Mumbai,Maharashtra,9000000,sale,2,2.5,18.94,72.82,a.jpg\n'
+            'p-2,Garden villa,2 Palm Rd,Pune,Maharashtra,15000000,rent,4,,,,\n'
+            'p-3,No price,3 Rd,Pune,Maharashtra,lots,sale,,,,,\n'
+            ',Missing id,4 Rd,Pune,Maharashtra,100,lease,two,,19.0,,\n'
+            'p-4,Lost photo,5 Rd,Pune,Maharashtra,100,sale,,,,,missing.jpg\n'
+        )
+        out, err = self.run_import(feed, 'feed.csv', '--photos', os.path.join(self.dir, 'photos'))
+        self.assertIn('Imported 2 of 5 rows (2 new, 0 updated, 3 errors)', out)
+        self.assertIn('4: p-3: price: must be a positive whole number', err)
+        self.assertIn('5: -: external_id: required; listing_type: must be one of sale, rent; bedrooms: expected a number from 0 to 100; latitude/longitude: give both or '
+                      'neither', err)
+        self.assertIn('photo_main: photo not found: missing.jpg', err)
+        flat = Listing.objects.get(external_id='p-1')
+        self.assertEqual(flat.geohash, geo.encode(18.94, 72.82))
+        self.assertEqual(str(flat.bathrooms), '2.5')
+        self.assertRegex(flat.photo_main.name, r'^listings/import/p-1/a\.[0-9a-f]{12}\.jpg$')
+        self.assertTrue(flat.photo_main.storage.exists(flat.photo_main.name))
+        self.assertEqual(Listing.objects.get(external_id='p-2').listing_type, 'rent')
+        self.assertEqual(list(search.search_listings(Listing.objects.all(), 'garden').values_list('external_id', flat=True)),
+                         ['p-2'])
+        self.assertTrue(MarketStat.objects.filter(dimension='city', value='Mumbai', listing_type='sale').exists())
+
+        # Re-import: updates in place; the photo column is absent, so the photo is kept
+        pk = flat.pk
+        out, _ = self.run_import('external_id,title,city,state,price\np-1,Sea view flat,Mumbai,Maharashtra,8500000\n')
+        self.assertIn('(0 new, 1 updated, 0 errors)', out)
+        flat = Listing.objects.get(external_id='p-1')
+        self.assertEqual((flat.pk, flat.price), (pk, 8_500_000))
+        self.assertRegex(flat.photo_main.name, r'^listings/import/p-1/a\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(MarketStat.objects.get(dimension='city', value='Mumbai', listing_type='sale').median_price,
+                         8_500_000)
+
+    def test_changed_photo_of_the_same_size_is_replaced(self):
+        from PIL import Image
+
+        photos = os.path.join(self.dir, 'photos')
+        os.makedirs(photos)
+        blobs = []
+        for colour in [(200, 120, 40), (20, 60, 220)]:
+            buf = io.BytesIO()
+            Image.new('RGB', (800, 600), colour).save(buf, 'JPEG')
+            blobs.append(buf.getvalue())
+        size = max(map(len, blobs))
+        blobs = [blob + b'\0' * (size - len(blob)) for blob in blobs]   # decoders ignore trailing bytes
+        feed = 'external_id,title,city,state,price,photo_main\np-1,Flat,Pune,Maharashtra,100,a.jpg\n'
+
+        names = []
+        for blob in blobs:
+            with open(os.path.join(photos, 'a.jpg'), 'wb') as fh:
+                fh.write(blob)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.run_import(feed, 'feed.csv', '--photos', photos)
+            flat = Listing.objects.get(external_id='p-1')
+            self.assertNotIn('photo_main', flat.photo_variants)   # the old record is gone with the old file
+            call_command('generate_image_derivatives', stdout=io.StringIO())
+            flat.refresh_from_db()
+            self.assertEqual(flat.photo_variants['photo_main']['name'], flat.photo_main.name)
+            names.append(flat.photo_main.name)
+        self.assertNotEqual(*names)
+        storage = flat.photo_main.storage
+        self.assertFalse(storage.exists(images.derivative_name(names[0], 320)))
+        self.assertTrue(storage.exists(images.derivative_name(names[1], 320)))
+        with storage.open(names[1]) as fh:
+            self.assertEqual(fh.read(), blobs[1])
+        self.run_import(feed, 'feed.csv', '--photos', photos)   # unchanged: reused, record kept
+        flat.refresh_from_db()
+        self.assertEqual((flat.photo_main.name, flat.photo_variants['photo_main']['name']), (names[1], names[1]))
+
+    def test_json_formats_and_dry_run(self):
+        rows = [{'external_id': f'j-{i}', 'title': f'Flat {i}', 'city': 'Pune', 'state': 'Maharashtra',
+                 'price': 1_000_000 + i, 'is_published': i != 2} for i in range(5)]
+        rows[3]['title'] = 'x' * 300
+        text = json.dumps(rows, indent=2)
+        self.assertEqual([v for _, v in imports.read_json_array(io.StringIO(text), chunk_size=7)], rows)
+        self.assertEqual([v for _, v in imports.read_json_array(io.StringIO('[12345, 6 ]'), chunk_size=3)],
+                         [12345, 6])
+        out, _ = self.run_import(text, 'feed.json', '--dry-run')
+        self.assertIn('Validated 4 of 5 rows', out)
+        self.assertFalse(Listing.objects.exists())
+        out, err = self.run_import('\n'.join(map(json.dumps, rows)) + '\n{not json\n', 'feed.ndjson')
+        self.assertIn('Imported 4 of 6 rows', out)
+        self.assertIn('6: -: invalid JSON', err)
+        self.assertEqual(Listing.objects.filter(is_published=True).count(), 3)
+        with self.assertRaises(CommandError):
+            self.run_import('{"external_id": "x"}', 'feed.json')
+
+
+@override_settings(REFRESH_WORKER='inline')
+class SavedSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw', first_name='Asha')
+        cls.poster = User.objects.create_user('poster', 'poster@example.com', 'pw')
+
+    def publish(self, **fields):
+        values = dict(title='Flat', address='1 MG Road', city='Pune', state='Maharashtra', price=5_000_000,
+                      listing_type='sale', property_type='apartment', bedrooms=2, is_published=True,
+                      posted_by=self.poster)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Listing.objects.create(**{**values, **fields})
+
+    def matched(self, saved_search):
+        return set(saved_search.matches.values_list('listing_id', flat=True))
+
+    def run_search(self, params):
+        """What search() returns for ``params``, minus the ordering."""
+        q = QueryDict(urlencode(params))
+        qs = Listing.objects.filter(is_published=True)
+        if q.get('city'):
+            qs = qs.filter(city__icontains=q['city'])
+        if q.get('bedrooms'):
+            qs = qs.filter(bedrooms__gte=q['bedrooms'])
+        qs, _ = geo.filter_queryset(qs, q)
+        qs = facets.apply(qs, facets.selection(state=q.get('state'), property_type=q.get('property_type'),
+                                               listing_type=q.get('listing_type'), price=q.get('price')))
+        return set(search.search_listings(qs, q.get('keywords'), ranked=False).values_list('pk', flat=True))
+
+    def test_normalize_keeps_what_search_applies(self):
+        params = saved_searches.normalize(QueryDict(
+            'state=%20Kerala%20&listing_type=RENT&property_type=castle&price=abc&keywords=Sea,%20%20VIEW'
+            '&bedrooms=2&lat=19.07&lng=72.87&radius=&page=3'))
+        self.assertEqual(params, {'state': 'Kerala', 'listing_type': 'rent', 'keywords': 'sea view', 'bedrooms': '2'})
+        saved = SavedSearch.objects.create(user=self.buyer, params=params)
+        self.assertEqual((saved.state, saved.listing_type, saved.property_type, saved.max_price),
+                         ('KERALA', 'rent', '', SavedSearch.ANY_PRICE))
+        self.assertEqual(saved.query, 'bedrooms=2&keywords=sea+view&listing_type=rent&state=Kerala')
+        self.assertEqual(saved.summary, 'Property for rent in Kerala · "sea view" · 2+ bedrooms')
+
+    def test_save_list_and_delete(self):
+        self.client.force_login(self.buyer)
+        self.assertContains(self.client.get(reverse('search'), {'state': 'Kerala'}), 'Save search')
+        resp = self.client.post(reverse('save-search'), {'query': 'state=Kerala&price=2000000&page=2'}, follow=True)
+        self.assertContains(resp, 'Search saved.')
+        resp = self.client.post(reverse('save-search'), {'query': 'price=2000000&state=Kerala'}, follow=True)
+        self.assertContains(resp, 'already saved')
+        resp = self.client.post(reverse('save-search'), {'query': 'page=2'}, follow=True)
+        self.assertContains(resp, 'Pick at least one filter')
+        saved = SavedSearch.objects.get(user=self.buyer)
+        self.assertContains(self.client.get(reverse('saved-searches')), 'Property in Kerala · up to ₹2,000,000')
+
+        self.client.force_login(self.poster)
+        self.assertEqual(self.client.post(reverse('delete-saved-search', args=[saved.pk])).status_code, 404)
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('delete-saved-search', args=[saved.pk]))
+        self.assertFalse(SavedSearch.objects.exists())
+
+    def test_matches_agree_with_running_each_search(self):
+        rng = random.Random(7)
+        users = [self.poster] + [User.objects.create_user(f'u{i}') for i in range(20)]
+        options = {
+            'state': [None, 'Maharashtra', 'maharashtra', 'Karnataka'],
+            'listing_type': [None, 'sale', 'rent'],
+            'property_type': [None, 'apartment', 'villa'],
+            'price': [None, '2000000', '10000000'],
+            'city': [None, 'pune', 'Mum'],
+            'bedrooms': [None, '1', '3'],
+            'keywords': [None, 'garden', 'sea vi'],
+            'geo': [None, {'lat': '18.52', 'lng': '73.86', 'radius': '10'}, {'bbox': '72.7,18.8,73.0,19.2'}],
+        }
+        for i in range(300):
+            params = {}
+            for name, values in options.items():
+                value = rng.choice(values)
+                if isinstance(value, dict):
+                    params.update(value)
+                elif value:
+                    params[name] = value
+            SavedSearch.objects.get_or_create(user=users[i % len(users)], query=urlencode(sorted(params.items())),
+                                              defaults={'params': params})
+        places = [('Pune', 'Maharashtra', 18.53, 73.85), ('Mumbai', 'Maharashtra', 19.0, 72.85),
+                  ('Bengaluru', 'Karnataka', 12.97, 77.59)]
+        for i in range(40):
+            city, state, lat, lng = rng.choice(places)
+            self.publish(title=rng.choice(['Garden flat', 'Sea view villa', 'Corner plot']), city=city, state=state,
+                         latitude=lat + rng.uniform(-.1, .1), longitude=lng + rng.uniform(-.1, .1),
+                         price=rng.choice([1_500_000, 8_000_000, 30_000_000]), bedrooms=rng.choice([None, 1, 2, 4]),
+                         listing_type=rng.choice(['sale', 'rent']), property_type=rng.choice(['apartment', 'villa']),
+                         posted_by=rng.choice([self.poster, None]))
+        total = 0
+        for saved in SavedSearch.objects.all():
+            expected = self.run_search(saved.params)
+            expected -= set(Listing.objects.filter(posted_by=saved.user).values_list('pk', flat=True))
+            self.assertEqual(self.matched(saved), expected, saved.params)
+            total += len(expected)
+        self.assertGreater(total, 100)
+
+    def test_candidates_come_from_the_predicate_index(self):
+        self.assertIn('savedsearch_predicate_idx',
+                      saved_searches.candidates('Kerala', 'rent', 'villa', 5_000_000).explain())
+        listing = self.publish()
+        for state in ('Maharashtra', 'Kerala', 'Delhi', ''):
+            for price in ('2000000', '', '90000000'):
+                params = {'state': state, 'price': price, 'city': 'pune'}
+                SavedSearch.objects.create(user=self.buyer, params={k: v for k, v in params.items() if v})
+        with self.assertNumQueries(3):   # the listing, the candidates, the insert
+            self.assertEqual(saved_searches.match([listing.pk]), 4)   # Maharashtra or any, any price or 9Cr
+
+    def test_only_going_live_queues_a_match(self):
+        saved = SavedSearch.objects.create(user=self.buyer, params={'city': 'Pune'})
+        draft = self.publish(is_published=False)
+        live = self.publish()
+        self.assertEqual(self.matched(saved), {live.pk})
+        late = SavedSearch.objects.create(user=self.buyer, params={'state': 'Maharashtra'})
+        live.price = 4_000_000
+        with self.captureOnCommitCallbacks(execute=True):
+            live.save()   # already live: not news
+        self.assertEqual(self.matched(late), set())
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:main_listing_changelist'),
+                             {'action': 'publish', '_selected_action': [draft.pk, live.pk]})
+        self.assertEqual(self.matched(late), {draft.pk})
+
+        SavedSearch.objects.create(user=self.buyer, params={'city': 'Kochi'})
+        feed = io.StringIO('{"external_id": "k-1", "title": "Backwater villa", "city": "Kochi", "state": "Kerala", '
+                           '"price": 9000000}\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            imports.import_file(feed, 'ndjson', alerts=False)
+        self.assertFalse(SavedSearchMatch.objects.filter(listing__external_id='k-1').exists())
+        feed = io.StringIO('{"external_id": "k-2", "title": "Backwater flat", "city": "Kochi", "state": "Kerala", '
+                           '"price": 6000000}\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            imports.import_file(feed, 'ndjson')
+        self.assertTrue(SavedSearchMatch.objects.filter(listing__external_id='k-2').exists())
+
+    def test_digest_per_user(self):
+        SavedSearch.objects.create(user=self.buyer, params={'city': 'Pune'})
+        SavedSearch.objects.create(user=self.buyer, params={'listing_type': 'sale', 'price': '10000000'})
+        quiet = User.objects.create_user('quiet')   # no email address
+        SavedSearch.objects.create(user=quiet, params={'city': 'Pune'})
+        flat = self.publish(title='Garden flat')
+        gone = self.publish(title='Sold already')
+        gone.is_published = False
+        gone.save()
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP down')), \
+                self.assertLogs('main.saved_searches', 'WARNING'):
+            self.assertEqual(saved_searches.notify(), (0, 1, 1))   # quiet has no address
+        queued = SavedSearchMatch.objects.filter(notified_at__isnull=True)
+        self.assertEqual(queued.count(), 2)   # buyer's, backed off
+        self.assertEqual(set(queued.values_list('notify_attempts', flat=True)), {1})
+        self.assertGreater(queued.first().notify_after, timezone.now())
+        self.assertEqual(saved_searches.notify(), (0, 0, 0))   # not due yet
+
+        queued.update(notify_after=timezone.now())
+        self.assertEqual(saved_searches.notify(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual((message.to, message.subject), (['buyer@example.com'], '1 new property for your saved searches'))
+        self.assertIn(f'{settings.SITE_URL}/listings/{flat.pk}/', message.body)
+        self.assertIn('Property in Pune:', message.body)
+        self.assertIn('Property for sale · up to ₹10,000,000:', message.body)
+        self.assertNotIn('Sold already', message.body)
+        self.assertFalse(SavedSearchMatch.objects.filter(notified_at__isnull=True).exists())
+        self.assertEqual(saved_searches.notify(), (0, 0, 0))
+
+    def test_users_without_an_address_do_not_end_the_run(self):
+        users = [User.objects.create_user(f'quiet{i}') for i in range(2)] + [self.buyer]
+        for user in users:
+            SavedSearch.objects.create(user=user, params={'city': 'Pune'})
+        self.publish(title='Garden flat')
+        for i, user in enumerate(users):   # the buyer waits behind both
+            SavedSearchMatch.objects.filter(saved_search__user=user).update(
+                notify_after=timezone.now() - timedelta(minutes=3 - i))
+        out = io.StringIO()
+        with mock.patch.object(saved_searches, 'notify', partial(saved_searches.notify, batch_size=1)):
+            call_command('send_saved_search_alerts', stdout=out)
+        self.assertIn('1 alerts sent, 0 failed', out.getvalue())
+        self.assertEqual([m.to for m in mail.outbox], [['buyer@example.com']])
+
+    def test_failing_users_do_not_hold_up_the_rest(self):
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com') for i in range(3)]
+        for user in users:
+            SavedSearch.objects.create(user=user, params={'city': 'Pune'})
+        self.publish(title='Garden flat')
+        for i, user in enumerate(users):   # user0 has waited longest
+            SavedSearchMatch.objects.filter(saved_search__user=user).update(
+                notify_after=timezone.now() - timedelta(minutes=3 - i))
+        real_send = mail.EmailMessage.send
+
+        def send(message, *args, **kwargs):
+            if message.to == ['user0@example.com']:
+                raise OSError('mailbox full')
+            return real_send(message, *args, **kwargs)
+
+        with mock.patch('django.core.mail.EmailMessage.send', send), self.assertLogs('main.saved_searches', 'WARNING'):
+            self.assertEqual(saved_searches.notify(batch_size=1), (0, 1, 0))   # user0, first in line
+            out = io.StringIO()
+            call_command('send_saved_search_alerts', stdout=out)   # goes on past the failure
+        self.assertIn('2 alerts sent, 0 failed', out.getvalue())
+        self.assertEqual(sorted(m.to for m in mail.outbox), [['user1@example.com'], ['user2@example.com']])
+
+        stuck = SavedSearchMatch.objects.filter(saved_search__user=users[0])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('mailbox full')), \
+                self.assertLogs('main.saved_searches', 'WARNING'):
+            for _ in range(saved_searches.MAX_ATTEMPTS - 1):
+                stuck.update(notify_after=timezone.now())
+                self.assertEqual(saved_searches.notify(), (0, 1, 0))
+        stuck.update(notify_after=timezone.now())
+        self.assertEqual(saved_searches.notify(), (0, 0, 0))   # given up
+        self.assertEqual(stuck.get().notify_attempts, saved_searches.MAX_ATTEMPTS)
+
+
+@override_settings(REFRESH_WORKER='inline')
+class SimilarListingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_listings(150)
+        # a block close enough to be ranked within itself (see similar.nearest)
+        Listing.objects.bulk_create(
+            Listing(title=f'Pune flat #{i}', address=f'{i} FC Road', city='Pune', state='Maharashtra',
+                    price=8_000_000 + 37_000 * i, sqft=900 + 13 * i, bedrooms=2, listing_type=Listing.SALE,
+                    property_type=Listing.APARTMENT, is_published=True)
+            for i in range(20))
+        similar.rebuild()
+
+    @staticmethod
+    def distance(a, b):
+        """The module docstring's distance, one pair at a time."""
+        d2 = (math.log2(a.price) - math.log2(b.price)) ** 2
+        d2 += (math.log2(a.sqft) - math.log2(b.sqft)) ** 2 if a.sqft and b.sqft else similar.MISSING ** 2
+        d2 += (((a.bedrooms or 0) - (b.bedrooms or 0)) * similar.SCALE['bedrooms']) ** 2
+        d2 += ((float(a.bathrooms or 0) - float(b.bathrooms or 0)) * similar.SCALE['bathrooms']) ** 2
+        d2 += similar.MISMATCH['property_type'] ** 2 * (a.property_type != b.property_type)
+        d2 += similar.MISMATCH['city'] ** 2 * (a.city.strip().lower() != b.city.strip().lower())
+        return math.sqrt(d2)
+
+    def stored(self):
+        return set(SimilarListing.objects.values_list('listing', 'rank', 'neighbour'))
+
+    def test_rebuild_matches_brute_force(self):
+        published = list(Listing.objects.filter(is_published=True))
+        for listing in published:
+            pool = [other for other in published if other.listing_type == listing.listing_type and other != listing]
+            expected = sorted(pool, key=lambda other: (self.distance(listing, other), other.pk))[:similar.K]
+            rows = list(SimilarListing.objects.filter(listing=listing).order_by('rank'))
+            self.assertEqual([row.neighbour_id for row in rows], [other.pk for other in expected])
+            for row, other in zip(rows, expected):
+                self.assertAlmostEqual(row.distance, self.distance(listing, other), places=4)
+        cluster = Listing.objects.filter(title__startswith='Pune flat')
+        self.assertFalse(SimilarListing.objects.filter(listing__in=cluster).exclude(neighbour__in=cluster).exists())
+        self.assertFalse(SimilarListing.objects.filter(listing__is_published=False).exists())
+
+    def test_incremental_refresh_agrees_with_rebuild(self):
+        listings = list(Listing.objects.filter(is_published=True).order_by('pk')[:5])
+        before = dict(Listing.objects.values_list('pk', 'updated_at'))
+        with self.captureOnCommitCallbacks(execute=True):
+            listings[0].price *= 3
+            listings[0].save()
+        # only the listing, its former neighbours' listings and those it now beats
+        self.assertLess(sum(before[pk] != at for pk, at in Listing.objects.values_list('pk', 'updated_at')), 30)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listings[1].is_published = False
+            listings[1].save()
+            listings[2].listing_type = Listing.RENT if listings[2].listing_type == Listing.SALE else Listing.SALE
+            listings[2].save()
+            listings[3].delete()
+            Listing.objects.create(title='Twin of #4', address='5 MG Road', city=listings[4].city,
+                                   state=listings[4].state, price=listings[4].price + 10_000, sqft=listings[4].sqft,
+                                   bedrooms=listings[4].bedrooms, listing_type=listings[4].listing_type,
+                                   property_type=listings[4].property_type, is_published=True)
+        self.assertFalse(SimilarListing.objects.filter(listing=listings[1]).exists())
+        incremental = self.stored()
+        similar.rebuild()
+        self.assertEqual(incremental, self.stored())
+
+    def test_edits_are_queued_for_the_refresh_worker(self):
+        listing, other = Listing.objects.filter(is_published=True).order_by('pk')[:2]
+        stored = self.stored()
+        with override_settings(REFRESH_WORKER='off'), self.captureOnCommitCallbacks(execute=True):
+            listing.price *= 3
+            listing.save()
+            similar.mark_dirty(stale=[listing.pk, other.pk])   # doesn't undo the move
+        self.assertEqual(self.stored(), stored)   # nothing refreshed at commit
+        self.assertEqual(dict(SimilarRefresh.objects.values_list('listing_pk', 'moved')),
+                         {listing.pk: True, other.pk: False})
+
+        call_command('refresh_stale', stdout=io.StringIO())
+        self.assertFalse(SimilarRefresh.objects.exists())
+        incremental = self.stored()
+        self.assertNotEqual(incremental, stored)
+        similar.rebuild()
+        self.assertEqual(incremental, self.stored())
+
+    def test_deferred_refresh_gives_the_page_a_new_version(self):
+        twin = Listing.objects.filter(is_published=True).first()
+        with override_settings(REFRESH_WORKER='off'), self.captureOnCommitCallbacks(execute=True):
+            listing = Listing.objects.create(title='Fresh twin', address='7 MG Road', city=twin.city, state=twin.state,
+                                             price=twin.price, sqft=twin.sqft, bedrooms=twin.bedrooms,
+                                             listing_type=twin.listing_type, property_type=twin.property_type,
+                                             is_published=True)
+        url = reverse('listing', args=[listing.pk])
+        first = self.client.get(url)
+        self.assertEqual(first.context['similar'], [])   # served before the worker ran
+        similar.refresh_dirty()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['similar']), similar.SHOWN)
+
+    def test_listing_page_shows_neighbours_and_follows_their_edits(self):
+        listing = Listing.objects.filter(is_published=True).first()
+        url = reverse('listing', args=[listing.pk])
+        first = self.client.get(url)
+        shown = [row.neighbour for row in SimilarListing.objects.filter(listing=listing).order_by('rank')]
+        for neighbour in shown[:similar.SHOWN]:
+            self.assertContains(first, reverse('listing', args=[neighbour.pk]))
+        self.assertNotContains(first, reverse('listing', args=[shown[similar.SHOWN].pk]))
+
+        # A card-only edit keeps the neighbours but must change the pages showing it
+        neighbour = shown[0]
+        neighbour.title = 'Freshly painted'
+        with mock.patch.object(similar, 'refresh') as refresh, self.captureOnCommitCallbacks(execute=True):
+            neighbour.save()
+        refresh.assert_not_called()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, 'Freshly painted')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            neighbour.is_published = False
+            neighbour.save()
+        resp = self.client.get(url)
+        self.assertNotContains(resp, 'Freshly painted')
+        self.assertEqual(len(similar.for_listing(listing.pk)), similar.SHOWN)
+
+
+class ReadReplicaTests(SimpleTestCase):
+    databases = {'default'}   # queries allowed, but no test-wide transaction (reads in one stay on the primary)
+
+    # Two SQLite files, the replica refreshed by hand: it lags until synced
+    PROBE = (
+        'import io, json, django; django.setup()\n'
+        'from django.contrib.auth.models import User\n'
+        'from django.core.management import call_command\n'
+        'from django.db import connections\n'
+        'from django.test import Client\n'
+        'from django.test.utils import CaptureQueriesContext\n'
+        'from main.replicas import PIN_COOKIE\n'
+        'call_command("migrate", verbosity=0)\n'
+        'User.objects.create_user("poster", password="pw")\n'
+        'client, out = Client(), {}\n'
+        'def get(url):\n'
+        '    with CaptureQueriesContext(connections["default"]) as primary, \\\n'
+        '            CaptureQueriesContext(connections["replica1"]) as replica:\n'
+        '        body = client.get(url).content.decode()\n'
+        '    return "Lakeside flat" in body, len(primary), len(replica)\n'
+        'out["login_pins"] = PIN_COOKIE in client.post("/login/", {"username": "poster", "password": "pw"}).cookies\n'
+        'call_command("sync_sqlite_replicas", stdout=io.StringIO())\n'
+        'client.cookies.pop(PIN_COOKIE)\n'
+        'out["listings"] = get("/listings/")\n'
+        'client.post("/post-listing/", {"title": "Lakeside flat", "address": "1 Lake Rd", "city": "Bhopal",\n'
+        '                               "state": "Madhya Pradesh", "price": "4500000"})\n'
+        'out["pinned"] = get("/dashboard/")\n'
+        'Client().get("/")   # someone else fills the home cache before the replica catches up\n'
+        'out["pinned_home"] = get("/")\n'
+        'client.cookies.pop(PIN_COOKIE)   # the window is over, but the replica still lags\n'
+        'out["stale"] = get("/dashboard/")\n'
+        'call_command("sync_sqlite_replicas", stdout=io.StringIO())\n'
+        'out["synced"] = get("/dashboard/")\n'
+        'print(json.dumps(out))\n'
+    )
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_safe_requests_read_from_a_replica_until_they_write(self):
+        router, seen = replicas.ReplicaRouter(), {}
+
+        def view(request):
+            seen['read'] = router.db_for_read(Listing)
+            with transaction.atomic():
+                seen['atomic'] = router.db_for_read(Listing)
+            if request.method == 'POST' or 'write' in request.GET:
+                router.db_for_write(Listing)
+            seen['after'] = router.db_for_read(Listing)
+            return HttpResponse()
+
+        middleware = replicas.ReplicaRoutingMiddleware(view)
+        resp = middleware(RequestFactory().get('/'))
+        self.assertEqual(seen, {'read': 'replica1', 'atomic': 'default', 'after': 'replica1'})
+        self.assertNotIn(replicas.PIN_COOKIE, resp.cookies)
+
+        resp = middleware(RequestFactory().get('/', {'write': 1}))
+        self.assertEqual((seen['read'], seen['after']), ('replica1', 'default'))
+        pin = resp.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 5)
+        request = RequestFactory().get('/')
+        request.COOKIES[replicas.PIN_COOKIE] = pin.value
+        middleware(request)
+        self.assertEqual(seen['read'], 'default')   # read-your-writes window
+        request.COOKIES[replicas.PIN_COOKIE] = str(time.time() - 1)
+        middleware(request)
+        self.assertEqual(seen['read'], 'replica1')
+
+        resp = middleware(RequestFactory().post('/'))
+        self.assertEqual(seen['read'], 'default')
+        self.assertIn(replicas.PIN_COOKIE, resp.cookies)
+        self.assertEqual(router.db_for_read(Listing), 'default')   # outside requests
+        self.assertFalse(router.allow_migrate('replica1', 'main'))
+
+    def test_two_sqlite_databases(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        env = {**os.environ, 'DEBUG': 'True', 'DJANGO_SETTINGS_MODULE': 'config.settings',
+               'DATABASE_URL': f'sqlite:///{tmp}/primary.sqlite3',
+               'DATABASE_REPLICA_URLS': f'sqlite:///{tmp}/replica.sqlite3',
+               'INQUIRY_WORKER': 'inline', 'IMAGE_DERIVATIVE_WORKERS': '0',
+               'REFRESH_WORKER': 'inline'}
+        proc = subprocess.run([sys.executable, '-c', self.PROBE], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        out = json.loads(proc.stdout.strip().splitlines()[-1])
+        self.assertTrue(out['login_pins'])
+        found, primary, replica = out['listings']
+        self.assertEqual(primary, 0)   # an anonymous page view never touches the primary
+        self.assertGreater(replica, 0)
+        found, primary, replica = out['pinned']
+        self.assertTrue(found)   # their own listing, right after the redirect
+        self.assertEqual(replica, 0)
+        self.assertTrue(out['pinned_home'][0])   # cached entries are built from the primary
+        found, primary, replica = out['stale']
+        self.assertFalse(found)
+        self.assertGreater(replica, 0)
+        self.assertTrue(out['synced'][0])
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .coldstart import lazy_view
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -13,7 +14,16 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
-    # REST API
-    path('api/listings/', views.api_listings, name='api-listings'),
-    path('api/listings/<int:pk>/', views.api_listing_detail, name='api-listing-detail'),
+    path('searches/', views.saved_search_list, name='saved-searches'),
+    path('searches/save/', views.save_search, name='save-search'),
+    path('searches/<int:pk>/delete/', views.delete_saved_search, name='delete-saved-search'),
+    # JSON API: async views, imported on the first API request (see main/coldstart.py)
+    path('api/listings/', lazy_view('main.api.api_listings', csrf_exempt=True, is_async=True),
+         name='api-listings'),
+    path('api/listings/export/', views.api_listings_export, name='api-listings-export'),
+    path('api/listings/<int:pk>/', lazy_view('main.api.api_listing_detail', csrf_exempt=True, is_async=True),
+         name='api-listing-detail'),
+    path('api/stats/', views.api_market_stats, name='api-market-stats'),
+    path('stats/requests/', views.request_stats, name='request-stats'),
+    path('tasks/refresh-stale/', views.refresh_stale, name='refresh-stale'),
 ]
@@ -1,63 +1,158 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from django.http import Http404, JsonResponse, QueryDict, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.contrib import auth, messages
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
-from django.contrib.auth.decorators import login_required
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from rest_framework import serializers
-from .models import Listing, Realtor, Contact
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.middleware.csrf import get_token
+from .models import Listing, MarketStat, Realtor, Contact, InquiryOutbox, SavedSearch
+from .pagination import LookaheadPage
+from . import background, caching, exports, facets, geo, inquiries, instrumentation, saved_searches, search as fts, similar
+
+
+# ─── Listing Filters ─────────────────────────────────────────────────────────────
 
+def listing_filters(params):
+    """
+    ``(qs, selected)`` for the API filters: published listings narrowed by
+    everything except the facets (city, bedrooms, q, geo), and the facet
+    selection (state, property_type, type, price) still to be applied.
+    """
+    qs = Listing.objects.filter(is_published=True)
+    if params.get('city'):
+        qs = qs.filter(city__icontains=params['city'])
+    if params.get('bedrooms'):
+        qs = qs.filter(bedrooms__gte=params['bedrooms'])
+    qs, _ = geo.filter_queryset(qs, params)   # radius searches are annotated with distance
+    # Callers impose their own order, so q only filters here (no relevance order)
+    qs = fts.search_listings(qs, params.get('q'), ranked=False)
+    return qs, facets.selection(state=params.get('state'), property_type=params.get('property_type'),
+                                listing_type=params.get('type'), price=params.get('price'))
+
+
+def filter_listings(params):
+    """Published listings narrowed by the API filters (city, state, bedrooms, price, q, types, geo)."""
+    qs, selected = listing_filters(params)
+    return facets.apply(qs, selected)
+
+
+# ─── Conditional GET ─────────────────────────────────────────────────────────────
+# Validators come from one narrow query on updated_at, run before the object is
+# loaded or anything is rendered; a match short-circuits to 304 Not Modified.
+
+def listing_updated_at(request, pk):
+    if not hasattr(request, '_listing_updated_at'):
+        request._listing_updated_at = (Listing.objects.filter(pk=pk, is_published=True)
+                                       .values_list('updated_at', flat=True).first())
+    return request._listing_updated_at
+
+
+def make_listing_etag(pk, updated_at):
+    return f'"listing-{pk}-{updated_at.timestamp():.6f}"' if updated_at else None
+
+
+def listing_etag(request, pk):
+    return make_listing_etag(pk, listing_updated_at(request, pk))
+
+
+def _listing_page_etag(request, pk):
+    if len(messages.get_messages(request)):
+        return None   # pending flash messages have to be rendered
+    etag = listing_etag(request, pk)
+    if not etag:
+        return None
+    # The page embeds the inquiry form: its CSRF token (rotated on login) and
+    # the fields pre-filled from the current user's profile
+    get_token(request)   # a first visit gets its token now, as rendering would
+    user = request.user
+    form = '\n'.join([request.META['CSRF_COOKIE'], str(user.pk or 0),
+                      getattr(user, 'first_name', ''), getattr(user, 'last_name', ''), getattr(user, 'email', '')])
+    return f'{etag[:-1]}-{hashlib.md5(form.encode(), usedforsecurity=False).hexdigest()[:12]}"'
+
+
+def _listing_page_last_modified(request, pk):
+    return None if len(messages.get_messages(request)) else listing_updated_at(request, pk)
+
+
+# ─── Bulk Export ─────────────────────────────────────────────────────────────────
+# The async JSON endpoints live in main/api.py, imported on first use (see urls.py).
+
+@require_GET
+def api_listings_export(request):
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'detail': f'Unsupported format {fmt!r}; use one of {sorted(exports.FORMATS)}.'},
+                            status=400)
+    response = StreamingHttpResponse(
+        exports.stream(filter_listings(request.GET), fmt,
+                       media_base=request.build_absolute_uri(settings.MEDIA_URL)),
+        content_type=exports.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="listings-{timezone.localdate():%Y%m%d}.{fmt}"'
+    return response
 
-# ─── DRF Serializers ────────────────────────────────────────────────────────────
 
-class ListingSerializer(serializers.ModelSerializer):
-    price_inr = serializers.ReadOnlyField()
-    realtor_name = serializers.CharField(source='realtor.name', default='', read_only=True)
-    listing_type_display = serializers.CharField(source='get_listing_type_display', read_only=True)
+# ─── Market Statistics ───────────────────────────────────────────────────────────
+# Served from the MarketStat summary table (main/market_stats.py): O(groups).
 
-    class Meta:
-        model = Listing
-        fields = ['id', 'title', 'address', 'city', 'state', 'price', 'price_inr',
-                  'bedrooms', 'bathrooms', 'sqft', 'photo_main', 'listing_type',
-                  'listing_type_display', 'is_published', 'list_date', 'realtor_name']
+# ``dirty``: the percentiles wait for the deferred refresh (count, min/max and mean are exact)
+MARKET_STAT_COLUMNS = ['dimension', 'value', 'listing_type', 'count', 'min_price', 'max_price', 'mean_price',
+                       'p25_price', 'median_price', 'p75_price', 'median_price_per_sqft', 'dirty', 'updated_at']
 
 
-# ─── REST API Views ──────────────────────────────────────────────────────────────
+@require_GET
+@cache_control(public=True, max_age=60)
+def api_market_stats(request):
+    dimension = request.GET.get('dimension', '')
+    listing_type = request.GET.get('type', '')
+    if dimension and dimension not in dict(MarketStat.DIMENSION_CHOICES):
+        return JsonResponse({'detail': f'Unknown dimension {dimension!r}; use one of '
+                                       f'{[d for d, _ in MarketStat.DIMENSION_CHOICES]}.'}, status=400)
+    if listing_type and listing_type not in dict(Listing.LISTING_TYPE_CHOICES):
+        return JsonResponse({'detail': f'Unknown type {listing_type!r}; use sale or rent.'}, status=400)
 
-@api_view(['GET'])
-def api_listings(request):
-    qs = Listing.objects.filter(is_published=True).order_by('-list_date')
-    for param, field in [
-        ('city', 'city__icontains'),
-        ('state', 'state__iexact'),
-        ('bedrooms', 'bedrooms__gte'),
-        ('price', 'price__lte'),
-        ('q', 'title__icontains'),
-        ('type', 'listing_type__iexact'),
-    ]:
-        val = request.query_params.get(param)
-        if val:
-            qs = qs.filter(**{field: val})
-    serializer = ListingSerializer(qs, many=True, context={'request': request})
-    return Response(serializer.data)
-
-
-@api_view(['GET'])
-def api_listing_detail(request, pk):
-    listing = get_object_or_404(Listing, pk=pk, is_published=True)
-    serializer = ListingSerializer(listing, context={'request': request})
-    return Response(serializer.data)
+    def build():
+        qs = MarketStat.objects.all()
+        if dimension:
+            qs = qs.filter(dimension=dimension)
+        if listing_type:
+            qs = qs.filter(listing_type=listing_type)
+        return list(qs.values(*MARKET_STAT_COLUMNS))
+
+    # Invalidated whenever market_stats refreshes a group
+    results = caching.get_or_build('market-stats', f'{dimension or "all"}:{listing_type or "all"}', build)
+    return JsonResponse({'results': results})
 
 
 # ─── Page Views ─────────────────────────────────────────────────────────────────
 
+def _published_type_counts():
+    """{'sale': n, 'rent': m} in one grouped query."""
+    rows = (Listing.objects.filter(is_published=True)
+            .values('listing_type').annotate(n=Count('id')).order_by())
+    return {row['listing_type']: row['n'] for row in rows}
+
+
 def index(request):
+    # Invalidated by the Listing/Realtor save & delete signals (main/signals.py)
+    home = caching.get_or_build_many('home', {
+        'listings': lambda: list(Listing.objects.filter(is_published=True).order_by('-list_date')[:6]),
+        'realtors': lambda: list(Realtor.objects.order_by('-is_mvp', '-hire_date')[:3]),
+        'type_counts': _published_type_counts,
+    })
     context = {
-        'listings': Listing.objects.filter(is_published=True).order_by('-list_date')[:6],
-        'realtors': Realtor.objects.order_by('-is_mvp', '-hire_date')[:3],
-        'for_sale_count': Listing.objects.filter(is_published=True, listing_type='sale').count(),
-        'for_rent_count': Listing.objects.filter(is_published=True, listing_type='rent').count(),
+        'listings': home['listings'],
+        'realtors': home['realtors'],
+        'for_sale_count': home['type_counts'].get(Listing.SALE, 0),
+        'for_rent_count': home['type_counts'].get(Listing.RENT, 0),
     }
     return render(request, 'index.html', context)
 
@@ -69,7 +164,8 @@ def about(request):
 
 
 def listings(request):
-    qs = Listing.objects.filter(is_published=True).order_by('-list_date')
+    # the cards show each listing's realtor
+    qs = Listing.objects.filter(is_published=True).select_related('realtor').order_by('-list_date')
     listing_type = request.GET.get('type')
     if listing_type in ('sale', 'rent'):
         qs = qs.filter(listing_type=listing_type)
@@ -81,70 +177,76 @@ def listings(request):
     })
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_listing_page_etag, last_modified_func=_listing_page_last_modified)
 def listing(request, pk):
     return render(request, 'listing.html', {
-        'listing': get_object_or_404(Listing, pk=pk, is_published=True),
+        'listing': get_object_or_404(Listing.objects.select_related('realtor'), pk=pk, is_published=True),
+        # Precomputed by main/similar.py; a change to them bumps this listing's updated_at (the ETag)
+        'similar': similar.for_listing(pk),
     })
 
 
+SEARCH_PER_PAGE = 9
+SEARCH_COUNT_CAP = 1000
+SEARCH_RADII_KM = (2, 5, 10, 25, 50)
+
+
 def search(request):
-    qs = Listing.objects.filter(is_published=True)
     q = request.GET
-    if q.get('keywords'):  qs = qs.filter(title__icontains=q['keywords'])
+    qs = Listing.objects.filter(is_published=True).order_by('-list_date')
     if q.get('city'):      qs = qs.filter(city__icontains=q['city'])
-    if q.get('state'):     qs = qs.filter(state__iexact=q['state'])
     if q.get('bedrooms'):  qs = qs.filter(bedrooms__gte=q['bedrooms'])
-    if q.get('price'):     qs = qs.filter(price__lte=q['price'])
-    if q.get('listing_type') in ('sale', 'rent'):
-        qs = qs.filter(listing_type=q['listing_type'])
-    if q.get('property_type') in ('apartment', 'house', 'villa', 'land', 'commercial'):
-        qs = qs.filter(property_type=q['property_type'])
-    state = q.get('state', '')
-    ptype = q.get('property_type', '')
-    ltype = q.get('listing_type', '')
-    price_v = q.get('price', '')
-    states = ['Maharashtra', 'Karnataka', 'Delhi', 'Tamil Nadu', 'Gujarat',
-              'Telangana', 'Kerala', 'Rajasthan', 'West Bengal',
-              'Uttar Pradesh', 'Punjab', 'Haryana']
-    # Pre-compute selected booleans so templates need no == comparisons
+    qs, by_distance = geo.filter_queryset(qs, q)
+    selected = facets.selection(state=q.get('state'), property_type=q.get('property_type'),
+                                listing_type=q.get('listing_type'), price=q.get('price'))
+    facet_counts = facets.cached_counts('search', fts.search_listings(qs, q.get('keywords'), ranked=False),
+                                        selected, q)
+    qs = facets.apply(qs, selected)
+    if by_distance:
+        qs = fts.search_listings(qs, q.get('keywords'), ranked=False).order_by('distance', 'id')
+    else:
+        qs = fts.search_listings(qs, q.get('keywords'))   # relevance order when keywords given
+    # Option lists carry their own selected flag and count, so templates need no == comparisons
     return render(request, 'search.html', {
-        'listings':           qs.order_by('-list_date'),
+        'listings':           LookaheadPage(qs, q.get('page'), SEARCH_PER_PAGE, SEARCH_COUNT_CAP),
         'values':             q,
-        'state_opts':         [{'name': s, 'sel': state == s} for s in states],
-        'ptype_apartment':    ptype == 'apartment',
-        'ptype_house':        ptype == 'house',
-        'ptype_villa':        ptype == 'villa',
-        'ptype_land':         ptype == 'land',
-        'ptype_commercial':   ptype == 'commercial',
-        'ltype_sale':         ltype == 'sale',
-        'ltype_rent':         ltype == 'rent',
-        'price_20l':          price_v == '2000000',
-        'price_50l':          price_v == '5000000',
-        'price_1cr':          price_v == '10000000',
-        'price_2cr':          price_v == '20000000',
-        'price_5cr':          price_v == '50000000',
+        'by_distance':        by_distance,
+        'facets':             facet_counts,
+        'radius_opts':        [{'km': km, 'sel': q.get('radius') == str(km)} for km in SEARCH_RADII_KM],
     })
 
 
-
-
 def contact(request):
     if request.method != 'POST':
         return redirect('listings')
-    listing_obj = get_object_or_404(Listing, pk=request.POST.get('listing_id'))
-    if request.user.is_authenticated and Contact.objects.filter(listing=listing_obj, user=request.user).exists():
+    listing_pk = _safe_int(request.POST.get('listing_id'))
+    if listing_pk is None:
+        raise Http404('No listing given.')
+    # One indexed lookup for honest feedback; the worker still drops racing
+    # duplicates through the unique constraint (main/inquiries.py)
+    user = request.user if request.user.is_authenticated else None
+    asked = {} if user is None else {
+        'contacted': Exists(Contact.objects.filter(listing=OuterRef('pk'), user=user)),
+        'queued': Exists(InquiryOutbox.objects.filter(listing_pk=OuterRef('pk'), user=user)),
+    }
+    found = Listing.objects.filter(pk=listing_pk, is_published=True).annotate(**asked).values('pk', *asked).first()
+    if found is None:
+        raise Http404('No Listing matches the given query.')
+    if any(found[name] for name in asked):
         messages.error(request, 'You already submitted an inquiry for this property.')
-        return redirect('listing', pk=listing_obj.pk)
-    Contact.objects.create(
-        listing=listing_obj,
-        user=request.user if request.user.is_authenticated else None,
-        name=request.POST.get('name'),
-        email=request.POST.get('email'),
+        return redirect('listing', pk=listing_pk)
+    # Saved, deduplicated and emailed to the realtor by the worker
+    inquiries.submit(
+        listing_pk=listing_pk,
+        user=user,
+        name=request.POST.get('name', ''),
+        email=request.POST.get('email', ''),
         phone=request.POST.get('phone', ''),
         message=request.POST.get('message', ''),
     )
     messages.success(request, 'Your inquiry has been sent! A realtor will contact you soon.')
-    return redirect('listing', pk=listing_obj.pk)
+    return redirect('listing', pk=listing_pk)
 
 
 # ─── Auth Views ──────────────────────────────────────────────────────────────────
@@ -184,19 +286,65 @@ def logout_view(request):
     return redirect('index')
 
 
+DASHBOARD_LATEST_INQUIRIES = 3
+
+
 def dashboard(request):
     if not request.user.is_authenticated:
         return redirect('login')
     u = request.user
-    my_listings = Listing.objects.filter(posted_by=u).order_by('-list_date')
+    # A fixed number of queries however many listings the poster has: one for
+    # the listings with their inquiry counts, one for the latest inquiries of
+    # every listing at once (a sliced Prefetch is a ROW_NUMBER() window).
+    latest = Contact.objects.order_by('-contact_date', '-id')[:DASHBOARD_LATEST_INQUIRIES]
+    my_listings = list(
+        Listing.objects.filter(posted_by=u)
+        .annotate(inquiry_count=Count('contact'))
+        .prefetch_related(Prefetch('contact_set', queryset=latest, to_attr='latest_inquiries'))
+        .order_by('-list_date')
+    )
     return render(request, 'dashboard.html', {
-        'contacts': Contact.objects.filter(user=u).order_by('-contact_date'),
+        'contacts': Contact.objects.filter(user=u).select_related('listing').order_by('-contact_date'),
         'my_listings': my_listings,
-        'live_count': my_listings.filter(is_published=True).count(),
+        'live_count': sum(l.is_published for l in my_listings),
+        'received_count': sum(l.inquiry_count for l in my_listings),
         'display_name': u.first_name or u.username,
     })
 
 
+# ─── Saved Searches ──────────────────────────────────────────────────────────────
+
+@login_required(login_url='/login/')
+def saved_search_list(request):
+    searches = (SavedSearch.objects.filter(user=request.user)
+                .annotate(new_matches=Count('matches', filter=Q(matches__notified_at__isnull=True))))
+    return render(request, 'saved_searches.html', {'searches': searches})
+
+
+@require_POST
+@login_required(login_url='/login/')
+def save_search(request):
+    query = request.POST.get('query', '')
+    try:
+        _, created = saved_searches.save(request.user, QueryDict(query))
+    except ValueError as exc:
+        messages.error(request, str(exc))
+    else:
+        if created:
+            messages.success(request, "Search saved. We'll email you when new properties match it.")
+        else:
+            messages.info(request, 'You have already saved this search.')
+    return redirect(f'/search/?{query}')
+
+
+@require_POST
+@login_required(login_url='/login/')
+def delete_saved_search(request, pk):
+    get_object_or_404(SavedSearch, pk=pk, user=request.user).delete()
+    messages.success(request, 'Saved search deleted.')
+    return redirect('saved-searches')
+
+
 
 # ─── Property Posting ────────────────────────────────────────────────────────────
 
@@ -216,12 +364,29 @@ def _safe_float(val, default=None):
         return default
 
 
+def _coordinates(params):
+    """``(latitude, longitude)`` from the form: both valid or both blank, as ``imports.parse_row`` requires."""
+    latitude, longitude = (params.get(name, '').strip() for name in ('latitude', 'longitude'))
+    if bool(latitude) != bool(longitude):
+        raise ValueError('give both latitude and longitude, or neither')
+    if not latitude:
+        return None, None
+    values = []
+    for name, given, limit in (('latitude', latitude, 90), ('longitude', longitude, 180)):
+        value = _safe_float(given)
+        if value is None or not -limit <= value <= limit:
+            raise ValueError(f'{name} must be a number from {-limit} to {limit}')
+        values.append(value)
+    return tuple(values)
+
+
 @login_required(login_url='/login/')
 def post_listing(request):
     if request.method == 'POST':
         p = request.POST
         f = request.FILES
         try:
+            latitude, longitude = _coordinates(p)   # optional, for radius search
             listing = Listing(
                 posted_by=request.user,
                 listing_type=p.get('listing_type', 'sale'),
@@ -234,6 +399,8 @@ def post_listing(request):
                 bedrooms=_safe_int(p.get('bedrooms')),          # nullable — None for land
                 bathrooms=_safe_float(p.get('bathrooms')),      # nullable — None for land
                 sqft=_safe_int(p.get('sqft')),                  # nullable
+                latitude=latitude,
+                longitude=longitude,
                 description=p.get('description', '').strip(),
                 is_published=True,   # goes live immediately
             )
@@ -249,3 +416,27 @@ def post_listing(request):
         except Exception as exc:
             messages.error(request, f'Could not submit listing: {exc}')
     return render(request, 'post_listing.html')
+
+
+# ─── Scheduled Jobs ──────────────────────────────────────────────────────────────
+# For hosts without a worker process (Vercel's cron, see vercel.json)
+
+@require_GET
+def refresh_stale(request):
+    """Run the deferred refreshes (``manage.py refresh_stale``); needs ``Authorization: Bearer <CRON_SECRET>``."""
+    secret = settings.CRON_SECRET
+    if not secret or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {secret}'):
+        return JsonResponse({'detail': 'Forbidden'}, status=403)
+    results = background.run_all()
+    return JsonResponse({'refreshed': {path.rsplit('.', 2)[-2]: n for path, n in results.items()}})
+
+
+# ─── Instrumentation ─────────────────────────────────────────────────────────────
+
+@user_passes_test(lambda u: u.is_active and u.is_staff, login_url='/login/')
+def request_stats(request):
+    """Per-route latency and query counts over this process's recent requests."""
+    routes = instrumentation.route_stats()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'routes': routes, 'cache': caching.stats()})
+    return render(request, 'request_stats.html', {'routes': routes, 'cache': caching.stats()})
@@ -88,3 +88,18 @@ if (searchInput && suggestions) {
     }
   });
 }
+
+// ── Near-me search ───────────────────────────────────────────
+// Fills the hidden lat/lng fields of the search form from the browser's location.
+const locateBtn = document.getElementById('useLocation');
+if (locateBtn && navigator.geolocation) {
+  locateBtn.addEventListener('click', () => {
+    const form = locateBtn.closest('form');
+    navigator.geolocation.getCurrentPosition(pos => {
+      form.elements.lat.value = pos.coords.latitude.toFixed(5);
+      form.elements.lng.value = pos.coords.longitude.toFixed(5);
+      if (!form.elements.radius.value) form.elements.radius.value = '5';
+      form.submit();
+    });
+  });
+}